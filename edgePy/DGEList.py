@@ -1,17 +1,38 @@
 import re
+import glob
 import json
+from collections import Counter
 from io import StringIO
 from pathlib import Path
-from typing import Generator, Iterable, Mapping, Optional, Union, Dict, List, Hashable, Any
+from typing import (
+    Callable,
+    Generator,
+    Iterable,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+    Dict,
+    List,
+    Hashable,
+    Any,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 # TODO: Implement `mypy` stubs for NumPy imports
 import numpy as np  # type: ignore
-from smart_open import smart_open  # type: ignore
 
 from edgePy.util import getLogger
-from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+from edgePy.name_index import NameIndex
+from edgePy.normalization import quantile_normalize, rank_transform
 
-__all__ = ["DGEList"]
+if TYPE_CHECKING:
+    from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+    from edgePy.group_statistics import GroupStatistics
+    from edgePy.voom import VoomResult
+
+__all__ = ["DGEList", "DGEListBuilder"]
 
 PRIOR_COUNT: float = 0.25
 
@@ -30,7 +51,7 @@ class DGEList(object):
         groups_in_list: a list of groups to which each sample belongs, in the same order as samples *or*
         groups_in_dict: a dictionary of groups, containing sample names.
         to_remove_zeroes: To remove genes with zero counts for all samples.
-        filename: a shortcut to import NPZ (zipped numpy format) files.
+        filename: a shortcut to import NPZ (zipped numpy format) or tiled DGE format files.
         current_type:  None means raw counts, otherwise, if transformed, store a string (eg. 'cpm', 'rpkm', etc)
         current_log: Optional[bool] = False,  If counts has already been log transformed, store True.
     Examples:
@@ -50,6 +71,7 @@ class DGEList(object):
     _old_metatags = np.array(
         ['no_feature', 'ambiguous', 'too_low_aQual', 'not_aligned', 'alignment_not_unique']
     )
+    _old_metatag_set = frozenset(_old_metatags.tolist())
 
     def __init__(
         self,
@@ -66,6 +88,9 @@ class DGEList(object):
     ) -> None:
 
         self.to_remove_zeroes = to_remove_zeroes
+        self._gene_index: Optional[NameIndex] = None
+        self._sample_index: Optional[NameIndex] = None
+        self._cache: Dict[Hashable, Any] = {}
         self.current_data_format = current_transform_type
         self.current_log_status = current_log_status
 
@@ -73,7 +98,12 @@ class DGEList(object):
             if counts or samples or genes or norm_factors or groups_in_list or groups_in_dict:
                 raise Exception("if filename is provided, you can't also provide other parameters")
             self._counts = None
-            self.read_npz_file(filename)
+            from edgePy.dge_file import is_dge_file
+
+            if is_dge_file(filename):
+                self.read_dge_file(filename)
+            else:
+                self.read_npz_file(filename)
 
         else:
             if counts is None:
@@ -92,6 +122,9 @@ class DGEList(object):
             self.genes = genes
             self.norm_factors = norm_factors
 
+            if self.to_remove_zeroes:
+                self._remove_zero_rows()
+
             if groups_in_dict is not None and groups_in_list is not None:
                 self.groups_dict = groups_in_dict
                 self.groups_list = groups_in_list
@@ -125,8 +158,8 @@ class DGEList(object):
             samples=self.samples if samples is None else samples,
             genes=self.genes if genes is None else genes,
             norm_factors=self.norm_factors if norm_factors is None else norm_factors,
-            groups_in_list=self.groups_dict if groups_in_dict is None else groups_in_dict,
-            groups_in_dict=self.groups_list if groups_in_list is None else groups_in_list,
+            groups_in_list=self.groups_list if groups_in_list is None else groups_in_list,
+            groups_in_dict=self.groups_dict if groups_in_dict is None else groups_in_dict,
             to_remove_zeroes=self.to_remove_zeroes
             if to_remove_zeroes is None
             else to_remove_zeroes,
@@ -136,6 +169,202 @@ class DGEList(object):
             current_log_status=self.current_log_status if current_log is None else current_log,
         )
 
+    @classmethod
+    def _from_validated(
+        cls,
+        counts: np.ndarray,
+        gene_index: NameIndex,
+        sample_index: NameIndex,
+        norm_factors: np.ndarray,
+        groups_list: np.ndarray,
+        groups_dict: Dict[Hashable, Any],
+        current_transform_type: Optional[str] = None,
+        current_log_status: Optional[bool] = False,
+    ) -> "DGEList":
+        """Build a DGEList from parts that are already known to be valid, skipping the checks
+        done by the property setters."""
+        dge_list = cls.__new__(cls)
+        dge_list.to_remove_zeroes = False
+        dge_list.current_data_format = current_transform_type
+        dge_list.current_log_status = current_log_status
+        dge_list._cache = {}
+        dge_list._counts = counts
+        dge_list._gene_index = gene_index
+        dge_list._sample_index = sample_index
+        dge_list.norm_factors = norm_factors
+        dge_list.groups_list = groups_list
+        dge_list.groups_dict = groups_dict
+        return dge_list
+
+    @staticmethod
+    def _selection_positions(
+        index: NameIndex, selection: Union[Iterable[str], np.ndarray, slice, None], kind: str
+    ) -> Union[np.ndarray, slice]:
+        """Convert names, a boolean mask or a slice to a slice if possible, or positions."""
+        if selection is None:
+            return slice(None)
+        if isinstance(selection, slice):
+            return selection
+        if isinstance(selection, np.ndarray) and selection.dtype == bool:
+            if len(selection) != len(index):
+                raise ValueError(f"{kind} mask has length {len(selection)}, not {len(index)}")
+            positions = np.flatnonzero(selection)
+        else:
+            if isinstance(selection, str):
+                selection = [selection]
+            positions = index.get_indexer(selection)
+            if (positions < 0).any():
+                missing = [name for name, pos in zip(selection, positions) if pos < 0]
+                raise KeyError(f"{kind}s not found: {missing[:10]}")
+        return DGEList._as_slice(positions)
+
+    @staticmethod
+    def _as_slice(positions: np.ndarray) -> Union[np.ndarray, slice]:
+        """Return an equivalent slice for evenly spaced increasing positions, so that indexing
+        returns a view.  Other positions are returned unchanged."""
+        if len(positions) == 0:
+            return slice(0, 0)
+        if len(positions) == 1:
+            return slice(int(positions[0]), int(positions[0]) + 1)
+        steps = np.diff(positions)
+        step = int(steps[0])
+        if step > 0 and (steps == step).all():
+            return slice(int(positions[0]), int(positions[-1]) + 1, step)
+        return positions
+
+    def select(
+        self,
+        genes: Union[Iterable[str], np.ndarray, slice, None] = None,
+        samples: Union[Iterable[str], np.ndarray, slice, None] = None,
+        groups: Union[Iterable[str], str, None] = None,
+    ) -> "DGEList":
+        """Select a subset of the genes and samples of the DGEList.
+
+        When the selected rows and columns are evenly spaced (eg. a contiguous block, or every
+        other sample), the counts, names and norm factors of the new DGEList are views sharing
+        the buffers of this one.  Otherwise they are gathered with a single indexing operation.
+        The result is not re-validated, as it's a subset of a valid DGEList.
+
+        Args:
+            genes: gene names, in the order wanted, a boolean mask, or a slice.  All if None.
+            samples: sample names, in the order wanted, a boolean mask, or a slice.  All if None.
+            groups: keep only the samples belonging to these groups.
+
+        Returns:
+            DGEList: the selected genes and samples.
+
+        Raises:
+            KeyError: if a gene or sample name is not in the DGEList.
+
+        Examples:
+
+            >>> dge_list = DGEList(
+            ...     counts=np.arange(12).reshape(4, 3),
+            ...     samples=['A1', 'A2', 'B1'],
+            ...     genes=['G1', 'G2', 'G3', 'G4'],
+            ...     groups_in_list=['A', 'A', 'B'],
+            ... )
+            >>> dge_list.select(genes=['G2', 'G3'], groups='A').counts
+            array([[3, 4],
+                   [6, 7]])
+
+        """
+        rows = self._selection_positions(self.gene_index, genes, "gene")
+        columns = self._selection_positions(self.sample_index, samples, "sample")
+
+        groups_list = np.asarray(self.groups_list)
+        if groups is not None:
+            if isinstance(groups, str):
+                groups = [groups]
+            in_groups = np.isin(groups_list, list(groups))
+            columns = self._as_slice(np.arange(len(groups_list))[columns][in_groups[columns]])
+
+        if isinstance(rows, slice) or isinstance(columns, slice):
+            counts = self.counts[rows, columns]
+        else:
+            counts = self.counts[np.ix_(rows, columns)]
+
+        sample_index = self.sample_index.take(columns)
+        groups_list = groups_list[columns]
+        return self._from_validated(
+            counts=counts,
+            gene_index=self.gene_index.take(rows),
+            sample_index=sample_index,
+            norm_factors=np.asarray(self.norm_factors)[columns],
+            groups_list=groups_list,
+            groups_dict=self._sample_group_dict(groups_list, sample_index.values),
+            current_transform_type=self.current_data_format,
+            current_log_status=self.current_log_status,
+        )
+
+    @classmethod
+    def concat(cls, dge_lists: Sequence["DGEList"], join: str = "outer") -> "DGEList":
+        """Combine the samples of several DGELists into one, aligning them on their genes.
+
+        The combined counts are allocated once, and each DGEList is copied into its columns.
+        Sample names must be unique across the DGELists, and all of them must have the same
+        transform and log status.
+
+        Args:
+            dge_lists: the DGELists to combine, in the order their samples should appear.
+            join: 'outer' to keep every gene, with zero counts for samples where a gene is
+                missing, or 'inner' to keep only the genes present in all of the DGELists.
+
+        Returns:
+            DGEList: the combined samples, with their groups and norm factors.
+
+        """
+        if not dge_lists:
+            raise ValueError("At least one DGEList is required.")
+        first = dge_lists[0]
+        for dge_list in dge_lists[1:]:
+            if (dge_list.current_data_format, dge_list.current_log_status) != (
+                first.current_data_format,
+                first.current_log_status,
+            ):
+                raise ValueError("DGELists with different transforms cannot be combined.")
+
+        gene_indexes = [dge_list.gene_index for dge_list in dge_lists]
+        if join == "outer":
+            gene_index = gene_indexes[0].union(*gene_indexes[1:])
+        elif join == "inner":
+            gene_index = gene_indexes[0].intersection(*gene_indexes[1:])
+        else:
+            raise ValueError(f"join must be 'outer' or 'inner', not {join}")
+
+        sample_index = NameIndex(
+            name for dge_list in dge_lists for name in dge_list.sample_index.values.tolist()
+        )
+        if not sample_index.is_unique:
+            raise ValueError("Sample names must be unique across the DGELists.")
+
+        dtype = np.result_type(*[dge_list.counts.dtype for dge_list in dge_lists])
+        counts = np.zeros((len(gene_index), len(sample_index)), dtype=dtype)
+        start = 0
+        for dge_list in dge_lists:
+            end = start + len(dge_list.sample_index)
+            if dge_list.gene_index == gene_index:
+                counts[:, start:end] = dge_list.counts
+            elif join == "outer":
+                counts[gene_index.get_indexer(dge_list.genes), start:end] = dge_list.counts
+            else:
+                counts[:, start:end] = dge_list.counts[dge_list.gene_index.get_indexer(gene_index)]
+            start = end
+
+        groups_list = np.concatenate([np.asarray(dge_list.groups_list) for dge_list in dge_lists])
+        return cls._from_validated(
+            counts=counts,
+            gene_index=gene_index,
+            sample_index=sample_index,
+            norm_factors=np.concatenate(
+                [np.asarray(dge_list.norm_factors) for dge_list in dge_lists]
+            ),
+            groups_list=groups_list,
+            groups_dict=cls._sample_group_dict(groups_list, sample_index.values),
+            current_transform_type=first.current_data_format,
+            current_log_status=first.current_log_status,
+        )
+
     @staticmethod
     def _sample_group_dict(groups_list: List[str], samples: np.array):
         """
@@ -220,6 +449,7 @@ class DGEList(object):
         """
         if counts is None:
             self._counts = None
+            self._cache.clear()
             return
 
         if not isinstance(counts, np.ndarray):
@@ -228,15 +458,14 @@ class DGEList(object):
         if hasattr(self, "_counts"):
             # do checks for things here.  You shouldn't modify counts
             # if it has already been set.  Create a new obj.
-            if hasattr(self, "_samples") and self._samples is not None:
+            if self._sample_index is not None and self._gene_index is not None:
                 gene_count, sample_count = counts.shape
                 log.info(f"sample count: {sample_count}, gene count: {gene_count}")
                 log.info(
-                    f"samples shape {self.samples.shape[0]}, gene shape {self.genes.shape[0]}"
+                    f"samples shape {len(self._sample_index)}, gene shape {len(self._gene_index)}"
                 )
-                log.info(self.genes)
 
-                if sample_count != self.samples.shape[0] or gene_count != self.genes.shape[0]:
+                if sample_count != len(self._sample_index) or gene_count != len(self._gene_index):
                     raise ValueError(
                         "Attempting to substitute counts data "
                         "into DGEList object with different "
@@ -248,19 +477,26 @@ class DGEList(object):
         if not self.current_log_status and (counts < 0).any():
             raise ValueError("Counts matrix cannot contain negative values.")
 
-        if self.to_remove_zeroes:
-            # this is not working.  Does not remove rows with only zeros.
-            counts = counts[np.all(counts != 0, axis=1)]
-
         self._counts = counts
+        self._cache.clear()
+
+    def _remove_zero_rows(self) -> None:
+        """Drop the genes with a count of zero in every sample, from both counts and genes."""
+        keep = self._counts.any(axis=1)
+        if not keep.all():
+            log.info(f"Removing {len(keep) - keep.sum():,} genes with no counts.")
+            self._counts = self._counts[keep]
+            self._cache.clear()
+            if self._gene_index is not None:
+                self._gene_index = self._gene_index.take(keep)
 
     @property
     def samples(self) -> np.array:
         """Array of sample names."""
-        return self._samples
+        return self._sample_index.values if self._sample_index is not None else None
 
     @samples.setter
-    def samples(self, samples: Optional[np.ndarray]) -> None:
+    def samples(self, samples: Optional[Union[np.ndarray, NameIndex]]) -> None:
         """Validate setting ``DGEList.samples`` for the illegal conditions:
 
             * Must be the same length as the columns in counts`
@@ -277,25 +513,76 @@ class DGEList(object):
                     f" self.counts.shape = {self.counts.shape}"
                 )
 
-            samples = np.array(list(self._format_fields(samples)))
-        self._samples = samples
+            if not isinstance(samples, NameIndex):
+                samples = NameIndex(self._format_fields(samples))
+        self._sample_index = samples
+
+    @property
+    def sample_index(self) -> NameIndex:
+        """The samples, as an index of name to column number."""
+        if self._sample_index is None:
+            raise ValueError("The DGEList has no samples.")
+        return self._sample_index
 
     @property
     def genes(self) -> np.array:
         """Array of gene names."""
-        return self._genes
+        return self._gene_index.values if self._gene_index is not None else None
 
     @genes.setter
-    def genes(self, genes: Optional[np.ndarray]) -> None:
+    def genes(self, genes: Optional[Union[np.ndarray, NameIndex]]) -> None:
         # TODO: Validate genes here
         # - Genes same length as nrow(self.counts) if defined
-        if genes is not None:
-            genes = np.array(list(self._format_fields(genes)))
-            # Creates boolean mask and filters out metatag rows from samples and counts
-            metatag_mask = ~(np.isin(genes, self._old_metatags) | np.char.startswith(genes, '__'))
-            genes = genes[metatag_mask].copy()
-            self._counts = self.counts[metatag_mask].copy()
-        self._genes = genes
+        # A NameIndex is taken as already cleaned, eg. when it comes from another DGEList.
+        if genes is not None and not isinstance(genes, NameIndex):
+            genes = NameIndex(self._format_fields(genes))
+            # Creates boolean mask and filters out metatag rows from genes and counts
+            metatag_mask = np.fromiter(
+                (not (gene in self._old_metatag_set or gene.startswith('__')) for gene in genes),
+                dtype=bool,
+                count=len(genes),
+            )
+            if not metatag_mask.all():
+                genes = genes.take(metatag_mask)
+                self._counts = self.counts[metatag_mask]
+                self._cache.clear()
+        self._gene_index = genes
+
+    @property
+    def gene_index(self) -> NameIndex:
+        """The genes, as an index of name to row number."""
+        if self._gene_index is None:
+            raise ValueError("The DGEList has no genes.")
+        return self._gene_index
+
+    @property
+    def norm_factors(self) -> np.ndarray:
+        """The normalization factor of each sample, scaling its library size."""
+        return self._norm_factors
+
+    @norm_factors.setter
+    def norm_factors(self, norm_factors: np.ndarray) -> None:
+        self._norm_factors = norm_factors
+        self._cache.pop("effective_library_size", None)
+
+    def _cached(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Get a value derived from the counts, computing it on first use.
+
+        The cache is cleared whenever counts are assigned, so values stay in step with them.
+        Arrays are cached read-only, as they are shared by every caller.  Changing the counts
+        in place bypasses this - assign the changed counts back to clear the cache.
+
+        Args:
+            key: identifies the value.
+            compute: computes the value.
+
+        """
+        if key not in self._cache:
+            value = compute()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self._cache[key] = value
+        return self._cache[key]
 
     @property
     def library_size(self) -> np.array:
@@ -305,7 +592,199 @@ class DGEList(object):
             library_size: The size of the library.
 
         """
-        return np.sum(self.counts, 0)
+        return self._cached("library_size", lambda: np.sum(self.counts, 0))
+
+    @property
+    def effective_library_size(self) -> np.ndarray:
+        """The library size of each sample, scaled by its norm factor."""
+        return self._cached(
+            "effective_library_size", lambda: self.library_size * np.asarray(self.norm_factors)
+        )
+
+    @property
+    def group_sums(self) -> Dict[Hashable, np.ndarray]:
+        """The total count of each gene over the samples of each group.
+
+        Returns:
+            the sums, by group name, in order of first appearance of the groups.
+
+        """
+        groups_list = self.groups_list
+        cached = self._cache.get("group_sums")
+        # Also recomputed if the groups are reassigned.
+        if cached is None or cached[0] is not groups_list:
+            groups = np.asarray(groups_list)
+            sums = {}
+            for group in dict.fromkeys(groups.tolist()):
+                sums[group] = self.counts[:, groups == group].sum(axis=1)
+                sums[group].flags.writeable = False
+            cached = self._cache["group_sums"] = (groups_list, sums)
+        return cached[1]
+
+    def log_cpm(self, prior_count: float = PRIOR_COUNT) -> np.ndarray:
+        """The log counts per million, as given by ``cpm(transform_to_log=True)``, cached for
+        each prior count.
+
+        Args:
+            prior_count: the value zero CPMs are replaced with before taking logs.
+
+        Returns:
+            the log CPMs, genes by samples.  Read-only.
+
+        """
+        return self._cached(
+            ("log_cpm", prior_count),
+            lambda: self.log_transform(1e6 * self.counts / self.library_size, prior_count),
+        )
+
+    @property
+    def group_statistics(self) -> "GroupStatistics":
+        """The per-group size, mean and variance of each gene's counts, as a GroupStatistics.
+        Computed on first use, and carried over, updated, by append_samples and remove_samples.
+        """
+        from edgePy.group_statistics import GroupStatistics
+
+        return self._cached("group_statistics", lambda: GroupStatistics.from_dge_list(self))
+
+    @property
+    def _is_raw(self) -> bool:
+        """Whether the counts are untransformed."""
+        return not (self.current_data_format or self.current_log_status)
+
+    def append_samples(
+        self,
+        counts: np.ndarray,
+        samples: Sequence[str],
+        groups: Sequence[Hashable],
+        norm_factors: Optional[Sequence[float]] = None,
+    ) -> "DGEList":
+        """Add samples, with counts for the same genes in the same order.
+
+        If group_statistics has been computed on raw counts, the new DGEList gets a copy updated
+        with just the new samples, rather than recomputing it from all of them.  Once the counts
+        have been transformed, it isn't carried over.
+
+        Args:
+            counts: genes by samples.
+            samples: the new sample names.
+            groups: the group of each new sample.
+            norm_factors: the normalization factor of each new sample, 1 if not given.
+
+        Returns:
+            DGEList: the samples of this DGEList followed by the new ones.
+
+        Raises:
+            ValueError: if the counts don't fit, or a sample name is already used.
+
+        """
+        counts = np.asarray(counts)
+        if counts.ndim != 2 or counts.shape != (len(self.genes), len(samples)):
+            raise ValueError(
+                f"counts must have shape ({len(self.genes)}, {len(samples)}), not {counts.shape}"
+            )
+        if len(groups) != len(samples):
+            raise ValueError("There must be one group per sample.")
+        if np.isnan(counts).any():
+            raise ValueError("Counts matrix must have only real values.")
+        if not self.current_log_status and (counts < 0).any():
+            raise ValueError("Counts matrix cannot contain negative values.")
+        sample_index = NameIndex(np.concatenate([self.samples, list(samples)]).astype(str))
+        if not sample_index.is_unique:
+            raise ValueError("Sample names must be unique.")
+
+        groups_list = np.concatenate([np.asarray(self.groups_list), list(groups)])
+        new_norm_factors = np.ones(len(samples)) if norm_factors is None else norm_factors
+        dge_list = self._from_validated(
+            counts=np.concatenate([self.counts, counts], axis=1),
+            gene_index=self.gene_index,
+            sample_index=sample_index,
+            norm_factors=np.concatenate([np.asarray(self.norm_factors), new_norm_factors]),
+            groups_list=groups_list,
+            groups_dict=self._sample_group_dict(groups_list, sample_index.values),
+            current_transform_type=self.current_data_format,
+            current_log_status=self.current_log_status,
+        )
+        if "group_statistics" in self._cache and self._is_raw:
+            statistics = self._cache["group_statistics"].copy()
+            statistics.add(counts, list(samples), list(groups))
+            dge_list._cache["group_statistics"] = statistics
+        return dge_list
+
+    def remove_samples(self, samples: Sequence[str]) -> "DGEList":
+        """Drop some samples.  If group_statistics has been computed on raw counts, the new
+        DGEList gets a copy with just the removed samples taken out.
+
+        Args:
+            samples: the sample names.
+
+        Returns:
+            DGEList: the other samples.
+
+        Raises:
+            KeyError: if a sample name is not in the DGEList.
+
+        """
+        if isinstance(samples, str):
+            samples = [samples]
+        positions = self._selection_positions(self.sample_index, samples, "sample")
+        keep = np.ones(len(self.samples), dtype=bool)
+        keep[positions] = False
+        dge_list = self.select(samples=keep)
+        if "group_statistics" in self._cache and self._is_raw:
+            statistics = self._cache["group_statistics"].copy()
+            statistics.remove(self.counts[:, positions], list(samples))
+            dge_list._cache["group_statistics"] = statistics
+        return dge_list
+
+    def filter_by_expr(
+        self,
+        min_count: float = 10,
+        min_total_count: float = 15,
+        min_group_size: Optional[int] = None,
+        large_n: int = 10,
+        min_prop: float = 0.7,
+    ) -> "DGEList":
+        """Keep the genes with enough counts to be worth testing, following edgeR's filterByExpr.
+
+        A gene is kept if it has a CPM of at least ``min_count / median(library size) * 1e6`` in
+        at least ``min_group_size`` samples, and at least ``min_total_count`` reads over all
+        samples.  Library sizes are scaled by the norm factors.  By default, min_group_size is
+        the size of the smallest group, and for groups bigger than large_n only min_prop of the
+        extra samples are required.
+
+        The CPM cutoff is converted to a count cutoff for each sample, so the counts are only
+        compared once and no CPM matrix is made.
+
+        Args:
+            min_count: the minimum number of reads, for a sample of median library size.
+            min_total_count: the minimum number of reads over all samples.
+            min_group_size: the number of samples that must pass the CPM cutoff.
+            large_n: the group size above which only min_prop of the extra samples are needed.
+            min_prop: the proportion of samples above large_n that must pass the CPM cutoff.
+
+        Returns:
+            DGEList: the genes that pass both cutoffs.
+
+        """
+        if self.current_log_status:
+            raise ValueError("filter_by_expr requires raw (non-log) counts.")
+
+        if min_group_size is None:
+            _, group_sizes = np.unique(np.asarray(self.groups_list), return_counts=True)
+            min_group_size = group_sizes.min()
+            if min_group_size > large_n:
+                min_group_size = large_n + (min_group_size - large_n) * min_prop
+
+        tolerance = 1e-14
+        lib_size = self.effective_library_size
+        cpm_cutoff = min_count / np.median(lib_size) * 1e6
+        count_cutoff = cpm_cutoff * lib_size / 1e6
+
+        keep = (self.counts >= count_cutoff).sum(axis=1) >= min_group_size - tolerance
+        keep &= self.counts.sum(axis=1) >= min_total_count - tolerance
+        log.info(f"filter_by_expr: keeping {keep.sum():,} of {len(keep):,} genes.")
+
+        return self.select(genes=keep)
 
     def log_transform(self, counts, prior_count):
         """Compute the log of the counts"""
@@ -314,17 +793,19 @@ class DGEList(object):
 
     def cpm(self, transform_to_log: bool = False, prior_count: float = PRIOR_COUNT) -> "DGEList":
         """Normalize the DGEList to read counts per million."""
-        counts = 1e6 * self.counts / np.sum(self.counts, axis=0)
         current_log = self.current_log_status
         if transform_to_log:
-            counts = self.log_transform(counts, prior_count)
+            # A copy, so the new DGEList owns writable counts and the cache stays read-only.
+            counts = self.log_cpm(prior_count).copy()
             current_log = True
+        else:
+            counts = 1e6 * self.counts / self.library_size
 
         return self.copy(counts=counts, current_log=current_log)
 
     def rpkm(
         self,
-        gene_data: CanonicalDataStore,
+        gene_data: "CanonicalDataStore",
         transform_to_log: bool = False,
         prior_count: float = PRIOR_COUNT,
     ) -> "DGEList":
@@ -341,12 +822,13 @@ class DGEList(object):
         if self.current_log_status:
             self.counts = np.exp(self.counts)
             current_log = False
-        col_sum = np.sum(self.counts, axis=0)
+        col_sum = self.library_size
 
         gene_len_ordered, gene_mask = self.get_gene_mask_and_lengths(gene_data)
+        gene_mask = np.asarray(gene_mask, dtype=bool)
 
-        genes = self.genes[gene_mask].copy()
-        counts = self.counts[gene_mask].copy()
+        genes = self.gene_index.take(gene_mask)
+        counts = self.counts[gene_mask]
 
         counts = (counts.T / gene_len_ordered).T
         counts = counts / (col_sum / 1e6)
@@ -368,7 +850,7 @@ class DGEList(object):
         gene_len_ordered = []
         gene_mask = []
         gene_ensg = []
-        for gene in self.genes:
+        for gene in self.gene_index:
             if gene.startswith("ENSG"):
                 gene_name = gene
                 gene_ensg.append(gene_name)
@@ -446,10 +928,42 @@ class DGEList(object):
 
         return self.copy(counts=counts, current_log=current_log)
 
+    def quantile_normalize(self, chunk_size: Optional[int] = None) -> "DGEList":
+        """Quantile normalize the samples, giving every sample the same distribution of values.
+        Tied values within a sample stay tied.  See edgePy.normalization.quantile_normalize.
+
+        Args:
+            chunk_size: if given, normalize this many samples at a time, for very wide data.
+
+        """
+        counts = quantile_normalize(self.counts, chunk_size=chunk_size)
+        return self.copy(
+            counts=counts, current_type="quantile", current_log=self.current_log_status
+        )
+
+    def rank_transform(self) -> "DGEList":
+        """Replace the values of each sample with their ranks within it, from 1, with tied values
+        given their average rank."""
+        counts = rank_transform(self.counts)
+        return self.copy(counts=counts, current_type="rank", current_log=False)
+
+    def voom(self, design: Optional[np.ndarray] = None, span: float = 0.5) -> "VoomResult":
+        """Compute log-CPM and precision weights for linear modelling, as limma's voom.  See
+        edgePy.voom.voom.
+
+        Args:
+            design: the design matrix, samples by coefficients.  One column per group if None.
+            span: the fraction of genes used in each local fit of the mean-variance trend.
+
+        """
+        from edgePy.voom import voom
+
+        return voom(self, design=design, span=span)
+
     def __repr__(self) -> str:
         """Give a pretty non-executeable representation of this object."""
-        num_samples = len(self._samples) if self._samples is not None else 0
-        num_genes = len(self._genes) if self._genes is not None else 0
+        num_samples = len(self._sample_index) if self._sample_index is not None else 0
+        num_genes = len(self._gene_index) if self._gene_index is not None else 0
 
         return (
             f"{self.__class__.__name__}("
@@ -466,11 +980,13 @@ class DGEList(object):
 
         np.savez_compressed(
             filename,
-            samples=self.samples,
-            genes=self.genes,
+            samples=self.samples.astype(str),
+            genes=self.genes.astype(str),
             norm_factors=self.norm_factors,
             counts=self.counts,
             groups_list=self.groups_list,
+            current_data_format=np.array(self.current_data_format or ""),
+            current_log_status=np.array(bool(self.current_log_status)),
         )
 
     def read_npz_file(self, filename: str) -> None:
@@ -484,6 +1000,10 @@ class DGEList(object):
         log.info(f"Importing data from .dge file ({filename})...")
 
         npzfile = np.load(filename)
+        # Files written before the transform state was saved hold raw counts.
+        if "current_data_format" in npzfile.files:
+            self.current_data_format = str(npzfile["current_data_format"]) or None
+            self.current_log_status = bool(npzfile["current_log_status"])
         self.counts = npzfile["counts"]
         self.genes = npzfile["genes"]
         self.samples = npzfile["samples"]
@@ -492,6 +1012,42 @@ class DGEList(object):
 
         self.groups_dict = self._sample_group_dict(self.groups_list, self.samples)
 
+    def write_dge_file(
+        self, filename: str, block_rows: int = 1024, block_columns: int = 256
+    ) -> None:
+        """Write the DGEList in the tiled DGE format, where subsets of the genes and samples can
+        be read without reading the whole file.  See edgePy.dge_file.
+
+        Args:
+            filename: the output file.
+            block_rows: the number of genes in each compressed tile.
+            block_columns: the number of samples in each compressed tile.
+
+        """
+        from edgePy.dge_file import write_dge_file
+
+        write_dge_file(self, filename, block_rows=block_rows, block_columns=block_columns)
+
+    def read_dge_file(self, filename: str) -> None:
+        """Import a file in the tiled DGE format.  To read a subset of the genes or samples, use
+        edgePy.dge_file.read_dge_file.
+
+        Args:
+            filename: the name of the file to read from.
+
+        """
+        from edgePy.dge_file import read_dge_file
+
+        dge_list = read_dge_file(filename)
+        self.current_data_format = dge_list.current_data_format
+        self.current_log_status = dge_list.current_log_status
+        self.counts = dge_list.counts
+        self.genes = dge_list.gene_index
+        self.samples = dge_list.sample_index
+        self.norm_factors = dge_list.norm_factors
+        self.groups_list = dge_list.groups_list.tolist()
+        self.groups_dict = dge_list.groups_dict
+
     @classmethod
     def create_DGEList(
         cls,
@@ -505,18 +1061,22 @@ class DGEList(object):
             Use this to create the DGE object for future work."""
 
         log.info("Creating DGE list object...")
-        temp_data_store = np.zeros(shape=(len(gene_list), len(sample_list)))
-
-        for idx_s, sample in enumerate(sample_list):
-            for idx_g, gene in enumerate(gene_list):
-                if sample in data_set and gene in data_set[sample]:
-                    if data_set[sample][gene]:
-                        temp_data_store[idx_g, idx_s] = data_set[sample][gene]
-
+        gene_index = NameIndex(gene_list)
+        sample_index = NameIndex(sample_list)
+        temp_data_store = np.zeros(shape=(len(gene_index), len(sample_index)))
+
+        gene_positions = gene_index.positions
+        for sample, idx_s in sample_index.positions.items():
+            for gene, value in data_set.get(sample, {}).items():
+                idx_g = gene_positions.get(gene)
+                if idx_g is not None and value:
+                    temp_data_store[idx_g, idx_s] = value
+
+        # The raw names are passed on, so the setters clean them and drop the metatag rows.
         return cls(
             counts=temp_data_store,
-            genes=np.array(gene_list),
-            samples=np.array(sample_list),
+            genes=gene_index.values,
+            samples=sample_index.values,
             groups_in_list=sample_to_category if sample_to_category else None,
             groups_in_dict=category_to_samples if category_to_samples else None,
             to_remove_zeroes=False,
@@ -542,11 +1102,106 @@ class DGEList(object):
             DGEList: Container for storing read counts for samples.
 
         """
+        from smart_open import smart_open  # type: ignore
+
         with smart_open(data_file, 'r') as data_handle, smart_open(
             group_file, 'r'
         ) as group_handle:
             return cls.create_DGEList_handle(data_handle, group_handle, **kwargs)
 
+    @classmethod
+    def create_DGEList_htseq_files(
+        cls,
+        count_files: Union[str, Path, Iterable[Union[str, Path]]],
+        group_file: Optional[Path] = None,
+        groups_in_dict: Optional[Dict[Hashable, List[str]]] = None,
+        processes: Optional[int] = None,
+    ) -> "DGEList":
+        """Create a DGEList from one HTSeq-count output file per sample.
+
+        The files are parsed in parallel worker processes, and the counts are assembled into a
+        single preallocated matrix.  If every file lists the same genes in the same order, the
+        columns are copied straight in.  Otherwise, the genes of all files are merged and sorted,
+        and samples missing a gene get a count of zero.  HTSeq metatag rows (``__no_feature``,
+        etc.) are dropped.
+
+        Sample names are taken from the file names, up to the first '.', so
+        ``A_1.counts.txt.gz`` is sample ``A_1``.  Files that would give the same sample name
+        (``A.rep1.txt`` and ``A.rep2.txt``) are rejected.
+
+        Args:
+            count_files: a directory of count files, a glob pattern, or a list of files.
+            group_file: The JSON file defining the groups, *or*
+            groups_in_dict: a dictionary of groups, containing sample names.
+            processes: the number of worker processes, the number of CPUs if None.  Use 1 to
+                read the files in this process.
+
+        Returns:
+            DGEList: Container for storing read counts for samples.
+
+        Raises:
+            ValueError: if no count files are found, or two files give the same sample name.
+
+        """
+        if isinstance(count_files, (str, Path)):
+            path = Path(count_files)
+            if path.is_dir():
+                paths = sorted(str(child) for child in path.iterdir() if child.is_file())
+            else:
+                paths = sorted(glob.glob(str(count_files)))
+        else:
+            paths = [str(count_file) for count_file in count_files]
+        if not paths:
+            raise ValueError(f"No count files found in {count_files}")
+
+        samples = [Path(path).name.split(".")[0] for path in paths]
+        duplicated = sorted(sample for sample, count in Counter(samples).items() if count > 1)
+        if duplicated:
+            raise ValueError(f"Several count files give the same sample names: {duplicated}")
+
+        if group_file is not None:
+            from smart_open import smart_open  # type: ignore
+
+            with smart_open(group_file, 'r') as group_handle:
+                groups_in_dict = json.load(group_handle)
+        if groups_in_dict is None:
+            raise ValueError("Either group_file or groups_in_dict must be provided.")
+
+        log.info(f"Reading {len(paths)} HTSeq count files...")
+        if processes == 1:
+            parsed = [_read_htseq_file(path) for path in paths]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                parsed = list(executor.map(_read_htseq_file, paths))
+
+        first_genes = parsed[0][0]
+        same_order = all(genes == first_genes for genes, _ in parsed[1:])
+        if same_order:
+            gene_index = NameIndex(first_genes)
+        else:
+            log.info("Gene order differs between count files - merging sorted gene lists.")
+            gene_index = NameIndex(sorted(set().union(*(genes for genes, _ in parsed))))
+
+        counts = np.zeros(
+            (len(gene_index), len(paths)),
+            dtype=np.result_type(*[values.dtype for _, values in parsed]),
+        )
+        for column, (genes, values) in enumerate(parsed):
+            if same_order:
+                counts[:, column] = values
+            else:
+                counts[gene_index.get_indexer(genes), column] = values
+
+        return cls(
+            counts=counts,
+            genes=gene_index.values,
+            samples=samples,
+            groups_in_dict=groups_in_dict,
+            to_remove_zeroes=False,
+        )
+
     @classmethod
     def create_DGEList_handle(
         cls, data_handle: StringIO, group_handle: StringIO, **kwargs: Mapping
@@ -592,3 +1247,188 @@ class DGEList(object):
             groups_in_dict=group,
             to_remove_zeroes=False,
         )
+
+
+def _read_htseq_file(path: str) -> Tuple[List[str], np.ndarray]:
+    """Read the genes and counts of one HTSeq-count output file, without the metatag rows.
+
+    This is module level, so that it can be run in worker processes.
+
+    Args:
+        path: the count file, which may be compressed.
+
+    """
+    from smart_open import smart_open  # type: ignore
+
+    genes: List[str] = []
+    counts: List[int] = []
+    with smart_open(path, 'r') as data:
+        for line in data:
+            fields = line.split()
+            if not fields:
+                continue
+            gene = fields[0]
+            if gene.startswith('__') or gene in DGEList._old_metatag_set:
+                continue
+            genes.append(gene)
+            counts.append(int(fields[1]))
+    return genes, np.array(counts, dtype=np.int64)
+
+
+class DGEListBuilder(object):
+    """Collects samples one (or a few) at a time, for sequencing data that arrives in batches,
+    and builds a DGEList from them.
+
+    Counts are kept in a column-major buffer whose capacity doubles when full, so adding a sample
+    costs amortized O(genes), and build() returns a view of the filled part without copying.
+    Columns that have been built are never written again, so adding samples after build() does
+    not change DGELists built earlier.
+
+    Args:
+        genes: the gene names, in the order of the counts rows.
+        dtype: the type of the counts.
+        capacity: the number of samples to allocate space for initially.
+
+    Examples:
+
+        >>> builder = DGEListBuilder(['G1', 'G2'])
+        >>> builder.add_sample('S1', [10, 0], group='A')
+        >>> builder.add_sample('S2', {'G2': 4, 'G9': 1}, group='B')
+        >>> builder.build().counts
+        array([[10.,  0.],
+               [ 0.,  4.]])
+
+    """
+
+    def __init__(
+        self, genes: Union[Iterable[str], NameIndex], dtype: Any = np.float64, capacity: int = 16
+    ) -> None:
+        self.gene_index = genes if isinstance(genes, NameIndex) else NameIndex(genes)
+        self._counts = np.zeros((len(self.gene_index), max(capacity, 1)), dtype=dtype, order="F")
+        self._samples: List[str] = []
+        self._groups: List[Hashable] = []
+        self._norm_factors: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def _reserve(self, count: int) -> None:
+        needed = len(self._samples) + count
+        capacity = self._counts.shape[1]
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            counts = np.zeros(
+                (self._counts.shape[0], capacity), dtype=self._counts.dtype, order="F"
+            )
+            counts[:, : len(self._samples)] = self._counts[:, : len(self._samples)]
+            self._counts = counts
+
+    def add_sample(
+        self,
+        name: str,
+        counts: Union[np.ndarray, Sequence[float], Mapping[str, float]],
+        group: Hashable,
+        norm_factor: float = 1.0,
+    ) -> None:
+        """Add one sample.
+
+        Args:
+            name: the sample name.
+            counts: the counts in gene order, or a mapping of gene name to count.  Genes missing
+                from the mapping get a count of zero, and genes unknown to the builder are
+                ignored.
+            group: the group of the sample.
+            norm_factor: the normalization factor of the sample.
+
+        """
+        if isinstance(counts, Mapping):
+            positions = self.gene_index.get_indexer(counts.keys())
+            values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            column = np.zeros(len(self.gene_index), dtype=self._counts.dtype)
+            known = positions >= 0
+            column[positions[known]] = values[known]
+        else:
+            column = np.asarray(counts)
+        self.add_samples(column[:, np.newaxis], [name], [group], [norm_factor])
+
+    def add_samples(
+        self,
+        counts: np.ndarray,
+        samples: Sequence[str],
+        groups: Sequence[Hashable],
+        norm_factors: Optional[Sequence[float]] = None,
+    ) -> None:
+        """Add a batch of samples.
+
+        Args:
+            counts: genes by samples, with rows in the builder's gene order.
+            samples: the sample names.
+            groups: the group of each sample.
+            norm_factors: the normalization factor of each sample, 1 if not given.
+
+        """
+        counts = np.asarray(counts)
+        if counts.ndim != 2 or counts.shape != (len(self.gene_index), len(samples)):
+            raise ValueError(
+                f"counts must have shape ({len(self.gene_index)}, {len(samples)}), "
+                f"not {counts.shape}"
+            )
+        if len(groups) != len(samples):
+            raise ValueError("There must be one group per sample.")
+        if np.isnan(counts).any():
+            raise ValueError("Counts matrix must have only real values.")
+        if (counts < 0).any():
+            raise ValueError("Counts matrix cannot contain negative values.")
+
+        self._reserve(len(samples))
+        start = len(self._samples)
+        self._counts[:, start : start + len(samples)] = counts
+        self._samples.extend(samples)
+        self._groups.extend(groups)
+        self._norm_factors.extend(
+            [1.0] * len(samples) if norm_factors is None else list(norm_factors)
+        )
+
+    def add_dge_list(self, dge_list: DGEList) -> None:
+        """Add all of the samples of a DGEList of raw counts, aligning its genes with the
+        builder's.  Genes the builder doesn't know are dropped.
+
+        Args:
+            dge_list: the DGEList to take samples from.
+
+        """
+        if dge_list.current_data_format or dge_list.current_log_status:
+            raise ValueError("Only DGELists of raw counts can be added.")
+        if dge_list.gene_index == self.gene_index:
+            counts = dge_list.counts
+        else:
+            positions = dge_list.gene_index.get_indexer(self.gene_index.values)
+            counts = np.zeros(
+                (len(self.gene_index), len(dge_list.samples)), dtype=dge_list.counts.dtype
+            )
+            known = positions >= 0
+            counts[known] = dge_list.counts[positions[known]]
+        self.add_samples(
+            counts, dge_list.samples.tolist(), list(dge_list.groups_list), dge_list.norm_factors
+        )
+
+    def build(self) -> DGEList:
+        """Create a DGEList from the samples added so far.
+
+        Raises:
+            ValueError: if sample names are repeated.
+
+        """
+        sample_index = NameIndex(self._samples)
+        if not sample_index.is_unique:
+            raise ValueError("Sample names must be unique.")
+        groups_list = np.array(self._groups)
+        return DGEList._from_validated(
+            counts=self._counts[:, : len(self._samples)],
+            gene_index=self.gene_index,
+            sample_index=sample_index,
+            norm_factors=np.array(self._norm_factors),
+            groups_list=groups_list,
+            groups_dict=DGEList._sample_group_dict(groups_list, sample_index.values),
+        )
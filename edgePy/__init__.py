@@ -1,5 +1,54 @@
-from edgePy import data_import
+"""
+edgePy - differential expression analysis of RNA-Seq count data.
 
-from edgePy.DGEList import DGEList
+The submodules, and the names they export here, are imported the first time they are used, so
+``import edgePy`` doesn't load numpy, smart_open or the annotation readers until they're needed.
+"""
+import sys
+from importlib import import_module
+from types import ModuleType
+from typing import Any, List
 
 from edgePy.util import getLogger
+
+# Names exported by the package, and the module each one is imported from.
+_LAZY_ATTRIBUTES = {
+    "DGEList": "edgePy.DGEList",
+    "DGEListBuilder": "edgePy.DGEList",
+}
+
+# Subpackages, imported on first access as attributes of the package.
+_LAZY_SUBMODULES = ("data_import",)
+
+__all__ = ["DGEList", "DGEListBuilder", "data_import", "getLogger"]
+
+
+class _Package(ModuleType):
+    """The package module, importing the lazy names on first access.
+
+    The lookups are methods of the module's class rather than a module level __getattr__
+    (PEP 562), which needs Python 3.7.  It also keeps edgePy.DGEList the class rather than the
+    submodule of the same name, which the import system would otherwise set in its place once
+    it's imported.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        if name in _LAZY_ATTRIBUTES:
+            value = getattr(import_module(_LAZY_ATTRIBUTES[name]), name)
+        elif name in _LAZY_SUBMODULES:
+            value = import_module(f"{__name__}.{name}")
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+        self.__dict__[name] = value
+        return value
+
+    def __dir__(self) -> List[str]:
+        return sorted(set(self.__dict__) | set(__all__))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name in _LAZY_ATTRIBUTES and isinstance(value, ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,344 @@
+""" Run many analyses from one manifest, sharing loaded data and connections between them """
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from edgePy.DGEList import DGEList
+from edgePy.contrasts import ContrastEngine
+from edgePy.results_writer import open_results_writer
+from edgePy.top_table import filter_top_table, top_genes
+from edgePy.util import getLogger
+
+__all__ = ["ResourceCache", "load_dge_list", "load_manifest", "run_manifest", "run_job"]
+
+if TYPE_CHECKING:
+    from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+
+log = getLogger(name=__name__)
+
+# Settings of a job, when neither the job nor the manifest's defaults give them.
+JOB_DEFAULTS: Dict[str, Any] = {
+    "contrasts": "pairwise",
+    "cutoff": 0.05,
+    "minimum_cpm": 1,
+    "p_adjust": "BH",
+    "direction": "up",
+    "output_format": None,
+    "filter_by_expr": False,
+}
+
+RESULT_COLUMNS = ["contrast", "gene", "symbol", "p_value", "adj_p", "logFC", "mean1", "mean2"]
+RESULT_HEADER = ["contrast", "gene_name", "symbol", "p-value", "adj_p", "logFC", "mean1", "mean2"]
+
+
+def load_dge_list(dataset: Dict[str, Any]) -> DGEList:
+    """Load a dataset, described by one of:
+
+        * dge_file: a DGEList saved with write_npz_file or write_dge_file
+        * count_file and groups_file: a table of counts and a JSON file of groups
+        * htseq_files and groups_file: HTSeq count files (a directory, glob or list)
+
+    Args:
+        dataset: the description of the dataset.
+
+    """
+    if "dge_file" in dataset:
+        return DGEList(filename=dataset["dge_file"])
+    if "count_file" in dataset:
+        return DGEList.create_DGEList_data_file(
+            data_file=dataset["count_file"], group_file=dataset["groups_file"]
+        )
+    if "htseq_files" in dataset:
+        return DGEList.create_DGEList_htseq_files(
+            dataset["htseq_files"], group_file=dataset.get("groups_file")
+        )
+    raise ValueError(f"Dataset needs a dge_file, count_file or htseq_files: {dataset}")
+
+
+class ResourceCache(object):
+    """Loaded datasets, annotation, and database connections, shared by the jobs of a batch.
+
+    Each resource is loaded the first time it's asked for, and later requests - from any thread -
+    get the same object.  Two threads asking for the same resource at once wait for a single
+    load.
+
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._resources: Dict[Tuple[Any, ...], Any] = {}
+        self._loading: Dict[Tuple[Any, ...], threading.Lock] = {}
+        self.loads = 0
+
+    def get(self, key: Tuple[Any, ...], factory: Callable[[], Any]) -> Any:
+        """Get a resource, calling factory to create it if it's not cached yet.
+
+        Args:
+            key: identifies the resource - a tuple, starting with the kind of resource.
+            factory: creates the resource.
+
+        """
+        with self._lock:
+            if key in self._resources:
+                return self._resources[key]
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            with self._lock:
+                if key in self._resources:
+                    return self._resources[key]
+            log.info(f"Loading {key[0]}...")
+            resource = factory()
+            with self._lock:
+                self._resources[key] = resource
+                self.loads += 1
+        return resource
+
+    def dge_list(self, dataset: Dict[str, Any]) -> DGEList:
+        """Load a dataset, as described for load_dge_list.
+
+        Args:
+            dataset: the description of the dataset, from the manifest.
+
+        """
+        key = ("dataset", json.dumps(dataset, sort_keys=True))
+        return self.get(key, lambda: load_dge_list(dataset))
+
+    def contrast_engine(self, dataset: Dict[str, Any], filter_by_expr: bool = False) -> Any:
+        """A ContrastEngine for a dataset, so group sorts are shared by every job using it.
+
+        Args:
+            dataset: the description of the dataset, from the manifest.
+            filter_by_expr: test only the genes passing DGEList.filter_by_expr.
+
+        """
+        key = ("contrast engine", json.dumps(dataset, sort_keys=True), filter_by_expr)
+
+        def load() -> ContrastEngine:
+            dge_list = self.dge_list(dataset)
+            if filter_by_expr:
+                dge_list = dge_list.filter_by_expr()
+            return ContrastEngine(dge_list)
+
+        return self.get(key, load)
+
+    def canonical_data_store(self, transcripts: str, symbols: str) -> "CanonicalDataStore":
+        """Load the Ensembl annotation files written by canonical_transcripts.py.
+
+        Args:
+            transcripts: the transcript file.
+            symbols: the gene symbol file.
+
+        """
+        from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+
+        return self.get(
+            ("annotation", transcripts, symbols), lambda: CanonicalDataStore(transcripts, symbols)
+        )
+
+    def symbol_index(
+        self,
+        host: str,
+        port: int = 27017,
+        database: str = "ensembl_90_37",
+        filename: Optional[str] = None,
+    ) -> Any:
+        """Open the symbol index of a mongo database.  Its mongo client comes from the shared
+        client registry of mongo_wrapper, so it's also shared with any other mongo users.
+
+        Args:
+            host: the mongo host.
+            port: the mongo port.
+            database: the mongo database holding the symbol collections.
+            filename: the local index file.  In memory if None.
+
+        """
+        from edgePy.data_import.mongodb.mongo_wrapper import MongoWrapper
+        from edgePy.data_import.mongodb.symbol_index import SymbolIndex
+
+        def load() -> SymbolIndex:
+            return SymbolIndex(
+                MongoWrapper(host=host, port=int(port)),
+                database=database,
+                filename=filename or ":memory:",
+            )
+
+        return self.get(("symbol index", host, int(port), database, filename), load)
+
+    def close(self) -> None:
+        """Close the symbol indexes, and drop every resource."""
+        with self._lock:
+            for key, resource in self._resources.items():
+                if key[0] == "symbol index":
+                    resource.close()
+            self._resources.clear()
+            self._loading.clear()
+
+
+def load_manifest(filename: Union[str, Path]) -> Dict[str, Any]:
+    """Read a manifest file - YAML if it ends with .yaml or .yml (which needs PyYAML), and JSON
+    otherwise.  Relative file names in it are taken as relative to the manifest's directory.
+
+    Args:
+        filename: the manifest file.
+
+    """
+    from smart_open import smart_open  # type: ignore
+
+    filename = str(filename)
+    with smart_open(filename, 'r') as handle:
+        if filename.endswith((".yaml", ".yml")):
+            try:
+                import yaml  # type: ignore
+            except ImportError:
+                raise ImportError("PyYAML is required to read YAML manifests.")
+            manifest = yaml.safe_load(handle)
+        else:
+            manifest = json.load(handle)
+    manifest.setdefault("base_dir", os.path.dirname(os.path.abspath(filename)))
+    return manifest
+
+
+def _resolve(path: Any, base_dir: str) -> Any:
+    """Make relative paths (or lists of them) relative to base_dir."""
+    if isinstance(path, list):
+        return [_resolve(item, base_dir) for item in path]
+    if isinstance(path, str) and "://" not in path and not os.path.isabs(path):
+        return os.path.join(base_dir, path)
+    return path
+
+
+def _symbols(manifest: Dict[str, Any], cache: ResourceCache, genes: Any) -> Optional[List[str]]:
+    """The symbol of each gene, from the manifest's annotation or symbol index, if it has one."""
+    base_dir = manifest.get("base_dir", ".")
+    if "annotation" in manifest:
+        store = cache.canonical_data_store(
+            _resolve(manifest["annotation"]["transcripts"], base_dir),
+            _resolve(manifest["annotation"]["symbols"], base_dir),
+        )
+        return [store.gene_to_symbol.get(gene, gene) for gene in genes]
+    if "symbol_index" in manifest:
+        settings = dict(manifest["symbol_index"])
+        if settings.get("filename"):
+            settings["filename"] = _resolve(settings["filename"], base_dir)
+        found = cache.symbol_index(**settings).get_symbols(genes)
+        return [found[gene][0] if gene in found else gene for gene in genes]
+    return None
+
+
+def run_job(manifest: Dict[str, Any], job: Dict[str, Any], cache: ResourceCache) -> Dict[str, Any]:
+    """Run the contrasts of one job, and write its results.
+
+    Args:
+        manifest: the manifest, for its datasets, defaults, annotation and base_dir.
+        job: the job, from the manifest's jobs list.
+        cache: the shared resources.
+
+    Returns:
+        a summary of the job: its name, output, number of rows written and run time.
+
+    """
+    start = time.perf_counter()
+    base_dir = manifest.get("base_dir", ".")
+    settings = {**JOB_DEFAULTS, **manifest.get("defaults", {}), **job}
+    name = settings.get("name", "job")
+
+    dataset = settings["dataset"]
+    if isinstance(dataset, str):
+        dataset = manifest["datasets"][dataset]
+    dataset = {key: _resolve(value, base_dir) for key, value in dataset.items()}
+
+    engine = cache.contrast_engine(dataset, filter_by_expr=settings["filter_by_expr"])
+    contrasts = settings["contrasts"]
+    if isinstance(contrasts, str):
+        contrasts = engine.contrasts(contrasts, groups=settings.get("groups"))
+    table = engine.run(
+        [tuple(contrast) for contrast in contrasts], adjust_method=settings["p_adjust"]
+    )
+
+    symbols = _symbols(manifest, cache, engine.dge_list.genes)
+    if symbols is not None:
+        table.symbol = symbols * len(contrasts)
+    table = filter_top_table(
+        table,
+        p_value_cutoff=float(settings["cutoff"]),
+        minimum_mean=float(settings["minimum_cpm"]),
+        direction=settings["direction"],
+    )
+
+    output = settings.get("output")
+    output = _resolve(output, base_dir) if output else None
+    with open_results_writer(
+        output, RESULT_COLUMNS, header=RESULT_HEADER, output_format=settings["output_format"]
+    ) as writer:
+        for contrast in dict.fromkeys(table.contrast):
+            writer.write(top_genes(table[table.contrast == contrast]))
+
+    return {
+        "name": name,
+        "output": output,
+        "rows": writer.rows_written,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def run_manifest(
+    manifest: Union[str, Path, Dict[str, Any]],
+    workers: Optional[int] = None,
+    cache: Optional[ResourceCache] = None,
+) -> List[Dict[str, Any]]:
+    """Run every job of a manifest, in a pool of worker threads.  A failed job is logged and
+    reported in its summary, and doesn't stop the others.
+
+    A manifest looks like::
+
+        {
+            "workers": 4,
+            "defaults": {"cutoff": 0.01, "direction": "both"},
+            "datasets": {"liver": {"dge_file": "liver.npz"}},
+            "annotation": {"transcripts": "transcripts.tsv", "symbols": "symbols.tsv"},
+            "jobs": [
+                {"name": "liver_pairs", "dataset": "liver", "output": "liver_pairs.tsv"},
+                {
+                    "name": "liver_rest",
+                    "dataset": "liver",
+                    "contrasts": "one_vs_rest",
+                    "output": "liver_rest.npz"
+                }
+            ]
+        }
+
+    A job's contrasts are 'pairwise', 'one_vs_rest', or a list of [group1, group2] pairs, and
+    its other settings are those of JOB_DEFAULTS.  Instead of annotation, a symbol_index section
+    (host, port, database, filename) translates genes with a SymbolIndex.
+
+    Args:
+        manifest: the manifest, or the name of its file.
+        workers: the number of jobs run at once.  From the manifest if None, or 1.
+        cache: the shared resources, for keeping them between manifests.
+
+    Returns:
+        the summary of each job, in the order of the manifest.
+
+    """
+    if not isinstance(manifest, dict):
+        manifest = load_manifest(manifest)
+    cache = cache if cache is not None else ResourceCache()
+    workers = workers or manifest.get("workers", 1)
+    jobs = manifest.get("jobs", [])
+    log.info(f"Running {len(jobs)} jobs, {workers} at a time.")
+
+    def run(job: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            summary = run_job(manifest, job, cache)
+            log.info(f"{summary['name']}: {summary['rows']:,} rows in {summary['seconds']:.1f}s")
+            return summary
+        except Exception as error:
+            log.error(f"{job.get('name', 'job')} failed: {error!r}")
+            return {"name": job.get("name", "job"), "error": repr(error)}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, jobs))
@@ -0,0 +1,302 @@
+""" Batch effect correction of the counts of a DGEList, in the style of ComBat-seq
+
+Zhang, Parmigiani and Johnson. 'ComBat-seq: batch effect adjustment for RNA-seq count data.'
+NAR Genomics and Bioinformatics, 2020. doi:10.1093/nargab/lqaa078
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList
+from edgePy.util import getLogger
+
+__all__ = ["combat_seq"]
+
+log = getLogger(name=__name__)
+
+# Genes fitted together - bounds the memory of the genes x samples x parameters arrays.
+BLOCK_SIZE: int = 5000
+
+# Weight of the common dispersion of a batch, in residual degrees of freedom, when shrinking.
+PRIOR_DF: float = 10.0
+
+# Floor of the dispersions, so the negative binomial stays defined for Poisson-like genes.
+MIN_DISPERSION: float = 1e-6
+
+MAX_ITERATIONS: int = 50
+TOLERANCE: float = 1e-8
+
+
+def _design(batches: np.ndarray, groups: Optional[np.ndarray]) -> Tuple[np.ndarray, List, List]:
+    """The design matrix: one column per batch, then one per group except the first.
+
+    Returns:
+        the design (samples by parameters), the batch names, and the group names.
+
+    """
+    batch_names = list(dict.fromkeys(batches.tolist()))
+    columns = [batches == batch for batch in batch_names]
+    group_names: List = []
+    if groups is not None:
+        group_names = list(dict.fromkeys(groups.tolist()))
+        columns += [groups == group for group in group_names[1:]]
+    design = np.column_stack(columns).astype(np.float64)
+    if np.linalg.matrix_rank(design) < design.shape[1]:
+        raise ValueError("The groups are confounded with the batches, so can't be separated.")
+    return design, batch_names, group_names
+
+
+def _dispersions(
+    counts: np.ndarray, library_sizes: np.ndarray, cells: np.ndarray, batch_of_cell: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Moment estimates of the dispersion of every gene in every batch.
+
+    Within each batch and group (a cell), the mean of a sample is its library size times the
+    cell's pooled rate, and the dispersion is the average of ((y - mu)^2 - y) / mu^2 over the
+    residual degrees of freedom of the batch.
+
+    Args:
+        counts: genes by samples.
+        library_sizes: the effective library size of each sample.
+        cells: the cell number of each sample.
+        batch_of_cell: the batch number of each cell.
+
+    Returns:
+        the dispersions, genes by batches, and the residual degrees of freedom of each batch.
+
+    """
+    membership = np.eye(cells.max() + 1)[cells]
+    rates = (counts @ membership) / (library_sizes @ membership)
+    mu = library_sizes * rates[:, cells]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(mu > 0, ((counts - mu) ** 2 - counts) / mu ** 2, 0)
+    batch_of_sample = batch_of_cell[cells]
+    batch_membership = np.eye(batch_of_cell.max() + 1)[batch_of_sample]
+    df = batch_membership.sum(axis=0) - np.bincount(batch_of_cell)
+    if (df <= 0).any():
+        raise ValueError("Every batch needs more samples than the groups it contains.")
+    return np.maximum((terms @ batch_membership) / df, 0), df
+
+
+def _fit_block(
+    counts: np.ndarray,
+    design: np.ndarray,
+    offsets: np.ndarray,
+    cells: np.ndarray,
+    batch_of_cell: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """Fit the negative binomial model of a block of genes.  Module level, so that it can run in
+    worker processes.
+
+    The dispersions are estimated first, then the coefficients of every gene are fitted together
+    by iteratively reweighted least squares: each iteration forms the weighted normal equations
+    of all genes as one (genes, parameters, parameters) array, and solves them in one call.
+
+    Args:
+        counts: genes by samples.
+        design: samples by parameters, batch columns first.
+        offsets: the log effective library size of each sample.
+        cells: the batch and group cell number of each sample.
+        batch_of_cell: the batch number of each cell.
+
+    Returns:
+        the coefficients, their variances, the batch dispersions, and the batch residual degrees
+        of freedom.
+
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    dispersions, df = _dispersions(counts, np.exp(offsets), cells, batch_of_cell)
+    batch_of_sample = batch_of_cell[cells]
+    phi = np.maximum(dispersions, MIN_DISPERSION)[:, batch_of_sample]
+
+    # Start from the counts, nudged away from zero, as glm.fit does.
+    mu = counts + 0.1
+    eta = np.log(mu)
+    coefficients = np.zeros((len(counts), design.shape[1]))
+    for iteration in range(MAX_ITERATIONS):
+        weights = mu / (1 + phi * mu)
+        working = eta - offsets + (counts - mu) / mu
+        information = np.einsum("sp,gs,sq->gpq", design, weights, design)
+        information[:, np.arange(design.shape[1]), np.arange(design.shape[1])] += 1e-10
+        score = (weights * working) @ design
+        updated = np.linalg.solve(information, score[:, :, np.newaxis])[:, :, 0]
+        change = np.abs(updated - coefficients).max()
+        coefficients = updated
+        eta = coefficients @ design.T + offsets
+        mu = np.exp(eta)
+        if change < TOLERANCE:
+            break
+    log.debug(f"IRLS finished after {iteration + 1} iterations.")
+
+    weights = mu / (1 + phi * mu)
+    information = np.einsum("sp,gs,sq->gpq", design, weights, design)
+    variances = np.diagonal(np.linalg.pinv(information), axis1=1, axis2=2)
+    return {
+        "coefficients": coefficients,
+        "variances": variances,
+        "dispersions": dispersions,
+        "df": df,
+    }
+
+
+def _adjust_block(
+    counts: np.ndarray,
+    old_mu: np.ndarray,
+    old_phi: np.ndarray,
+    new_mu: np.ndarray,
+    new_phi: np.ndarray,
+) -> np.ndarray:
+    """Map each count to the same quantile of the batch-free distribution.  Module level, so
+    that it can run in worker processes.
+
+    Counts of 0 and 1, and counts in the extreme upper tail, are kept as they are.
+
+    Args:
+        counts: genes by samples.
+        old_mu: the fitted means, with the batch effects.
+        old_phi: the dispersion of each gene in each sample's batch.
+        new_mu: the fitted means without the batch effects.
+        new_phi: the pooled dispersion of each gene.
+
+    """
+    from scipy.stats import nbinom  # type: ignore
+
+    old_size = 1 / old_phi
+    quantiles = nbinom.cdf(counts - 1, old_size, old_size / (old_size + old_mu))
+    new_size = 1 / new_phi[:, np.newaxis]
+    adjusted = 1 + nbinom.ppf(quantiles, new_size, new_size / (new_size + new_mu))
+    keep = (counts <= 1) | (np.abs(quantiles - 1) < 1e-4) | ~np.isfinite(adjusted)
+    return np.where(keep, counts, adjusted)
+
+
+def _map_blocks(
+    function: Callable, blocks: List[Tuple[Any, ...]], processes: Optional[int]
+) -> List[Any]:
+    """Apply a function to the arguments of each block, in worker processes unless processes
+    is 1."""
+    if processes == 1 or len(blocks) == 1:
+        return [function(*arguments) for arguments in blocks]
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(function, *zip(*blocks)))
+
+
+def combat_seq(
+    dge_list: DGEList,
+    batches: Sequence,
+    use_groups: bool = True,
+    shrink: bool = False,
+    block_size: int = BLOCK_SIZE,
+    processes: Optional[int] = 1,
+) -> DGEList:
+    """Remove batch effects from the counts of a DGEList, keeping them as counts.
+
+    Each gene is modelled as negative binomial, with a mean depending on the batch and the group
+    of the sample, and a dispersion for each batch.  The batch effects are the batch
+    coefficients relative to their average, weighted by batch size.  Each count is then mapped
+    to the same quantile of a distribution without the batch effect, with the average of the
+    batch dispersions.
+
+    With shrink, the batch effects of each batch are shrunk towards their mean over genes by
+    normal empirical Bayes, and the dispersions towards the common dispersion of the batch,
+    weighted by their residual degrees of freedom against PRIOR_DF.  This steadies the estimates
+    of small batches, at the cost of leaving part of large batch effects in place, so it's off
+    by default, as in ComBat-seq.
+
+    The model is fitted for all genes of a block at once (see _fit_block), and the blocks can
+    be spread over worker processes.  Genes with no counts in some batch are left unchanged.
+
+    Args:
+        dge_list: the DGEList of raw counts.
+        batches: the batch of each sample.
+        use_groups: keep the differences between the DGEList's groups, by including them in the
+            model.  The groups must not be confounded with the batches.
+        shrink: shrink the batch effects and dispersions with empirical Bayes.
+        block_size: the number of genes fitted at a time.
+        processes: the number of worker processes.  1 works in this process, and None uses one
+            per CPU.
+
+    Returns:
+        DGEList: the adjusted counts.
+
+    Raises:
+        ValueError: for log data, a batch list of the wrong length, or groups confounded with
+            the batches.
+
+    """
+    if dge_list.current_log_status:
+        raise ValueError("combat_seq requires raw (non-log) counts.")
+    batches = np.asarray(batches, dtype=object)
+    if len(batches) != len(dge_list.samples):
+        raise ValueError(f"{len(batches)} batches given for {len(dge_list.samples)} samples.")
+    groups = np.asarray(dge_list.groups_list, dtype=object) if use_groups else None
+    design, batch_names, group_names = _design(batches, groups)
+    if len(batch_names) < 2:
+        log.info("Only one batch - nothing to correct.")
+        return dge_list.copy()
+
+    batch_number = np.array([batch_names.index(batch) for batch in batches.tolist()])
+    group_number = (
+        np.array([group_names.index(group) for group in groups.tolist()])
+        if groups is not None
+        else np.zeros(len(batches), dtype=int)
+    )
+    cell_keys, cells = np.unique(
+        batch_number * max(len(group_names), 1) + group_number, return_inverse=True
+    )
+    batch_of_cell = cell_keys // max(len(group_names), 1)
+    offsets = np.log(np.asarray(dge_list.effective_library_size, dtype=np.float64))
+
+    counts = np.asarray(dge_list.counts)
+    batch_membership = np.eye(len(batch_names))[batch_number]
+    fitted = ((counts > 0) @ batch_membership).all(axis=1)
+    log.info(f"Fitting {fitted.sum():,} genes; {(~fitted).sum():,} with empty batches are kept.")
+    if not fitted.any():
+        return dge_list.copy()
+    fitted_counts = counts[fitted]
+
+    starts = range(0, len(fitted_counts), block_size)
+    blocks = [
+        (fitted_counts[start : start + block_size], design, offsets, cells, batch_of_cell)
+        for start in starts
+    ]
+    fits = _map_blocks(_fit_block, blocks, processes)
+    coefficients = np.concatenate([fit["coefficients"] for fit in fits])
+    variances = np.concatenate([fit["variances"] for fit in fits])
+    dispersions = np.concatenate([fit["dispersions"] for fit in fits])
+    df = fits[0]["df"]
+
+    n_batches = len(batch_names)
+    batch_coefficients = coefficients[:, :n_batches]
+    batch_weights = batch_membership.sum(axis=0) / len(batches)
+    gamma = batch_coefficients - (batch_coefficients @ batch_weights)[:, np.newaxis]
+    mu = np.exp(coefficients @ design.T + offsets)
+
+    if shrink:
+        sampling_variance = variances[:, :n_batches]
+        prior_mean = gamma.mean(axis=0)
+        prior_variance = np.maximum(gamma.var(axis=0) - sampling_variance.mean(axis=0), 1e-8)
+        gamma = (prior_variance * gamma + sampling_variance * prior_mean) / (
+            prior_variance + sampling_variance
+        )
+        common = dispersions.mean(axis=0)
+        dispersions = (df * dispersions + PRIOR_DF * common) / (df + PRIOR_DF)
+
+    dispersions = np.maximum(dispersions, MIN_DISPERSION)
+    new_mu = mu * np.exp(-gamma[:, batch_number])
+    new_phi = dispersions.mean(axis=1)
+    old_phi = dispersions[:, batch_number]
+
+    blocks = [
+        (
+            fitted_counts[start : start + block_size],
+            mu[start : start + block_size],
+            old_phi[start : start + block_size],
+            new_mu[start : start + block_size],
+            new_phi[start : start + block_size],
+        )
+        for start in starts
+    ]
+    adjusted = counts.copy()
+    adjusted[fitted] = np.concatenate(_map_blocks(_adjust_block, blocks, processes))
+    return dge_list.copy(counts=adjusted)
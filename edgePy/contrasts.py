@@ -0,0 +1,303 @@
+""" Kolmogorov-Smirnov tests of several contrasts between the groups of a DGEList """
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList, PRIOR_COUNT
+from edgePy.top_table import TOP_TABLE_DTYPE, p_adjust
+from edgePy.util import getLogger
+
+__all__ = ["ContrastEngine", "ks_statistic", "REST", "CONTRAST_TABLE_DTYPE"]
+
+log = getLogger(name=__name__)
+
+# The name used for "all other samples" in one_vs_rest contrasts.
+REST = "rest"
+
+# Largest group for which exact p-values are computed, as in scipy.stats.ks_2samp.
+MAX_EXACT_SIZE: int = 10000
+
+CONTRAST_TABLE_DTYPE = np.dtype(
+    [("contrast", object), ("group1", object), ("group2", object)] + TOP_TABLE_DTYPE.descr
+)
+
+CONTRAST_KINDS = ("pairwise", "one_vs_rest")
+
+
+def ks_statistic(sorted1: np.ndarray, sorted2: np.ndarray) -> np.ndarray:
+    """Compute the two sample Kolmogorov-Smirnov statistic of every row at once.
+
+    The two samples of each row are merged with a stable sort - fast, as each is already sorted
+    - and the difference of the two empirical distribution functions is accumulated along the
+    merged row, in integer units of 1 / (n1 * n2) so that ties in D compare exactly.  Only the
+    last position of each run of tied values is considered.
+
+    Args:
+        sorted1: the first sample of each row, sorted along the rows.
+        sorted2: the second sample of each row, sorted along the rows.
+
+    Returns:
+        the statistic D of each row, as an integer multiple of 1 / (n1 * n2).
+
+    """
+    n1 = sorted1.shape[1]
+    n2 = sorted2.shape[1]
+    merged = np.concatenate([sorted1, sorted2], axis=1)
+    order = np.argsort(merged, axis=1, kind="stable")
+    values = np.take_along_axis(merged, order, axis=1)
+    steps = np.where(order < n1, np.int64(n2), np.int64(-n1))
+    difference = np.abs(np.cumsum(steps, axis=1))
+    # Ignore positions followed by the same value - the distributions step past them together.
+    difference[:, :-1][values[:, :-1] == values[:, 1:]] = 0
+    return difference.max(axis=1)
+
+
+class ContrastEngine(object):
+    """Run Kolmogorov-Smirnov tests for many contrasts between the groups of a DGEList.
+
+    The sorted counts, sums and sizes of each group are computed once and cached, and reused by
+    every contrast the group takes part in.  Each contrast is tested for all genes at once, and
+    the p-value of each distinct value of D is computed once.
+
+    A contrast is a pair (group1, group2); group1 may be REST, meaning all samples not in group2.
+    The logFC of a contrast is the log2 fold change of group2 over group1.
+
+    Args:
+        dge_list: the DGEList to test.
+        method: 'exact', 'asymp' or 'auto', as for scipy.stats.ks_2samp.  'auto' uses exact
+            p-values unless a group has more than MAX_EXACT_SIZE samples.
+        prior_count: added to means and CPMs before taking logs, to avoid log(0).
+
+    Examples:
+
+        >>> dge_list = DGEList(
+        ...     counts=np.array([[10, 12, 30, 33, 5, 6], [5, 5, 5, 6, 50, 60]]),
+        ...     samples=['A1', 'A2', 'B1', 'B2', 'C1', 'C2'],
+        ...     genes=['G1', 'G2'],
+        ...     groups_in_list=['A', 'A', 'B', 'B', 'C', 'C'],
+        ... )
+        >>> engine = ContrastEngine(dge_list)
+        >>> engine.contrasts(kind="one_vs_rest")
+        [('rest', 'A'), ('rest', 'B'), ('rest', 'C')]
+        >>> table = engine.run(kind="one_vs_rest")
+        >>> table[table.contrast == "C_vs_rest"].mean2
+        array([ 5.5, 55. ])
+
+    """
+
+    def __init__(
+        self, dge_list: DGEList, method: str = "auto", prior_count: float = PRIOR_COUNT
+    ) -> None:
+        if method not in ("auto", "exact", "asymp"):
+            raise ValueError(f"Unknown method: {method}")
+        self.dge_list = dge_list
+        self.method = method
+        self.prior_count = prior_count
+        self.counts = np.asarray(dge_list.counts, dtype=np.float64)
+        self.groups = np.asarray(dge_list.groups_list)
+        self.group_names: List[str] = list(dict.fromkeys(self.groups.tolist()))
+        self._sorted: Dict[str, np.ndarray] = {}
+        self._sums: Dict[str, np.ndarray] = {}
+        self._rest: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+        self._log_cpm: Optional[np.ndarray] = None
+
+    def _check_group(self, group: str) -> None:
+        if group not in self.group_names:
+            raise KeyError(f"Group not found: {group}")
+
+    def sorted_counts(self, group: str) -> np.ndarray:
+        """The counts of the samples of a group, sorted along each gene.
+
+        Args:
+            group: the group name.
+
+        """
+        if group not in self._sorted:
+            self._check_group(group)
+            self._sorted[group] = np.sort(self.counts[:, self.groups == group], axis=1)
+        return self._sorted[group]
+
+    def group_sum(self, group: str) -> np.ndarray:
+        """The total count of each gene over the samples of a group.
+
+        Args:
+            group: the group name.
+
+        """
+        if group not in self._sums:
+            self._check_group(group)
+            self._sums[group] = self.counts[:, self.groups == group].sum(axis=1)
+        return self._sums[group]
+
+    def group_size(self, group: str) -> int:
+        """The number of samples in a group."""
+        self._check_group(group)
+        return int((self.groups == group).sum())
+
+    @property
+    def log_cpm(self) -> np.ndarray:
+        """log2 of the average counts per million of each gene, over all samples."""
+        if self._log_cpm is None:
+            cpm = self.counts * (1e6 / self.counts.sum(axis=0))
+            self._log_cpm = np.log2(cpm.mean(axis=1) + self.prior_count)
+        return self._log_cpm
+
+    def _rest_of(self, group: str) -> Tuple[np.ndarray, np.ndarray, int]:
+        """The sorted counts, sums and size of every sample outside a group."""
+        if group not in self._rest:
+            others = [other for other in self.group_names if other != group]
+            if not others:
+                raise ValueError(f"There are no samples outside group {group}")
+            sorted_rest = np.sort(
+                np.concatenate([self.sorted_counts(other) for other in others], axis=1),
+                axis=1,
+                kind="stable",
+            )
+            total = np.sum([self.group_sum(other) for other in others], axis=0)
+            size = sum(self.group_size(other) for other in others)
+            self._rest[group] = (sorted_rest, total, size)
+        return self._rest[group]
+
+    def contrasts(
+        self, kind: str = "pairwise", groups: Optional[Sequence[str]] = None
+    ) -> List[Tuple[str, str]]:
+        """List the contrasts of a kind.
+
+        Args:
+            kind: 'pairwise' for every pair of groups, or 'one_vs_rest' for each group against
+                all other samples.
+            groups: the groups to include.  All, in order of first appearance, if None.
+
+        """
+        groups = self.group_names if groups is None else list(groups)
+        for group in groups:
+            self._check_group(group)
+        if kind == "pairwise":
+            return list(combinations(groups, 2))
+        if kind == "one_vs_rest":
+            return [(REST, group) for group in groups]
+        raise ValueError(f"kind must be one of {CONTRAST_KINDS}, not {kind}")
+
+    def _p_values(self, statistic: np.ndarray, n1: int, n2: int) -> np.ndarray:
+        """Convert integer D statistics to p-values, computing each distinct value once."""
+        from scipy.stats import kstwo  # type: ignore
+
+        distinct, inverse = np.unique(statistic, return_inverse=True)
+        d = distinct / (n1 * n2)
+        exact = self.method == "exact" or (self.method == "auto" and max(n1, n2) <= MAX_EXACT_SIZE)
+        if exact:
+            p_values = _exact_p_values(distinct, n1, n2)
+        else:
+            p_values = kstwo.sf(d, np.round(n1 * n2 / (n1 + n2)))
+        return np.clip(p_values, 0, 1)[inverse]
+
+    def test(self, group1: str, group2: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Test one contrast, for every gene.
+
+        Args:
+            group1: the first group, or REST for every sample not in group2.
+            group2: the second group.
+
+        Returns:
+            the D statistic and p-value of each gene.
+
+        """
+        if group1 == REST:
+            sorted1, _, n1 = self._rest_of(group2)
+        else:
+            sorted1, n1 = self.sorted_counts(group1), self.group_size(group1)
+        sorted2, n2 = self.sorted_counts(group2), self.group_size(group2)
+        statistic = ks_statistic(sorted1, sorted2)
+        return statistic / (n1 * n2), self._p_values(statistic, n1, n2)
+
+    def run(
+        self,
+        contrasts: Optional[Iterable[Tuple[str, str]]] = None,
+        kind: str = "pairwise",
+        adjust_method: str = "BH",
+    ) -> np.recarray:
+        """Test several contrasts, and stack the results in one table.
+
+        Args:
+            contrasts: the (group1, group2) pairs to test.  If None, every contrast of kind.
+            kind: 'pairwise' or 'one_vs_rest', used if contrasts is None.
+            adjust_method: the p_adjust method, applied within each contrast.
+
+        Returns:
+            a record array with the fields of a top table (see edgePy.top_table.make_top_table),
+            plus contrast, group1 and group2, with one row per gene and contrast.
+
+        """
+        contrasts = self.contrasts(kind) if contrasts is None else list(contrasts)
+        genes = self.dge_list.genes
+        num_genes = len(genes)
+        table = np.recarray(num_genes * len(contrasts), dtype=CONTRAST_TABLE_DTYPE)
+
+        for number, (group1, group2) in enumerate(contrasts):
+            log.info(f"Testing {group2} against {group1}...")
+            rows = slice(number * num_genes, (number + 1) * num_genes)
+            _, p_values = self.test(group1, group2)
+            if group1 == REST:
+                _, total, size = self._rest_of(group2)
+                mean1 = total / size
+            else:
+                mean1 = self.group_sum(group1) / self.group_size(group1)
+            mean2 = self.group_sum(group2) / self.group_size(group2)
+
+            table.contrast[rows] = f"{group2}_vs_{group1}"
+            table.group1[rows] = group1
+            table.group2[rows] = group2
+            table.gene[rows] = genes
+            table.symbol[rows] = genes
+            table.mean1[rows] = mean1
+            table.mean2[rows] = mean2
+            table.logFC[rows] = np.log2(mean2 + self.prior_count) - np.log2(
+                mean1 + self.prior_count
+            )
+            table.logCPM[rows] = self.log_cpm
+            table.p_value[rows] = p_values
+            table.adj_p[rows] = p_adjust(p_values, adjust_method)
+        return table
+
+
+def _exact_p_values(statistics: np.ndarray, n1: int, n2: int) -> np.ndarray:
+    """Exact two-sided p-values P(D >= d) of the two sample KS test, for several values of d.
+
+    Each ordering of the pooled samples is a lattice path from (0, 0) to (n1, n2), and D is the
+    largest |i / n1 - j / n2| along the path.  Every path is equally likely under the null
+    hypothesis, so the path is followed one anti-diagonal at a time, with the probability of each
+    step, and the probability of first reaching a point with a difference of at least d is added
+    up.  Adding the (small) probabilities of leaving, rather than subtracting the probability of
+    staying from 1, keeps small p-values accurate.  All values of d are followed together.
+
+    Args:
+        statistics: the values of D, as integer multiples of 1 / (n1 * n2).
+        n1: the size of the first sample.
+        n2: the size of the second sample.
+
+    """
+    thresholds = np.asarray(statistics, dtype=np.int64)[:, np.newaxis]
+    outside = np.zeros(len(thresholds))
+    inside = (thresholds > 0).astype(np.float64)
+    outside += 1 - inside[:, 0]
+    first = 0
+    for k in range(1, n1 + n2 + 1):
+        i = np.arange(max(0, k - n2), min(k, n1) + 1)
+        j = k - i
+        reached = np.zeros((len(thresholds), len(i)))
+        # From (i - 1, j), moving in i, for the points with i > 0.
+        from_i = i > 0
+        previous = i[from_i] - 1 - first
+        remaining_i = n1 - (i[from_i] - 1)
+        reached[:, from_i] += inside[:, previous] * remaining_i / (remaining_i + n2 - j[from_i])
+        # From (i, j - 1), moving in j, for the points with j > 0.
+        from_j = j > 0
+        previous = i[from_j] - first
+        remaining_j = n2 - (j[from_j] - 1)
+        reached[:, from_j] += inside[:, previous] * remaining_j / (remaining_j + n1 - i[from_j])
+        leaving = np.abs(i * n2 - j * n1) >= thresholds
+        outside += (reached * leaving).sum(axis=1)
+        inside = np.where(leaving, 0.0, reached)
+        first = i[0]
+    return outside
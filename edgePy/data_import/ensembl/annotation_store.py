@@ -0,0 +1,325 @@
+"""
+An annotation store for holding several Ensembl releases at once.  Gene, transcript and symbol ids
+are stored once, in intern tables shared by every release, and each release only keeps compact
+integer arrays of codes, lengths and flags.
+"""
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np  # type: ignore
+from smart_open import smart_open  # type: ignore
+
+from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+
+__all__ = ["InternTable", "ReleaseDataStore", "MultiReleaseDataStore"]
+
+MISSING: int = -1
+
+
+class InternTable(object):
+    """
+    Assigns a permanent integer code to each distinct string, and keeps a single copy of it.
+
+    """
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self.codes
+
+    def add(self, value: str) -> int:
+        """
+        Get the code of a string, assigning a new one if it hasn't been seen before.
+
+        Args:
+            value: the string to intern
+
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            value = sys.intern(value)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def get(self, value: Optional[str]) -> int:
+        """
+        Get the code of a string, or MISSING if it has never been seen.
+
+        Args:
+            value: the string to look up
+
+        """
+        if value is None:
+            return MISSING
+        return self.codes.get(value, MISSING)
+
+
+class ReleaseDataStore(object):
+    """
+    The annotation of a single Ensembl release, with the same lookup functions as
+    CanonicalDataStore.  Create these through MultiReleaseDataStore.add_release.
+
+    Arrays are indexed by the codes of the shared intern tables.  Codes assigned after the release
+    was loaded are beyond the end of its arrays, and are treated as absent.
+
+    Args:
+        store: the multi-release store holding the intern tables
+        name: the name of the release
+        transcript_filename: the name of the transcript file, generated by canonical_transcripts.py
+        symbols_filename: the name of the gene symbol file, generated by canonical_transcripts.py
+
+    """
+
+    pick_gene_id = staticmethod(CanonicalDataStore.pick_gene_id)
+
+    def __init__(
+        self,
+        store: "MultiReleaseDataStore",
+        name: str,
+        transcript_filename: Union[str, Path],
+        symbols_filename: Union[str, Path],
+    ) -> None:
+        self.store = store
+        self.name = name
+        self._load_transcripts(transcript_filename)
+        self._load_symbols(symbols_filename)
+
+    def _load_transcripts(self, transcript_filename: Union[str, Path]) -> None:
+        genes = self.store.genes
+        transcripts = self.store.transcripts
+        gene_codes = array('i')
+        transcript_codes = array('i')
+        lengths = array('l')
+        canonical_flags = array('b')
+
+        with smart_open(transcript_filename, 'r') as data:
+            for line in data:
+                gene, transcript, length, canonical = line.strip().split("\t")[:4]
+                gene_codes.append(genes.add(gene))
+                transcript_codes.append(transcripts.add(transcript))
+                lengths.append(int(length))
+                canonical_flags.append(canonical == "True")
+
+        gene_codes_np = np.frombuffer(gene_codes, dtype=np.int32)
+        transcript_codes_np = np.frombuffer(transcript_codes, dtype=np.int32)
+        canonical_np = np.frombuffer(canonical_flags, dtype=np.int8).astype(bool)
+
+        self.transcript_length = np.full(len(transcripts), MISSING, dtype=np.int32)
+        self.transcript_length[transcript_codes_np] = np.asarray(lengths, dtype=np.int32)
+        self.transcript_canonical = np.zeros(len(transcripts), dtype=bool)
+        self.transcript_canonical[transcript_codes_np] = canonical_np
+
+        self.canonical_transcript = np.full(len(genes), MISSING, dtype=np.int32)
+        self.canonical_transcript[gene_codes_np[canonical_np]] = transcript_codes_np[canonical_np]
+
+    def _load_symbols(self, symbols_filename: Union[str, Path]) -> None:
+        genes = self.store.genes
+        symbols = self.store.symbols
+        symbol_codes = array('i')
+        gene_codes = array('i')
+
+        with smart_open(symbols_filename, 'r') as data:
+            for line in data:
+                symbol, gene = line.strip().split("\t")[:2]
+                symbol_codes.append(symbols.add(symbol))
+                gene_codes.append(genes.add(gene))
+
+        symbol_codes_np = np.frombuffer(symbol_codes, dtype=np.int32)
+        gene_codes_np = np.frombuffer(gene_codes, dtype=np.int32)
+
+        # The first symbol listed for a gene is its name - later ones are synonyms.
+        self.gene_symbol = np.full(len(genes), MISSING, dtype=np.int32)
+        first_genes, first_rows = np.unique(gene_codes_np, return_index=True)
+        self.gene_symbol[first_genes] = symbol_codes_np[first_rows]
+
+        # Genes of each symbol, without duplicates, in file order - stored as a CSR structure.
+        pair_keys = symbol_codes_np.astype(np.int64) * len(genes) + gene_codes_np
+        _, first_pairs = np.unique(pair_keys, return_index=True)
+        first_pairs.sort()
+        pair_symbols = symbol_codes_np[first_pairs]
+        order = np.argsort(pair_symbols, kind="stable")
+        self.symbol_genes = gene_codes_np[first_pairs][order].copy()
+        self.symbol_offsets = np.zeros(len(symbols) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pair_symbols, minlength=len(symbols)), out=self.symbol_offsets[1:])
+
+    @staticmethod
+    def _lookup(values: np.ndarray, code: int) -> int:
+        if code == MISSING or code >= len(values):
+            return MISSING
+        return int(values[code])
+
+    def _symbol_gene_codes(self, symbol: Optional[str]) -> np.ndarray:
+        code = self.store.symbols.get(symbol)
+        if code == MISSING or code >= len(self.symbol_offsets) - 1:
+            return self.symbol_genes[:0]
+        return self.symbol_genes[self.symbol_offsets[code] : self.symbol_offsets[code + 1]]
+
+    def has_gene(self, gene: Optional[str]) -> bool:
+        """
+        Check if a gene is present in the dataset.
+        Args:
+            gene: the ensembl gene id.
+        """
+        return self.get_canonical_transcript(gene) is not None
+
+    def get_symbol_from_gene(self, gene: Optional[str]) -> Optional[str]:
+        """
+        Given a gene name, get the symbol - should give you the default ENSEMBL name, and not a
+        synonym.
+        Args:
+            gene: the ensembl gene id.
+        """
+        if not gene:
+            return None
+        symbol = self._lookup(self.gene_symbol, self.store.genes.get(gene))
+        if symbol == MISSING:
+            print(f"gene {gene} not found in gene to symbol.")
+            raise KeyError
+        return self.store.symbols.values[symbol]
+
+    def get_genes_from_symbol(self, symbol: str) -> List:
+        """
+        Given the gene symbol (or a recognized synonym), get the ensembl id.
+        Args:
+            symbol: HUGO or HGNC symbol
+        """
+        values = self.store.genes.values
+        return [values[code] for code in self._symbol_gene_codes(symbol)]
+
+    def is_known_symbol(self, symbol: str) -> bool:
+        """
+        Check to see if we recognize a given symbol - there always will be things we don't
+        recognize.
+        Args:
+            symbol: what you think is a gene symbol.
+        """
+        return len(self._symbol_gene_codes(symbol)) > 0
+
+    def is_known_gene(self, gene: str) -> bool:
+        """
+        Check to see if we can recognize a given gene ID from ENSEMBL.  If you have one that isn't
+        recognized, it might belong to a different version.
+        Args:
+            gene: what you think is a gene id.
+        """
+        return self._lookup(self.gene_symbol, self.store.genes.get(gene)) != MISSING
+
+    def is_canonical_by_transcript(self, transcript_id: str) -> bool:
+        """
+        Return a boolean indicating whether the supplied transcript is canonical or not.
+
+        Args:
+            transcript_id: an Ensembl transcript ID, starting with ENST
+        """
+        code = self.store.transcripts.get(transcript_id)
+        if self._lookup(self.transcript_length, code) == MISSING:
+            return False
+        return bool(self.transcript_canonical[code])
+
+    def get_canonical_transcript(self, gene_id: Optional[str]) -> Optional[str]:
+        """
+        Return the Ensembl canonical transcript ID, given an ensembl gene ID.
+
+        Args:
+            gene_id: An Ensembl gene ID, starting with ENSG
+        """
+        transcript = self._lookup(self.canonical_transcript, self.store.genes.get(gene_id))
+        if transcript == MISSING:
+            return None
+        return self.store.transcripts.values[transcript]
+
+    def get_length_of_transcript(self, transcript_id: str) -> int:
+        """
+        Return the length of a transcript, given an ensembl transcript ID.
+
+        Args:
+             transcript_id: an Ensembl transcript ID, starting with ENST
+        """
+        length = self._lookup(self.transcript_length, self.store.transcripts.get(transcript_id))
+        if length == MISSING:
+            return False
+        return length
+
+    def get_length_of_canonical_transcript(self, gene_id: Optional[str]) -> int:
+        """
+        Return the length of a transcript, given an ensembl gene ID.
+
+        Args:
+             gene_id: An Ensembl gene ID, starting with ENSG
+        """
+        if not gene_id:
+            return 0
+        transcript = self._lookup(self.canonical_transcript, self.store.genes.get(gene_id))
+        if transcript == MISSING:
+            return False
+        return int(self.transcript_length[transcript])
+
+
+class MultiReleaseDataStore(object):
+    """
+    Holds the annotation of several Ensembl releases, sharing one copy of every gene, transcript
+    and symbol id between them.  Each release is a ReleaseDataStore, which can be used in place of
+    a CanonicalDataStore.
+
+    Examples:
+
+        >>> store = MultiReleaseDataStore()
+        >>> store.add_release('75', 'transcripts_75.tsv', 'symbols_75.tsv')  # doctest: +SKIP
+        >>> store['75'].has_gene('ENSG00000104047')  # doctest: +SKIP
+        True
+
+    """
+
+    def __init__(self) -> None:
+        self.genes = InternTable()
+        self.transcripts = InternTable()
+        self.symbols = InternTable()
+        self.releases: Dict[str, ReleaseDataStore] = {}
+
+    def add_release(
+        self,
+        name: str,
+        transcript_filename: Union[str, Path],
+        symbols_filename: Union[str, Path],
+    ) -> ReleaseDataStore:
+        """
+        Load the files generated by canonical_transcripts.py for a release.
+
+        Args:
+            name: the name to refer to the release by, eg. homo_sapiens_core_75_37
+            transcript_filename: the name of the transcript file
+            symbols_filename: the name of the gene symbol file
+
+        """
+        self.releases[name] = ReleaseDataStore(self, name, transcript_filename, symbols_filename)
+        return self.releases[name]
+
+    def release(self, name: str) -> ReleaseDataStore:
+        """
+        Get the annotation of a release.
+
+        Args:
+            name: the name the release was added with.
+
+        """
+        return self.releases[name]
+
+    __getitem__ = release
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.releases
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.releases)
+
+    def __len__(self) -> int:
+        return len(self.releases)
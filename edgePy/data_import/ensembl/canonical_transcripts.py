@@ -1,9 +1,21 @@
 """Some macro-level functions for dealing with the mysql library"""
 
 import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
 from smart_open import smart_open  # type: ignore
 
 from edgePy.data_import.ensembl.mysql_wrapper import MySQLWrapper
+from edgePy.util import getLogger
+
+log = getLogger(name=__name__)
+
+COPY_BUFFER_SIZE: int = 1 << 20
 
 CANONICAL_TRANSCRIPT_SQL = """select gene.stable_id as gene, transcript.stable_id as transcript,
 t_len.exon_len as length, IF(gene.canonical_transcript_id = transcript.transcript_id, "True", "False") as canonical
@@ -36,81 +48,235 @@ def parse_arguments(parser=None):
     parser.add_argument("--password", help="password for the mysql service", default=None)
     parser.add_argument(
         "--database",
-        help="database to use for the query, for example homo_sapiens_core_75_37 or "
+        nargs="+",
+        help="one or more databases to use for the query, for example homo_sapiens_core_75_37 or "
         "homo_sapiens_core_93_38 or mus_musculus_core_93_38 ",
-        default="homo_sapiens_core_75_37",
+        default=["homo_sapiens_core_75_37"],
     )
 
     parser.add_argument(
         "--output_transcripts",
-        help="where to put the file with the transcript data",
-        default="blank",
+        help="where to put the file with the transcript data - {database} is replaced by the "
+        "database name",
+        default="../../data/transcripts_{database}.tsv",
+    )
+    parser.add_argument(
+        "--output_symbols",
+        help="where to put the file with the gene symbols - {database} is replaced by the "
+        "database name",
+        default="../../data/symbols_{database}.tsv",
     )
     parser.add_argument(
-        "--output_symbols", help="where to put the file with the gene symbols", default="blank"
+        "--compress", action="store_true", help="gzip the output files (adds a .gz extension)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=2, help="number of databases to export at the same time"
     )
     args = parser.parse_args()
 
-    if args.output_transcripts == "blank":
-        args.output_transcripts = f"../../data/transcripts_{args.database}.tsv"
+    if len(args.database) > 1 and not (
+        "{database}" in args.output_transcripts and "{database}" in args.output_symbols
+    ):
+        parser.error("output file names must contain {database} when exporting several databases")
 
-    if args.output_symbols == "blank":
-        args.output_symbols = f"../../data/symbols_{args.database}.tsv"
+    if args.compress:
+        args.output_transcripts = gzip_name(args.output_transcripts)
+        args.output_symbols = gzip_name(args.output_symbols)
 
     return args
 
 
+def gzip_name(filename: str) -> str:
+    """Add a .gz extension to a file name, so that smart_open compresses it."""
+    return filename if filename.endswith(".gz") else f"{filename}.gz"
+
+
+def write_rows(
+    output: Any, batches: Iterable[Sequence[Tuple]], columns: Optional[List[int]] = None
+) -> int:
+    """
+    Write batches of rows to an open file as tab separated lines, one batch at a time.
+
+    Args:
+        output: the open file handle
+        batches: lists of row tuples, as yielded by MySQLWrapper.stream_sql_query
+        columns: the order in which to write the columns of each row, if not the query order.
+
+    Returns:
+        the number of rows written.
+
+    """
+    count = 0
+    for batch in batches:
+        if columns:
+            batch = [[row[column] for column in columns] for row in batch]
+        output.write("".join("\t".join(str(value) for value in row) + "\n" for row in batch))
+        count += len(batch)
+    return count
+
+
 class CanonicalTranscript(object):
-    """A simple class for storing Ensembl transcript data, as well as
-    supplemental data for gene id/symbols/synnonyms"""
+    """A simple class for exporting Ensembl transcript data, as well as
+    supplemental data for gene id/symbols/synnonyms.
+
+    The canonical transcript, gene symbol and synonym queries each run on their own connection, at
+    the same time, and their results are streamed from the server and written as they arrive, so
+    memory use doesn't depend on the size of the release.
+
+    Args:
+        host: the mysql host
+        port: the mysql port
+        user: the mysql user name
+        password: the mysql password
+        database: the Ensembl core database to export
+        connection_factory: a function taking the database name and returning a new
+            MySQLWrapper (or compatible object), for using a different connection type.
+
+    """
 
-    def __init__(self, host, port, user, password, database):
-        # needs to go into a config file, but for now:
-        self.exon_store = {}
+    def __init__(
+        self,
+        host: Optional[str],
+        port: Optional[int],
+        user: Optional[str],
+        password: Optional[str],
+        database: str,
+        connection_factory: Optional[Callable[[str], MySQLWrapper]] = None,
+    ) -> None:
+        self.database = database
+        if connection_factory is None:
 
-        self.mysql_wrapper = MySQLWrapper(
-            host=host, port=port, username=user, password=password, database=database
+            def connection_factory(database: str) -> MySQLWrapper:
+                return MySQLWrapper(
+                    host=host, port=port, username=user, password=password, database=database
+                )
+
+        self.connection_factory = connection_factory
+
+    def run_query(self, name: str, sql: str, filename: str, columns: List[int] = None) -> int:
+        """
+        Stream the results of one query into a file, on a new connection, logging progress.
+
+        Args:
+            name: the name used to report the query's progress
+            sql: the query
+            filename: the output file - compressed if it ends with .gz
+            columns: the order in which to write the columns, if not the query order.
+
+        Returns:
+            the number of rows written.
+
+        """
+        log.info(f"{self.database}: retrieving {name} data.")
+        start = time.perf_counter()
+        wrapper = self.connection_factory(self.database)
+        count = 0
+        try:
+            with smart_open(filename, 'w') as output:
+                for batch in wrapper.stream_sql_query(sql):
+                    count += write_rows(output, [batch], columns=columns)
+                    log.debug(f"{self.database}: {name} - {count:,} rows written.")
+        finally:
+            wrapper.close()
+        log.info(
+            f"{self.database}: {name} completed - {count:,} rows in "
+            f"{time.perf_counter() - start:.1f}s."
         )
+        return count
 
-        print("retrieving canonical transcript data.")
-        self.canonical_transcripts = self.mysql_wrapper.run_sql_query(CANONICAL_TRANSCRIPT_SQL)
+    def export(self, transcripts_filename: str, symbols_filename: str) -> Dict[str, int]:
+        """
+        Run the three queries concurrently, and write the transcript and symbol files.
 
-        print("retrieving gene symbol data.")
-        self.gene_symbols = self.mysql_wrapper.run_sql_query(GENE_SYMBOL_SQL)
+        The order of the symbol file is important - symbols contain duplicates, so make sure
+        the symbols are procesesed before synonyms.  The matching script
+        (ensembl_flat_file_reader.py) will ignore new symbols for translating to gene, if there's
+        already one accepted.  The symbols and synonyms are therefore written to temporary files,
+        and joined once both queries are done.
 
-        print("retrieving gene synonym data.")
-        self.gene_synonyms = self.mysql_wrapper.run_sql_query(GENE_SYNONYM_SQL)
+        Args:
+            transcripts_filename: the transcript output file - compressed if it ends with .gz
+            symbols_filename: the symbol output file - compressed if it ends with .gz
 
-        print("completed")
-        self.mysql_wrapper.close()
+        Returns:
+            the number of rows retrieved by each query.
 
+        """
+        with tempfile.TemporaryDirectory(prefix="edgePy_ensembl") as tempdir:
+            symbols_part = os.path.join(tempdir, "symbols.tsv")
+            synonyms_part = os.path.join(tempdir, "synonyms.tsv")
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                jobs = {
+                    "transcripts": executor.submit(
+                        self.run_query,
+                        "canonical transcript",
+                        CANONICAL_TRANSCRIPT_SQL,
+                        transcripts_filename,
+                    ),
+                    "symbols": executor.submit(
+                        self.run_query, "gene symbol", GENE_SYMBOL_SQL, symbols_part
+                    ),
+                    "synonyms": executor.submit(
+                        self.run_query, "gene synonym", GENE_SYNONYM_SQL, synonyms_part, [1, 0]
+                    ),
+                }
+                counts = {name: job.result() for name, job in jobs.items()}
 
-def main():
-    args = parse_arguments()
-    default_class = CanonicalTranscript(
-        args.host, args.port, args.username, args.password, args.database
-    )
-    canonical = default_class.canonical_transcripts
+            with smart_open(symbols_filename, 'w') as output:
+                for part in (symbols_part, synonyms_part):
+                    with open(part, 'r') as data:
+                        shutil.copyfileobj(data, output, COPY_BUFFER_SIZE)
+        return counts
 
-    with smart_open(args.output_transcripts, 'w') as output:
-        for transcript in canonical:
-            output.write(
-                f"{transcript['gene']}\t{transcript['transcript']}\t"
-                f"{transcript['length']}\t{transcript['canonical']}\n"
-            )
 
-    symbols = default_class.gene_symbols
-    synonyms = default_class.gene_synonyms
+def export_databases(
+    databases: List[str],
+    transcripts_filename: str,
+    symbols_filename: str,
+    workers: int = 2,
+    **kwargs: Any,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Export several Ensembl releases or species, workers databases at a time.
+
+    Args:
+        databases: the names of the Ensembl core databases
+        transcripts_filename: the transcript output file, with {database} in place of the name.
+        symbols_filename: the symbol output file, with {database} in place of the name.
+        workers: the number of databases to export at the same time.
+        kwargs: the connection arguments of CanonicalTranscript
+
+    Returns:
+        the number of rows retrieved by each query, for each database.
+
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        jobs = {
+            database: executor.submit(
+                CanonicalTranscript(database=database, **kwargs).export,
+                transcripts_filename.format(database=database),
+                symbols_filename.format(database=database),
+            )
+            for database in databases
+        }
+        counts = {database: job.result() for database, job in jobs.items()}
+    log.info(f"Exported {len(databases)} database(s) in {time.perf_counter() - start:.1f}s.")
+    return counts
 
-    with smart_open(args.output_symbols, 'w') as output:
-        """ The order here is important - symbols contain duplicates, so make sure the symbols
-        are procesesed before synonyms.  The matching script (ensembl_flat_file_reader.py) will ignore new symbols
-        for translating to gene, if there's already one accepted."""
 
-        for symbol in symbols:
-            output.write(f"{symbol['symbol']}\t{symbol['gene']}\n")
-        for synonym in synonyms:
-            output.write(f"{synonym['synonym']}\t{synonym['gene_id']}\n")
+def main():
+    args = parse_arguments()
+    export_databases(
+        args.database,
+        args.output_transcripts,
+        args.output_symbols,
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        user=args.username,
+        password=args.password,
+    )
 
 
 if __name__ == "__main__":
@@ -5,8 +5,11 @@ SQLAlchemy, but for the moment, it's probalby easiest just to make a simple libr
 """
 
 import pymysql
-from typing import List
-from pymysql.cursors import DictCursor
+from typing import Any, Iterator, List, Tuple
+from pymysql.cursors import DictCursor, SSCursor
+
+# Number of rows fetched from the server per round trip, when streaming.
+STREAM_BATCH_SIZE: int = 10000
 
 
 class MySQLWrapper(object):
@@ -25,6 +28,7 @@ class MySQLWrapper(object):
         self.database = database
         self.connection = pymysql.connect(
             host=self.host,
+            port=int(self.port) if self.port else 3306,
             user=self.username,
             password=self.password,
             db=self.database,
@@ -54,5 +58,33 @@ class MySQLWrapper(object):
             result = cursor.fetchall()
         return result
 
+    def _streaming_cursor(self) -> Any:
+        """An unbuffered cursor, which leaves the result set on the server until it is read."""
+        return self.connection.cursor(SSCursor)
+
+    def stream_sql_query(
+        self, sql: str, batch_size: int = STREAM_BATCH_SIZE
+    ) -> Iterator[List[Tuple]]:
+        """
+        Run a query and yield the results as lists of tuples, batch_size rows at a time, without
+        holding the whole result set in memory.  The connection can't be used for other queries
+        until the generator is exhausted or closed.
+
+        Args:
+            sql: the query to run
+            batch_size: the number of rows to fetch per batch
+
+        """
+        cursor = self._streaming_cursor()
+        try:
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield list(rows)
+        finally:
+            cursor.close()
+
     def close(self) -> None:
         self.connection.close()
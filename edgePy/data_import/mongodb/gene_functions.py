@@ -1,5 +1,7 @@
 """The core Python code for generating data."""
-from typing import Dict, Optional, List, Tuple, Any, Hashable
+from typing import Dict, Optional, List, Tuple, Any
+
+from edgePy.data_import.mongodb.symbol_index import SymbolIndex
 
 
 def get_genelist_from_file(filename: str) -> Optional[List]:
@@ -21,7 +23,10 @@ def get_genelist_from_file(filename: str) -> Optional[List]:
 
 
 def translate_genes(
-    genes: Optional[List[str]], mongo_reader: Any, database: str = "ensembl_90_37"
+    genes: Optional[List[str]],
+    mongo_reader: Any,
+    database: str = "ensembl_90_37",
+    symbol_index: Optional[SymbolIndex] = None,
 ) -> Tuple[List[str], Dict[str, str]]:
     """
     Functions to translate a list of genes in to ENGS symbols and vice versa.
@@ -30,15 +35,22 @@ def translate_genes(
         genes: list of genes to filter on.
         mongo_reader: the mongo connector
         database: the name of the database to use.  "pytest" for unit testimg (mocking)
+        symbol_index: the local symbol index to use for lookups.  If not provided, a temporary
+            one is filled from mongo, and closed afterwards.
 
     Returns:
         a list of ensg symbols, a list of gene symbols
     """
 
+    if symbol_index is None:
+        with SymbolIndex(mongo_reader, database=database) as temporary_index:
+            return translate_genes(
+                genes, mongo_reader, database=database, symbol_index=temporary_index
+            )
+
     ensg_genes = []
     non_ensg_genes = []
     gene_symbols = {}
-    query: Dict[Hashable, Any] = {}
 
     if genes:
         for gene in genes:
@@ -47,43 +59,44 @@ def translate_genes(
             else:
                 non_ensg_genes.append(gene)
     if ensg_genes or not genes:
-        if genes:
-            query["_id"] = {"$in": ensg_genes}
-        symbol_gene_list = mongo_reader.find_as_cursor(database, "symbol_by_ensg", query=query)
-        for symbol_gene in symbol_gene_list:
-            for symbol in symbol_gene["symbols"]:
-                gene_symbols[symbol_gene["_id"]] = symbol
+        symbols_by_ensg = (
+            symbol_index.get_symbols(ensg_genes) if genes else symbol_index.all_symbols()
+        )
+        for ensg, symbols in symbols_by_ensg.items():
+            gene_symbols[ensg] = symbols[-1]
         for ensg in ensg_genes:
             if ensg not in gene_symbols:
                 gene_symbols[ensg] = ensg
     if non_ensg_genes or not genes:
-        query = {"_id": {"$in": non_ensg_genes}} if genes else {}
-        translated_gene_list = mongo_reader.find_as_cursor(database, "ensg_by_symbol", query=query)
-        for trans_gene in translated_gene_list:
-            symbol = trans_gene["_id"]
-            ensgs = trans_gene["ensgs"]
-            for ensg in ensgs:
+        ensgs_by_symbol = (
+            symbol_index.get_ensgs(non_ensg_genes) if genes else symbol_index.all_ensgs()
+        )
+        for symbol in sorted(ensgs_by_symbol):
+            for ensg in ensgs_by_symbol[symbol]:
                 gene_symbols[ensg] = symbol
                 ensg_genes.append(ensg)
     return ensg_genes, gene_symbols
 
 
-def get_gene_list(mongo_reader: Any, database: str = "ensembl_90_37") -> Dict[str, str]:
+def get_gene_list(
+    mongo_reader: Any, database: str = "ensembl_90_37", symbol_index: Optional[SymbolIndex] = None
+) -> Dict[str, str]:
     """
     get the list of genes from the mongo database, to translated ensg ids to symbols.
 
     Args:
         mongo_reader: the mongo wrapper
         database: database name to use.
+        symbol_index: the local symbol index to use.  If not provided, a temporary one is
+            filled from mongo, and closed afterwards.
 
     """
 
-    genes = mongo_reader.find_as_cursor(database, "symbol_by_ensg", query={})
-    gene_symbols = {}
-    for symbol_gene in genes:
-        for symbol in symbol_gene["symbols"]:
-            gene_symbols[symbol_gene["_id"]] = symbol
-    return gene_symbols
+    if symbol_index is None:
+        with SymbolIndex(mongo_reader, database=database) as temporary_index:
+            return get_gene_list(mongo_reader, database=database, symbol_index=temporary_index)
+
+    return {ensg: symbols[-1] for ensg, symbols in symbol_index.all_symbols().items()}
 
 
 def get_sample_details(
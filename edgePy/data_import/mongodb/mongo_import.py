@@ -1,11 +1,12 @@
 import argparse
 from typing import Dict, Hashable, Any, Tuple, List, Optional, Union
 
-from edgePy.data_import.mongodb.mongo_wrapper import MongoWrapper
+from edgePy.data_import.mongodb.mongo_wrapper import MongoWrapper, DEFAULT_MAX_POOL_SIZE
 from edgePy.data_import.mongodb.gene_functions import get_canonical_rpkm
 from edgePy.data_import.mongodb.gene_functions import get_canonical_raw
 from edgePy.data_import.mongodb.gene_functions import get_genelist_from_file
 from edgePy.data_import.mongodb.gene_functions import translate_genes
+from edgePy.data_import.mongodb.symbol_index import SymbolIndex
 from edgePy.util import getLogger
 
 log = getLogger(name=__name__)
@@ -47,6 +48,8 @@ class ImportFromMongodb(object):
         mongo_key: a key in the samples collection to filter on
         mongo_value: accepted values in the samples collection to
         gene_list_file: a list of genes to filter the results on.
+        max_pool_size: the maximum number of connections in the shared mongo client's pool.
+        symbol_index: a local symbol index used to translate the gene list.
 
     """
 
@@ -57,16 +60,22 @@ class ImportFromMongodb(object):
         mongo_key: Optional[str],
         mongo_value: Union[str, List, None],
         gene_list_file: Optional[str],
+        max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
+        symbol_index: Optional[SymbolIndex] = None,
     ) -> None:
 
         self.mongo_host = host
         self.mongo_port = port
 
-        self.mongo_reader = MongoWrapper(host=self.mongo_host, port=self.mongo_port, connect=False)
+        self.mongo_reader = MongoWrapper(
+            host=self.mongo_host, port=self.mongo_port, max_pool_size=max_pool_size
+        )
 
         self.search_key = mongo_key
         self.search_value = mongo_value
 
+        self.symbol_index = symbol_index
+
         self.input_gene_file = gene_list_file
         self.gene_list: Optional[List[str]] = None
 
@@ -82,7 +91,7 @@ class ImportFromMongodb(object):
         if self.input_gene_file:
             input_genes = get_genelist_from_file(self.input_gene_file)
             ensg_genes, gene_symbols = translate_genes(
-                input_genes, self.mongo_reader, database=database
+                input_genes, self.mongo_reader, database=database, symbol_index=self.symbol_index
             )
             self.gene_list = ensg_genes
 
@@ -1,7 +1,9 @@
 """
 A simple library for wrapping around mongo collections and access issues.
 """
-from typing import Dict, Hashable, Any, Iterable, List, Union
+import os
+import threading
+from typing import Dict, Hashable, Any, Iterable, List, Tuple, Union
 
 import pymongo  # type: ignore
 from pymongo.errors import BulkWriteError  # type: ignore
@@ -11,6 +13,84 @@ from edgePy.util import getLogger
 
 log = getLogger(name=__name__)
 
+DEFAULT_MAX_POOL_SIZE: int = 100
+DEFAULT_MIN_POOL_SIZE: int = 0
+
+_clients: Dict[Tuple[str, int], Any] = {}
+_clients_pid: int = os.getpid()
+_clients_lock = threading.Lock()
+
+
+def get_client(
+    host: str,
+    port: Union[str, int] = 27017,
+    max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
+    min_pool_size: int = DEFAULT_MIN_POOL_SIZE,
+) -> Any:
+    """
+    Return the process-wide MongoClient for a host and port, creating it on first use.
+
+    MongoClient holds its own connection pool and is thread safe, so every wrapper in a process
+    shares the same client.  Clients are created with connect=False, so no sockets are opened
+    until the first operation, and the registry is emptied in forked children, as pymongo clients
+    must not be shared across a fork.  The pool sizes only apply when the client is created.
+
+    Args:
+        host: the name of the machine hosting the database
+        port: the port number (usually 27017)
+        max_pool_size: the maximum number of connections in the client's pool
+        min_pool_size: the number of connections the pool keeps open
+
+    Returns:
+        the shared pymongo.MongoClient
+
+    """
+    global _clients_pid
+
+    key = (host, int(port))
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            # fork without register_at_fork (eg. python < 3.7) - drop the parent's clients.
+            _clients.clear()
+            _clients_pid = os.getpid()
+        if key not in _clients:
+            _clients[key] = pymongo.MongoClient(
+                host=key[0],
+                port=key[1],
+                connect=False,
+                maxPoolSize=max_pool_size,
+                minPoolSize=min_pool_size,
+            )
+        return _clients[key]
+
+
+def close_clients() -> None:
+    """
+    Close every client in the registry, and empty it.  Use this on shutdown of the parent process.
+
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def _reset_clients_after_fork() -> None:
+    """
+    Forget the parent's clients in a forked child.  The clients are not closed, as their sockets
+    still belong to the parent process.
+
+    """
+    global _clients_lock, _clients_pid
+
+    _clients_lock = threading.Lock()
+    _clients.clear()
+    _clients_pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
 
 class MongoWrapper(object):
     """This class is for use as a thin layer for interactinvg with the Mongo Database
@@ -19,21 +99,33 @@ class MongoWrapper(object):
 
     This class should be used for efficient retrieval of information from the database.
 
+    Sessions are shared between all wrappers pointing at the same host and port - see
+    get_client.
+
     Args:
         host: the name of the machine hosting the database
         port: the port number (usually 27017
-        connect: whether to create the new session, or to attach to an existing session,
-            set to false, if this is being instantiated by a subprocesses.
+        connect: deprecated - clients always connect lazily, and are safe to use in subprocesses.
         verbose: suppresses output, when set to false.
+        max_pool_size: the maximum number of connections in the shared client's pool
+        min_pool_size: the number of connections the shared client's pool keeps open
 
     """
 
     def __init__(
-        self, host: str, port: Union[str, int] = 27017, connect: bool = True, verbose: bool = False
+        self,
+        host: str,
+        port: Union[str, int] = 27017,
+        connect: bool = True,
+        verbose: bool = False,
+        max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
+        min_pool_size: int = DEFAULT_MIN_POOL_SIZE,
     ) -> None:
         self.host = host
         self.port = int(port)
-        self.session = pymongo.MongoClient(host=self.host, port=self.port, connect=connect)
+        self.session = get_client(
+            self.host, self.port, max_pool_size=max_pool_size, min_pool_size=min_pool_size
+        )
         self.verbose = verbose
 
     def get_db(self, database: str, collection: str) -> Any:
@@ -179,15 +271,21 @@ class MongoInserter(MongoWrapper):
         port: the port number (usually 27017)
         database: db name
         collection: collection name
-        connect: whether to create the new session, or to attach to an existing session, set to false,
-        if this is being instantiated by a subprocesses.
+        connect: deprecated - clients always connect lazily, and are safe to use in subprocesses.
+        max_pool_size: the maximum number of connections in the shared client's pool
 
     """
 
     def __init__(
-        self, host: str, port: int, database: str, collection: str, connect: bool = True
+        self,
+        host: str,
+        port: int,
+        database: str,
+        collection: str,
+        connect: bool = True,
+        max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
     ) -> None:
-        MongoWrapper.__init__(self, host, port, connect=connect)
+        MongoWrapper.__init__(self, host, port, connect=connect, max_pool_size=max_pool_size)
         self.database = database
         self.collection = collection
         self.to_insert: List = []
@@ -247,15 +345,22 @@ class MongoUpdater(MongoWrapper):
             port: the port number (usually 27017
             database: db name
             collection: collection name
-            connect: whether to create the new session, or to attach to an existing session,
-                set to false, if this is being instantiated by a subprocesses.
+            connect: deprecated - clients always connect lazily, and are safe to use in
+                subprocesses.
+            max_pool_size: the maximum number of connections in the shared client's pool
 
         """
 
     def __init__(
-        self, host: str, port: int, database: str, collection: str, connect: bool = True
+        self,
+        host: str,
+        port: int,
+        database: str,
+        collection: str,
+        connect: bool = True,
+        max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
     ) -> None:
-        MongoWrapper.__init__(self, host, port, connect=connect)
+        MongoWrapper.__init__(self, host, port, connect=connect, max_pool_size=max_pool_size)
         self.database = database
         self.to_update: List[Any] = []
         self.mongo_col = self.get_db(database, collection)
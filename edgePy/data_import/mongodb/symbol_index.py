@@ -0,0 +1,294 @@
+"""
+A local, disk-backed index of ENSG ids and gene symbols, mirroring the symbol_by_ensg and
+ensg_by_symbol mongo collections, so that translating genes does not need to pull the collections
+from mongo on every run.
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from edgePy.util import getLogger
+
+log = getLogger(name=__name__)
+
+# Number of ids sent to mongo in a single $in query.
+MONGO_CHUNK_SIZE: int = 1000
+
+# Number of ids sent to sqlite in a single IN clause - kept below SQLITE_MAX_VARIABLE_NUMBER.
+SQLITE_CHUNK_SIZE: int = 500
+
+_SCHEMA = """
+create table if not exists symbol_by_ensg (ensg text, symbol text, position integer,
+    primary key (ensg, position));
+create table if not exists ensg_by_symbol (symbol text, ensg text, position integer,
+    primary key (symbol, position));
+create table if not exists known_ensg (ensg text primary key);
+create table if not exists known_symbol (symbol text primary key);
+create table if not exists metadata (key text primary key, value text);
+"""
+
+# Collection name, the field holding the list of values, the tables each collection maps to, and
+# the key column in those tables.
+_COLLECTIONS = {
+    "symbol_by_ensg": ("symbols", "symbol_by_ensg", "known_ensg", "ensg"),
+    "ensg_by_symbol": ("ensgs", "ensg_by_symbol", "known_symbol", "symbol"),
+}
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Split an iterable into lists of at most size items.
+
+    Args:
+        items: the items to split
+        size: the maximum length of each chunk
+
+    """
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SymbolIndex(object):
+    """
+    A sqlite backed copy of the symbol_by_ensg and ensg_by_symbol collections.  Lookups are served
+    from the local file, and any ids that have never been seen are fetched from mongo with chunked
+    $in queries and stored, so the index fills up incrementally.  build() copies the complete
+    collections once, after which no fallback queries are needed.
+
+    The connection stays open until close() is called, so callers should close the index, or use
+    it as a context manager, once they are done with it.
+
+    Args:
+        mongo_reader: the mongo wrapper, used to fill the index.
+        database: the name of the mongo database holding the collections.
+        filename: where to keep the index.  The default keeps it in memory for this process only.
+        chunk_size: the number of ids per $in query, when querying mongo.
+
+    """
+
+    def __init__(
+        self,
+        mongo_reader: Any,
+        database: str = "ensembl_90_37",
+        filename: Union[str, Path] = ":memory:",
+        chunk_size: int = MONGO_CHUNK_SIZE,
+    ) -> None:
+        self.mongo_reader = mongo_reader
+        self.database = database
+        self.filename = str(filename)
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """
+        Close the connection to the index file.
+
+        """
+        self.connection.close()
+
+    def __enter__(self) -> "SymbolIndex":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def is_complete(self, collection: str) -> bool:
+        """
+        Check whether a whole collection has been copied into the index.
+
+        Args:
+            collection: symbol_by_ensg or ensg_by_symbol
+
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "select value from metadata where key = ?", (f"complete_{collection}",)
+            ).fetchone()
+        return bool(row and row[0] == "1")
+
+    def build(self) -> None:
+        """
+        Copy both collections into the index, if that hasn't been done before.  Use refresh() to
+        pick up changes made to mongo since.
+
+        """
+        for collection in _COLLECTIONS:
+            if not self.is_complete(collection):
+                log.info(f"Building local {collection} index from mongo ({self.database})...")
+                cursor = self.mongo_reader.find_as_cursor(self.database, collection, query={})
+                self._store(collection, cursor, mark_complete=True)
+
+    def refresh(self) -> None:
+        """
+        Bring the index up to date with mongo.  Every document is pulled from each collection
+        again and overwrites the stored entry, so changed symbols are picked up, and ids that have
+        been removed from mongo are dropped.
+
+        """
+        for collection, (_, table, known_table, column) in _COLLECTIONS.items():
+            with self._lock:
+                local_ids = {
+                    row[0]
+                    for row in self.connection.execute(f"select distinct {column} from {table}")
+                }
+            remote_ids: Set[str] = set()
+
+            def documents() -> Iterator[Dict[str, Any]]:
+                for doc in self.mongo_reader.find_as_cursor(self.database, collection, query={}):
+                    remote_ids.add(doc["_id"])
+                    yield doc
+
+            self._store(collection, documents(), mark_complete=True)
+            removed = local_ids - remote_ids
+            if removed:
+                with self._lock, self.connection:
+                    for chunk in chunked(removed, SQLITE_CHUNK_SIZE):
+                        marks = ",".join("?" * len(chunk))
+                        self.connection.execute(
+                            f"delete from {table} where {column} in ({marks})", chunk
+                        )
+                        self.connection.execute(
+                            f"delete from {known_table} where {column} in ({marks})", chunk
+                        )
+            log.info(
+                f"Refreshed {collection} index: {len(remote_ids - local_ids)} added, "
+                f"{len(removed)} removed."
+            )
+
+    def get_symbols(self, ensgs: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Get the gene symbols for a list of ENSG ids.
+
+        Args:
+            ensgs: ENSG ids
+
+        Returns:
+            the list of symbols of each ENSG id found, in the order they are stored in mongo.
+
+        """
+        return self._lookup("symbol_by_ensg", ensgs)
+
+    def get_ensgs(self, symbols: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Get the ENSG ids for a list of gene symbols.
+
+        Args:
+            symbols: gene symbols
+
+        Returns:
+            the list of ENSG ids of each symbol found, in the order they are stored in mongo.
+
+        """
+        return self._lookup("ensg_by_symbol", symbols)
+
+    def all_symbols(self) -> Dict[str, List[str]]:
+        """
+        Get the symbols of every ENSG id, building the index first if required.
+
+        """
+        self.build()
+        return self._select_all("symbol_by_ensg")
+
+    def all_ensgs(self) -> Dict[str, List[str]]:
+        """
+        Get the ENSG ids of every gene symbol, building the index first if required.
+
+        """
+        self.build()
+        return self._select_all("ensg_by_symbol")
+
+    def _lookup(self, collection: str, keys: Iterable[str]) -> Dict[str, List[str]]:
+        _, table, known_table, column = _COLLECTIONS[collection]
+        keys = list(dict.fromkeys(keys))
+
+        if not self.is_complete(collection):
+            known: Set[str] = set()
+            with self._lock:
+                for chunk in chunked(keys, SQLITE_CHUNK_SIZE):
+                    marks = ",".join("?" * len(chunk))
+                    known.update(
+                        row[0]
+                        for row in self.connection.execute(
+                            f"select {column} from {known_table} where {column} in ({marks})",
+                            chunk,
+                        )
+                    )
+            self._fetch(collection, [key for key in keys if key not in known])
+
+        found: Dict[str, List[str]] = {}
+        with self._lock:
+            for chunk in chunked(keys, SQLITE_CHUNK_SIZE):
+                marks = ",".join("?" * len(chunk))
+                for key, value, _ in self.connection.execute(
+                    f"select * from {table} where {column} in ({marks}) "
+                    f"order by {column}, position",
+                    chunk,
+                ):
+                    found.setdefault(key, []).append(value)
+        return found
+
+    def _select_all(self, collection: str) -> Dict[str, List[str]]:
+        _, table, _, column = _COLLECTIONS[collection]
+        found: Dict[str, List[str]] = {}
+        with self._lock:
+            for key, value, _ in self.connection.execute(
+                f"select * from {table} order by {column}, position"
+            ):
+                found.setdefault(key, []).append(value)
+        return found
+
+    def _fetch(self, collection: str, keys: Iterable[str]) -> None:
+        """Query mongo for the given ids, in chunks, and store the results."""
+        for chunk in chunked(keys, self.chunk_size):
+            cursor = self.mongo_reader.find_as_cursor(
+                self.database, collection, query={"_id": {"$in": chunk}}
+            )
+            self._store(collection, cursor, searched=chunk)
+
+    def _store(
+        self,
+        collection: str,
+        documents: Iterable[Dict[str, Any]],
+        searched: Optional[List[str]] = None,
+        mark_complete: bool = False,
+    ) -> None:
+        """Write mongo documents to the index.  Searched ids are remembered, even if not found."""
+        field, table, known_table, column = _COLLECTIONS[collection]
+        with self._lock, self.connection:
+            for chunk in chunked(documents, SQLITE_CHUNK_SIZE):
+                self.connection.executemany(
+                    f"delete from {table} where {column} = ?", [(doc["_id"],) for doc in chunk]
+                )
+                self.connection.executemany(
+                    f"insert or replace into {table} values (?, ?, ?)",
+                    [
+                        (doc["_id"], value, position)
+                        for doc in chunk
+                        for position, value in enumerate(doc[field])
+                    ],
+                )
+                self.connection.executemany(
+                    f"insert or ignore into {known_table} values (?)",
+                    [(doc["_id"],) for doc in chunk],
+                )
+            if searched:
+                self.connection.executemany(
+                    f"insert or ignore into {known_table} values (?)", [(s,) for s in searched]
+                )
+        if mark_complete:
+            self._mark_complete(collection)
+
+    def _mark_complete(self, collection: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "insert or replace into metadata values (?, ?)", (f"complete_{collection}", "1")
+            )
@@ -0,0 +1,357 @@
+""" Competitive and self-contained gene set tests, for thousands of gene sets at once
+
+The gene sets are held as a sparse genes x sets indicator matrix, aligned with the genes of a
+DGEList, so the statistics of every set come from a few sparse matrix products.
+
+Wu and Smyth. 'Camera: a competitive gene set test accounting for inter-gene correlation.'
+Nucleic Acids Research, 2012. doi:10.1093/nar/gks461
+"""
+from typing import Dict, Iterable, List, Mapping, Optional, Union, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList, PRIOR_COUNT
+from edgePy.name_index import NameIndex
+from edgePy.top_table import p_adjust
+from edgePy.util import getLogger
+
+__all__ = [
+    "GeneSetIndex",
+    "read_gmt",
+    "camera",
+    "fry",
+    "squeeze_variances",
+    "GENE_SET_TABLE_DTYPE",
+]
+
+if TYPE_CHECKING:
+    from edgePy.data_import.ensembl.annotation_store import ReleaseDataStore
+    from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+
+    Annotation = Union[CanonicalDataStore, ReleaseDataStore]
+
+log = getLogger(name=__name__)
+
+# camera's default inter-gene correlation, since limma 3.29.6.
+INTER_GENE_CORRELATION: float = 0.01
+
+GENE_SET_TABLE_DTYPE = np.dtype(
+    [
+        ("name", object),
+        ("size", np.int64),
+        ("direction", object),
+        ("statistic", np.float64),
+        ("p_value", np.float64),
+        ("adj_p", np.float64),
+    ]
+)
+
+
+def read_gmt(filename: str) -> Dict[str, List[str]]:
+    """Read gene sets from a GMT file: one set per line, with the name, a description, and then
+    the genes, separated by tabs.
+
+    Args:
+        filename: the GMT file.
+
+    Returns:
+        the genes of each set, by name.
+
+    """
+    from smart_open import smart_open  # type: ignore
+
+    gene_sets = {}
+    with smart_open(filename, 'r') as handle:
+        for line in handle:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) > 2:
+                gene_sets[fields[0]] = [gene for gene in fields[2:] if gene]
+    return gene_sets
+
+
+class GeneSetIndex(object):
+    """A sparse genes x sets indicator matrix, aligned with a list of genes.
+
+    Set members are matched to the genes by name.  Given the Ensembl annotation, members that
+    don't match are also translated - symbols to their Ensembl gene ids, and gene ids to their
+    symbol - so sets of symbols can be used with data on gene ids, and the other way round.
+    Members matching no gene are dropped, and so are sets left with fewer than min_size genes.
+
+    Args:
+        genes: the genes, in the order of the data - eg. DGEList.genes.
+        gene_sets: the members of each set, by set name.
+        annotation: the Ensembl annotation - a CanonicalDataStore, or a release of a
+            MultiReleaseDataStore - to translate between symbols and gene ids.
+        min_size: the smallest set kept.
+
+    Examples:
+
+        >>> genes = ['G1', 'G2', 'G3', 'G4', 'G5', 'G6']
+        >>> gene_sets = {'first': ['G1', 'G2', 'G9'], 'second': ['G2', 'G5', 'G6']}
+        >>> index = GeneSetIndex(genes, gene_sets)
+        >>> index.sizes
+        array([2, 3])
+        >>> z = np.array([4.0, 3.0, 0.5, -0.5, -1.0, -2.0])
+        >>> index.set_means(z)
+        array([3.5, 0. ])
+        >>> camera(z, index).direction
+        array(['up', 'down'], dtype=object)
+
+    """
+
+    def __init__(
+        self,
+        genes: Union[Iterable[str], NameIndex],
+        gene_sets: Mapping[str, Iterable[str]],
+        annotation: Optional["Annotation"] = None,
+        min_size: int = 1,
+    ) -> None:
+        from scipy import sparse  # type: ignore
+
+        self.gene_index = genes if isinstance(genes, NameIndex) else NameIndex(genes)
+        translations = self._translations(gene_sets, annotation)
+
+        # Every member (and translation) of every set is looked up in one go.
+        names = list(gene_sets)
+        candidates: List[str] = []
+        set_numbers: List[int] = []
+        for number, name in enumerate(names):
+            members = list(gene_sets[name])
+            members += [other for member in members for other in translations.get(member, ())]
+            candidates += members
+            set_numbers += [number] * len(members)
+        rows = self.gene_index.get_indexer(candidates)
+        found = rows >= 0
+        matrix = sparse.csc_matrix(
+            (np.ones(found.sum()), (rows[found], np.array(set_numbers, dtype=np.int64)[found])),
+            shape=(len(self.gene_index), len(names)),
+        )
+        # Duplicate entries are summed - make them indicators again.
+        matrix.data[:] = 1
+        sizes = np.diff(matrix.indptr)
+        keep = np.flatnonzero(sizes >= max(min_size, 1))
+
+        self.names = np.array(names, dtype=object)[keep]
+        self.matrix = matrix[:, keep]
+        self.sizes = sizes[keep].astype(np.int64)
+        log.info(f"Indexed {len(self.names):,} of {len(gene_sets):,} gene sets.")
+
+    def _translations(
+        self, gene_sets: Mapping[str, Iterable[str]], annotation: Optional["Annotation"]
+    ) -> Dict[str, List[str]]:
+        """The other names of each set member that isn't one of the genes."""
+        if annotation is None:
+            return {}
+        members = {member for genes in gene_sets.values() for member in genes}
+        unknown = [member for member in members if member not in self.gene_index]
+        translations = {}
+        for member in unknown:
+            others = list(annotation.get_genes_from_symbol(member))
+            if annotation.is_known_gene(member):
+                others.append(annotation.get_symbol_from_gene(member))
+            if others:
+                translations[member] = others
+        return translations
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def set_means(self, values: np.ndarray) -> np.ndarray:
+        """The mean of some per-gene values over the genes of each set.
+
+        Args:
+            values: genes, or genes by columns.
+
+        Returns:
+            sets, or sets by columns.
+
+        """
+        sums = self.matrix.T @ values
+        return sums / (self.sizes if sums.ndim == 1 else self.sizes[:, np.newaxis])
+
+
+def _table(
+    index: GeneSetIndex, statistic: np.ndarray, p_values: np.ndarray, adjust_method: str
+) -> np.recarray:
+    """A gene set table, sorted by p-value."""
+    table = np.recarray(len(index), dtype=GENE_SET_TABLE_DTYPE)
+    table.name = index.names
+    table.size = index.sizes
+    table.direction = np.where(statistic < 0, "down", "up")
+    table.statistic = statistic
+    table.p_value = p_values
+    table.adj_p = p_adjust(p_values, adjust_method)
+    return table[np.argsort(p_values, kind="stable")]
+
+
+def camera(
+    statistics: np.ndarray,
+    index: GeneSetIndex,
+    inter_gene_correlation: float = INTER_GENE_CORRELATION,
+    df: Optional[Union[float, np.ndarray]] = None,
+    adjust_method: str = "BH",
+) -> np.recarray:
+    """A competitive test of every gene set, following limma's camera with a preset inter-gene
+    correlation: is the statistic of the genes in the set different from that of the others?
+
+    The set sums of the statistics come from one sparse product, and the two sample t statistic
+    of each set - its variance inflated by 1 + (size - 1) * correlation - is computed for all
+    sets at once.
+
+    Args:
+        statistics: a statistic for each gene, in the index's gene order - z-scores, or t
+            statistics with df.
+        index: the gene sets.
+        inter_gene_correlation: the assumed correlation between the genes of a set.
+        df: if given, the statistics are t statistics with these degrees of freedom, and are
+            converted to z-scores of the same tail probability.
+        adjust_method: the p_adjust method.
+
+    Returns:
+        a record array with the name, size, direction, statistic, p-value and adjusted p-value
+        of each set, by increasing p-value.
+
+    """
+    from scipy.stats import norm, t as t_distribution  # type: ignore
+
+    z = np.asarray(statistics, dtype=np.float64)
+    if len(z) != len(index.gene_index):
+        raise ValueError(f"{len(z)} statistics for {len(index.gene_index)} genes.")
+    if df is not None:
+        # Convert through the smaller tail, so extreme values keep their precision.
+        z = np.where(
+            z > 0, norm.isf(t_distribution.sf(z, df)), norm.ppf(t_distribution.cdf(z, df))
+        )
+
+    genes = len(z)
+    size = index.sizes.astype(np.float64)
+    mean = z.mean()
+    variance = z.var(ddof=1)
+    delta = genes / (genes - size) * (index.set_means(z) - mean)
+    pooled = ((genes - 1) * variance - delta ** 2 * size * (genes - size) / genes) / (genes - 2)
+    inflation = 1 + (size - 1) * inter_gene_correlation
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = delta / np.sqrt(pooled * (inflation / size + 1 / (genes - size)))
+    p_values = 2 * t_distribution.sf(np.abs(statistic), genes - 2)
+    return _table(index, statistic, p_values, adjust_method)
+
+
+def _effects(values: np.ndarray, in_group2: np.ndarray) -> np.ndarray:
+    """The effect of group2 against group1 and the residual effects of every gene - the data
+    rotated by the Q of the QR decomposition of the two group design, without the intercept."""
+    design = np.column_stack([np.ones(len(in_group2)), in_group2]).astype(np.float64)
+    q, r = np.linalg.qr(design, mode="complete")
+    effects = values @ q[:, 1:]
+    # The sign of the contrast effect follows the fold change.
+    effects[:, 0] *= np.sign(r[1, 1])
+    return effects
+
+
+def _trigamma_inverse(x: np.ndarray) -> np.ndarray:
+    """The inverse of the trigamma function, by limma's Newton iteration."""
+    from scipy.special import polygamma  # type: ignore
+
+    y = np.where(x > 1e-6, 0.5 + 1 / x, 1 / x)
+    for _ in range(50):
+        trigamma = polygamma(1, y)
+        step = trigamma * (1 - trigamma / x) / polygamma(2, y)
+        y = y + step
+        if np.all(-step / y < 1e-8):
+            break
+    return y
+
+
+def squeeze_variances(variances: np.ndarray, df: float) -> np.ndarray:
+    """Shrink the residual variances of the genes towards a common prior, as limma's
+    squeezeVar: the prior is fitted to the log variances by moments (fitFDist), and each gene
+    gets the posterior variance (d0 * s0^2 + df * s^2) / (d0 + df).
+
+    Args:
+        variances: the residual variance of each gene.
+        df: their residual degrees of freedom.
+
+    Returns:
+        the posterior variances.
+
+    """
+    from scipy.special import digamma, polygamma  # type: ignore
+
+    # Zero variances (eg. genes without counts) are kept off log(0), as limma does.
+    floor = 1e-5 * np.median(variances[variances > 0]) if (variances > 0).any() else 1.0
+    z = np.log(np.maximum(variances, floor))
+    e = z - digamma(df / 2) + np.log(df / 2)
+    mean = e.mean()
+    spread = e.var(ddof=1) - polygamma(1, df / 2)
+    if spread <= 0:
+        # No more spread than sampling alone gives - every gene gets the prior.
+        return np.full(len(variances), np.exp(mean))
+    prior_df = 2 * _trigamma_inverse(np.array(spread))
+    prior_variance = np.exp(mean + digamma(prior_df / 2) - np.log(prior_df / 2))
+    return (prior_df * prior_variance + df * variances) / (prior_df + df)
+
+
+def fry(
+    dge_list: DGEList,
+    group1: str,
+    group2: str,
+    index: GeneSetIndex,
+    prior_count: float = PRIOR_COUNT,
+    adjust_method: str = "BH",
+) -> np.recarray:
+    """A self-contained test of every gene set, following the direction test of limma's fry:
+    do the genes of the set, together, change between the groups?
+
+    The log2 CPMs are rotated into one effect of group2 against group1 and n - 2 residual
+    effects per gene, standardized by each gene's posterior standard deviation (see
+    squeeze_variances).  For each set,
+    the mean standardized effects over its genes come from one sparse product, and the squared
+    mean contrast effect is compared with the mean squared residual effects by an F test on 1
+    and n - 2 degrees of freedom.  Being based on the set's own samples, it accounts for any
+    correlation between its genes.
+
+    Args:
+        dge_list: the DGEList of raw counts.
+        group1: the first group.
+        group2: the second group.
+        index: the gene sets, aligned with the DGEList's genes.
+        prior_count: added to the CPMs before taking logs.
+        adjust_method: the p_adjust method.
+
+    Returns:
+        a record array with the name, size, direction, statistic (F) and p-values of each set,
+        by increasing p-value.
+
+    """
+    from scipy.stats import f as f_distribution  # type: ignore
+
+    if len(index.gene_index) != len(dge_list.genes):
+        raise ValueError("The gene set index must be built from the DGEList's genes.")
+    groups = np.asarray(dge_list.groups_list)
+    for group in (group1, group2):
+        if group not in groups:
+            raise KeyError(f"Group not found: {group}")
+    in_test = (groups == group1) | (groups == group2)
+    residual_df = in_test.sum() - 2
+    if residual_df < 1:
+        raise ValueError("fry needs at least three samples in the two groups.")
+
+    counts = np.asarray(dge_list.counts, dtype=np.float64)[:, in_test]
+    library_size = np.asarray(dge_list.effective_library_size, dtype=np.float64)[in_test]
+    values = np.log2(counts * (1e6 / library_size) + prior_count)
+    effects = _effects(values, groups[in_test] == group2)
+    # Standardized by the posterior standard deviations, as limma's fry does by default.  Each
+    # gene's own residual SD, estimated from the same effects, would distort the F test.
+    scale = np.sqrt(squeeze_variances((effects[:, 1:] ** 2).mean(axis=1), residual_df))
+    effects /= scale[:, np.newaxis]
+
+    means = index.set_means(effects)
+    residual = (means[:, 1:] ** 2).mean(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = means[:, 0] ** 2 / residual
+    p_values = f_distribution.sf(statistic, 1, residual_df)
+    table = _table(index, statistic, p_values, adjust_method)
+    # The F statistic has no sign, so the direction comes from the mean contrast effect.
+    direction = np.where(means[:, 0] < 0, "down", "up")
+    order = np.argsort(p_values, kind="stable")
+    table.direction = direction[order]
+    return table
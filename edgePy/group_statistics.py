@@ -0,0 +1,251 @@
+""" Per-group sufficient statistics of every gene, updated incrementally as samples come and go """
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList, PRIOR_COUNT
+from edgePy.util import getLogger
+
+__all__ = ["GroupStatistics", "VALUE_TYPES"]
+
+log = getLogger(name=__name__)
+
+# The values summarized: the counts themselves, or log2(CPM + prior_count) of each sample, with
+# CPMs from the library sizes alone.  The latter is not DGEList.log_cpm, which takes the natural
+# log of the CPMs and only replaces zeros with the prior count.
+VALUE_TYPES = ("counts", "log2_cpm_prior")
+
+
+class GroupStatistics(object):
+    """The number of samples, and the mean and sum of squared deviations (M2) of every gene, for
+    each group, along with the library size of each sample.
+
+    Samples are added and removed in batches, in O(genes x samples in the batch): the batch is
+    summarized on its own, and then merged into (or taken out of) its group with Chan et al.'s
+    pairwise update of Welford's algorithm, so the whole data set is never revisited.  Sums,
+    variances, and statistics built on them, such as welch_t, follow from the summaries.
+
+    Args:
+        genes: the number of genes.
+        value_type: 'counts', or 'log2_cpm_prior' for log2(CPM + prior_count) of each sample.
+        prior_count: added to every CPM before taking logs, for 'log2_cpm_prior'.
+
+    Examples:
+
+        >>> dge_list = DGEList(
+        ...     counts=np.array([[1, 3, 10], [4, 6, 2]]),
+        ...     samples=['A1', 'A2', 'B1'],
+        ...     genes=['G1', 'G2'],
+        ...     groups_in_list=['A', 'A', 'B'],
+        ... )
+        >>> statistics = GroupStatistics.from_dge_list(dge_list)
+        >>> statistics.mean('A')
+        array([2., 5.])
+        >>> statistics.add(np.array([[12], [4]]), ['B2'], ['B'])
+        >>> statistics.mean('B'), statistics.variance('B')
+        (array([11.,  3.]), array([2., 2.]))
+
+    """
+
+    def __init__(
+        self, genes: int, value_type: str = "counts", prior_count: float = PRIOR_COUNT
+    ) -> None:
+        if value_type not in VALUE_TYPES:
+            raise ValueError(f"value_type must be one of {VALUE_TYPES}, not {value_type}")
+        self.genes = genes
+        self.value_type = value_type
+        self.prior_count = prior_count
+        self.sample_groups: Dict[str, Hashable] = {}
+        self.library_sizes: Dict[str, float] = {}
+        self._n: Dict[Hashable, int] = {}
+        self._mean: Dict[Hashable, np.ndarray] = {}
+        self._m2: Dict[Hashable, np.ndarray] = {}
+
+    @classmethod
+    def from_dge_list(
+        cls, dge_list: DGEList, value_type: str = "counts", prior_count: float = PRIOR_COUNT
+    ) -> "GroupStatistics":
+        """Summarize the samples of a DGEList of raw counts.
+
+        Args:
+            dge_list: the DGEList.
+            value_type: 'counts' or 'log2_cpm_prior'.
+            prior_count: added to every CPM before taking logs, for 'log2_cpm_prior'.
+
+        Raises:
+            ValueError: if the DGEList has been transformed.
+
+        """
+        if dge_list.current_data_format or dge_list.current_log_status:
+            raise ValueError("GroupStatistics requires raw counts.")
+        statistics = cls(len(dge_list.genes), value_type=value_type, prior_count=prior_count)
+        statistics.add(dge_list.counts, dge_list.samples.tolist(), list(dge_list.groups_list))
+        return statistics
+
+    def copy(self) -> "GroupStatistics":
+        """A copy, which can be updated without changing this one."""
+        statistics = GroupStatistics(self.genes, self.value_type, self.prior_count)
+        statistics.sample_groups = dict(self.sample_groups)
+        statistics.library_sizes = dict(self.library_sizes)
+        statistics._n = dict(self._n)
+        statistics._mean = {group: mean.copy() for group, mean in self._mean.items()}
+        statistics._m2 = {group: m2.copy() for group, m2 in self._m2.items()}
+        return statistics
+
+    @property
+    def groups(self) -> List[Hashable]:
+        """The groups with samples, in order of first addition."""
+        return [group for group, n in self._n.items() if n > 0]
+
+    def _values(self, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The values summarized for a batch of samples, and their library sizes."""
+        counts = np.asarray(counts, dtype=np.float64)
+        if counts.ndim != 2 or counts.shape[0] != self.genes:
+            raise ValueError(f"counts must have {self.genes} rows, not shape {counts.shape}")
+        library_sizes = counts.sum(axis=0)
+        if self.value_type == "log2_cpm_prior":
+            return np.log2(counts * (1e6 / library_sizes) + self.prior_count), library_sizes
+        return counts, library_sizes
+
+    def _batches(
+        self, values: np.ndarray, groups: Sequence[Hashable]
+    ) -> List[Tuple[Hashable, int, np.ndarray, np.ndarray]]:
+        """The size, mean and M2 of the samples of each group in a batch."""
+        groups = np.asarray(groups, dtype=object)
+        batches = []
+        for group in dict.fromkeys(groups.tolist()):
+            group_values = values[:, groups == group]
+            mean = group_values.mean(axis=1)
+            m2 = ((group_values - mean[:, np.newaxis]) ** 2).sum(axis=1)
+            batches.append((group, group_values.shape[1], mean, m2))
+        return batches
+
+    def add(self, counts: np.ndarray, samples: Sequence[str], groups: Sequence[Hashable]) -> None:
+        """Add a batch of samples.
+
+        Args:
+            counts: the raw counts of the new samples, genes by samples.
+            samples: the sample names.
+            groups: the group of each sample.
+
+        Raises:
+            ValueError: if a sample has already been added.
+
+        """
+        if len(samples) != len(groups) or np.shape(counts)[1:] != (len(samples),):
+            raise ValueError("There must be one column of counts and one group per sample.")
+        repeated = [sample for sample in samples if sample in self.sample_groups]
+        if repeated or len(set(samples)) != len(samples):
+            raise ValueError(f"Samples already added: {repeated[:10]}")
+        values, library_sizes = self._values(counts)
+
+        for group, n_b, mean_b, m2_b in self._batches(values, groups):
+            n_a = self._n.get(group, 0)
+            if n_a == 0:
+                self._n[group], self._mean[group], self._m2[group] = n_b, mean_b, m2_b
+                continue
+            n = n_a + n_b
+            delta = mean_b - self._mean[group]
+            self._mean[group] = self._mean[group] + delta * (n_b / n)
+            self._m2[group] = self._m2[group] + m2_b + delta ** 2 * (n_a * n_b / n)
+            self._n[group] = n
+
+        self.sample_groups.update(zip(samples, groups))
+        self.library_sizes.update(zip(samples, library_sizes.tolist()))
+
+    def remove(self, counts: np.ndarray, samples: Sequence[str]) -> None:
+        """Remove a batch of samples, reversing add.
+
+        Args:
+            counts: the raw counts of the samples, genes by samples, as they were added.
+            samples: the sample names.
+
+        Raises:
+            KeyError: if a sample was never added.
+
+        """
+        if np.shape(counts)[1:] != (len(samples),):
+            raise ValueError("There must be one column of counts per sample.")
+        missing = [sample for sample in samples if sample not in self.sample_groups]
+        if missing:
+            raise KeyError(f"Samples not found: {missing[:10]}")
+        groups = [self.sample_groups[sample] for sample in samples]
+        values, _ = self._values(counts)
+
+        for group, n_b, mean_b, m2_b in self._batches(values, groups):
+            n = self._n[group]
+            n_a = n - n_b
+            if n_a == 0:
+                del self._n[group], self._mean[group], self._m2[group]
+                continue
+            mean_a = (self._mean[group] * n - mean_b * n_b) / n_a
+            delta = mean_b - mean_a
+            m2_a = self._m2[group] - m2_b - delta ** 2 * (n_a * n_b / n)
+            # Rounding can leave tiny negative values where the variance is zero.
+            self._n[group], self._mean[group], self._m2[group] = n_a, mean_a, np.maximum(m2_a, 0)
+
+        for sample in samples:
+            del self.sample_groups[sample]
+            del self.library_sizes[sample]
+
+    def _check_group(self, group: Hashable) -> None:
+        if not self._n.get(group):
+            raise KeyError(f"Group not found: {group}")
+
+    def n(self, group: Hashable) -> int:
+        """The number of samples in a group."""
+        self._check_group(group)
+        return self._n[group]
+
+    def mean(self, group: Hashable) -> np.ndarray:
+        """The mean of each gene over the samples of a group."""
+        self._check_group(group)
+        return self._mean[group]
+
+    def sum(self, group: Hashable) -> np.ndarray:
+        """The total of each gene over the samples of a group."""
+        self._check_group(group)
+        return self._mean[group] * self._n[group]
+
+    def variance(self, group: Hashable, ddof: int = 1) -> np.ndarray:
+        """The variance of each gene over the samples of a group.
+
+        Args:
+            group: the group name.
+            ddof: the delta degrees of freedom - 1 for the sample variance, 0 for the population.
+
+        """
+        self._check_group(group)
+        n = self._n[group]
+        if n <= ddof:
+            return np.full(self.genes, np.nan)
+        return self._m2[group] / (n - ddof)
+
+    def welch_t(self, group1: Hashable, group2: Hashable) -> Tuple[np.ndarray, np.ndarray]:
+        """Welch's t test of group2 against group1, for every gene, from the summaries alone.
+
+        Args:
+            group1: the first group.
+            group2: the second group.
+
+        Returns:
+            the t statistic and two-sided p-value of each gene.  Genes with no variance in
+            either group get a t of 0 and a p-value of 1.
+
+        """
+        from scipy.stats import t as t_distribution  # type: ignore
+
+        n1, n2 = self.n(group1), self.n(group2)
+        if n1 < 2 or n2 < 2:
+            raise ValueError("Welch's t test needs at least two samples in each group.")
+        se1 = self.variance(group1) / n1
+        se2 = self.variance(group2) / n2
+        se = se1 + se2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (self._mean[group2] - self._mean[group1]) / np.sqrt(se)
+            df = se ** 2 / (se1 ** 2 / (n1 - 1) + se2 ** 2 / (n2 - 1))
+        no_variance = se == 0
+        t[no_variance] = 0
+        df[no_variance] = 1
+        p_value = 2 * t_distribution.sf(np.abs(t), df)
+        return t, p_value
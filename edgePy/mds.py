@@ -0,0 +1,245 @@
+""" Sample coordinates for quality control: PCA and MDS of the most variable genes """
+from typing import Optional, Tuple
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList
+from edgePy.util import getLogger
+
+__all__ = ["SampleCoordinates", "pca", "mds", "top_variable_genes"]
+
+log = getLogger(name=__name__)
+
+# Prior count added to the CPMs before taking logs, as in limma's plotMDS.
+MDS_PRIOR_COUNT: float = 2.0
+
+# Above this many rows in the smaller Gram matrix, 'auto' uses randomized SVD.
+MAX_GRAM_SIZE: int = 2000
+
+METHODS = ("auto", "gram", "randomized")
+GENE_SELECTIONS = ("common", "pairwise")
+
+
+class SampleCoordinates(object):
+    """The coordinates of the samples of a PCA or MDS.
+
+    Attributes:
+        samples: the sample names.
+        coordinates: samples by dimensions.
+        variance_explained: the fraction of the variance of the selected genes along each
+            dimension.
+        genes: the genes used - None for MDS with pairwise gene selection.
+
+    """
+
+    def __init__(
+        self,
+        samples: np.ndarray,
+        coordinates: np.ndarray,
+        variance_explained: np.ndarray,
+        genes: Optional[np.ndarray] = None,
+    ) -> None:
+        self.samples = samples
+        self.coordinates = coordinates
+        self.variance_explained = variance_explained
+        self.genes = genes
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}("
+            f"num_samples={len(self.samples):,}, "
+            f"dimensions={self.coordinates.shape[1]})"
+        )
+
+
+def _log_cpm(dge_list: DGEList, prior_count: float) -> np.ndarray:
+    """log2(CPM + prior_count), with the effective library sizes, in one float array."""
+    values = np.array(dge_list.counts, dtype=np.float64)
+    values *= 1e6 / np.asarray(dge_list.effective_library_size, dtype=np.float64)
+    values += prior_count
+    return np.log2(values, out=values)
+
+
+def top_variable_genes(values: np.ndarray, top: int) -> np.ndarray:
+    """The rows with the largest variances, most variable first.
+
+    Args:
+        values: genes by samples.
+        top: the number of rows.
+
+    Returns:
+        the row numbers.
+
+    """
+    variances = values.var(axis=1)
+    if top < len(variances):
+        rows = np.argpartition(variances, len(variances) - top)[-top:]
+    else:
+        rows = np.arange(len(variances))
+    return rows[np.argsort(-variances[rows], kind="stable")]
+
+
+def _fix_signs(vectors: np.ndarray) -> np.ndarray:
+    """Flip each column so its largest component is positive, making results reproducible."""
+    largest = vectors[np.abs(vectors).argmax(axis=0), np.arange(vectors.shape[1])]
+    return vectors * np.where(largest < 0, -1, 1)
+
+
+def _randomized_svd(
+    values: np.ndarray, rank: int, oversample: int = 10, power_iterations: int = 4, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The leading singular vectors and values of a matrix, by Halko et al.'s randomized range
+    finder with power iterations.
+
+    Returns:
+        U (rows by rank), the singular values, and V (columns by rank).
+
+    """
+    generator = np.random.default_rng(seed)
+    size = min(rank + oversample, min(values.shape))
+    basis = values @ generator.standard_normal((values.shape[1], size))
+    for _ in range(power_iterations):
+        basis, _ = np.linalg.qr(basis)
+        basis, _ = np.linalg.qr(values.T @ basis)
+        basis = values @ basis
+    basis, _ = np.linalg.qr(basis)
+    u, singular_values, vt = np.linalg.svd(basis.T @ values, full_matrices=False)
+    return (basis @ u)[:, :rank], singular_values[:rank], vt[:rank].T
+
+
+def _sample_scores(
+    centred: np.ndarray, dimensions: int, method: str
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """The principal component scores of the samples (columns) of centred data, and the squared
+    singular values along with their total.
+
+    The Gram matrix of the smaller side - genes x genes or samples x samples - is formed with one
+    BLAS product and eigendecomposed, or for large data both sides are avoided with randomized
+    SVD.
+
+    """
+    genes, samples = centred.shape
+    total = float(np.einsum("ij,ij->", centred, centred))
+    if method == "auto":
+        method = "gram" if min(genes, samples) <= MAX_GRAM_SIZE else "randomized"
+
+    if method == "randomized":
+        _, singular_values, v = _randomized_svd(centred, dimensions)
+        return _fix_signs(v * singular_values), singular_values ** 2, total
+
+    if genes < samples:
+        eigenvalues, vectors = np.linalg.eigh(centred @ centred.T)
+        order = np.argsort(-eigenvalues)[:dimensions]
+        # The scores X'u are the sample coordinates, with lengths of the singular values.
+        scores = centred.T @ vectors[:, order]
+    else:
+        eigenvalues, vectors = np.linalg.eigh(centred.T @ centred)
+        order = np.argsort(-eigenvalues)[:dimensions]
+        scores = vectors[:, order] * np.sqrt(np.maximum(eigenvalues[order], 0))
+    return _fix_signs(scores), np.maximum(eigenvalues[order], 0), total
+
+
+def pca(
+    dge_list: DGEList,
+    top: int = 500,
+    dimensions: int = 2,
+    method: str = "auto",
+    prior_count: float = MDS_PRIOR_COUNT,
+) -> SampleCoordinates:
+    """Principal component analysis of the samples, on the log2 CPMs of the most variable genes.
+
+    The top genes are picked with argpartition and centred, and the sample scores come from
+    the eigendecomposition of the smaller Gram matrix (method 'gram'), or from randomized SVD
+    (method 'randomized').  'auto' uses the Gram matrix while it has at most MAX_GRAM_SIZE
+    rows.
+
+    Args:
+        dge_list: the DGEList of raw counts.
+        top: the number of most variable genes to use.
+        dimensions: the number of components.
+        method: 'auto', 'gram' or 'randomized'.
+        prior_count: added to the CPMs before taking logs.
+
+    Returns:
+        SampleCoordinates: the principal component scores of each sample.
+
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method}")
+    values = _log_cpm(dge_list, prior_count)
+    rows = top_variable_genes(values, top)
+    centred = values[rows]
+    centred -= centred.mean(axis=1, keepdims=True)
+    scores, squares, total = _sample_scores(centred, dimensions, method)
+    return SampleCoordinates(
+        samples=dge_list.samples,
+        coordinates=scores,
+        variance_explained=squares / total if total > 0 else np.zeros(len(squares)),
+        genes=dge_list.genes[rows],
+    )
+
+
+def _pairwise_distances(values: np.ndarray, top: int) -> np.ndarray:
+    """The root mean square of the top largest squared differences of each pair of samples -
+    limma's leading log fold change distance, with the genes chosen for each pair."""
+    samples = values.shape[1]
+    top = min(top, values.shape[0])
+    distances = np.zeros((samples, samples))
+    for sample in range(samples - 1):
+        squares = (values[:, sample + 1 :] - values[:, sample : sample + 1]) ** 2
+        if top < len(squares):
+            squares = np.partition(squares, len(squares) - top, axis=0)[-top:]
+        distances[sample, sample + 1 :] = np.sqrt(squares.mean(axis=0))
+    return distances + distances.T
+
+
+def mds(
+    dge_list: DGEList,
+    top: int = 500,
+    dimensions: int = 2,
+    gene_selection: str = "common",
+    method: str = "auto",
+    prior_count: float = MDS_PRIOR_COUNT,
+) -> SampleCoordinates:
+    """Multidimensional scaling of the samples by their leading log fold change distances, as
+    limma's plotMDS.
+
+    The distance between two samples is the root mean square of their log2 fold changes over
+    the top genes.  With 'common' gene selection the same top (most variable) genes are used
+    for every pair; the classical scaling of those distances is then the PCA of the genes
+    scaled by 1 / sqrt(top), so it's computed that way, without forming the distances.  With
+    'pairwise' selection each pair uses its own top genes, as plotMDS does by default; that
+    takes O(samples^2 x genes) time, so suits hundreds of samples rather than thousands.
+
+    Args:
+        dge_list: the DGEList of raw counts.
+        top: the number of genes each distance is based on.
+        dimensions: the number of dimensions.
+        gene_selection: 'common' or 'pairwise'.
+        method: how 'common' coordinates are computed - see pca.
+        prior_count: added to the CPMs before taking logs.
+
+    Returns:
+        SampleCoordinates: the coordinates of each sample.
+
+    """
+    if gene_selection not in GENE_SELECTIONS:
+        raise ValueError(f"gene_selection must be one of {GENE_SELECTIONS}, not {gene_selection}")
+    if gene_selection == "common":
+        result = pca(dge_list, top, dimensions, method=method, prior_count=prior_count)
+        result.coordinates /= np.sqrt(min(top, len(result.genes)))
+        return result
+
+    values = _log_cpm(dge_list, prior_count)
+    squared = _pairwise_distances(values, top) ** 2
+    # Classical scaling: double centre the squared distances, and take the leading eigenvectors.
+    squared -= squared.mean(axis=0, keepdims=True)
+    squared -= squared.mean(axis=1, keepdims=True)
+    eigenvalues, vectors = np.linalg.eigh(-squared / 2)
+    order = np.argsort(-eigenvalues)[:dimensions]
+    positive = np.maximum(eigenvalues, 0)
+    return SampleCoordinates(
+        samples=dge_list.samples,
+        coordinates=_fix_signs(vectors[:, order]) * np.sqrt(positive[order]),
+        variance_explained=positive[order] / positive.sum(),
+    )
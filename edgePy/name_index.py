@@ -0,0 +1,149 @@
+""" An ordered index of gene or sample names, used by DGEList for name lookups """
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+import numpy as np  # type: ignore
+
+__all__ = ["NameIndex"]
+
+
+class NameIndex(object):
+    """An ordered set of names, such as the genes or samples of a DGEList.
+
+    Each name is stored once, as a Python string in an object array, and its integer code is its
+    row (or column) number.  The name to code mapping is built on first use, and gives O(1)
+    lookups, so selecting rows by name doesn't need a scan of the names.  When a name is repeated,
+    lookups return its first position.
+
+    Args:
+        names: the names, in order.
+
+    Examples:
+
+        >>> index = NameIndex(["ENSG001", "ENSG002", "ENSG003"])
+        >>> index.get_loc("ENSG002")
+        1
+        >>> index.get_indexer(["ENSG003", "missing"])
+        array([ 2, -1])
+
+    """
+
+    def __init__(self, names: Union["NameIndex", Iterable[str]]) -> None:
+        if isinstance(names, NameIndex):
+            self._values = names._values
+            self._positions: Optional[Dict[str, int]] = names._positions
+            return
+
+        values = np.empty(0, dtype=object)
+        names = list(names)
+        if names:
+            values = np.empty(len(names), dtype=object)
+            values[:] = [str(name) for name in names]
+        values.setflags(write=False)
+        self._values = values
+        self._positions = None
+
+    @property
+    def values(self) -> np.ndarray:
+        """The names, as a read-only object array."""
+        return self._values
+
+    @property
+    def positions(self) -> Dict[str, int]:
+        """A dictionary from each name to its (first) position."""
+        if self._positions is None:
+            count = len(self._values)
+            self._positions = dict(zip(self._values[::-1], range(count - 1, -1, -1)))
+        return self._positions
+
+    @property
+    def is_unique(self) -> bool:
+        """True if no name is repeated."""
+        return len(self.positions) == len(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.positions
+
+    def __getitem__(self, position: int) -> str:
+        return self._values[position]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, NameIndex):
+            return NotImplemented
+        return self._values is other._values or np.array_equal(self._values, other._values)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(num_names={len(self):,})"
+
+    def get_loc(self, name: str) -> int:
+        """Get the position of a name.
+
+        Args:
+            name: the name to look up.
+
+        Raises:
+            KeyError: if the name is not in the index.
+
+        """
+        return self.positions[name]
+
+    def get_indexer(self, names: Iterable[str]) -> np.ndarray:
+        """Get the positions of several names, with -1 for names that are not in the index.
+
+        Args:
+            names: the names to look up.
+
+        Returns:
+            an integer array of positions, in the same order as names.
+
+        """
+        positions = self.positions
+        if isinstance(names, np.ndarray):
+            names = names.tolist()
+        return np.fromiter((positions.get(name, -1) for name in names), dtype=np.intp)
+
+    def take(self, positions: Union[np.ndarray, slice]) -> "NameIndex":
+        """Get a new index of the names at the given positions.
+
+        Args:
+            positions: integer positions, a boolean mask or a slice.
+
+        """
+        index = NameIndex(())
+        values = self._values[positions]
+        values.setflags(write=False)
+        index._values = values
+        return index
+
+    def union(self, *others: "NameIndex") -> "NameIndex":
+        """Get the names found in any of the indexes, in order of first appearance.
+
+        Args:
+            others: the indexes to combine with this one.
+
+        """
+        if all(other == self for other in others):
+            return self
+        names = dict.fromkeys(self._values.tolist())
+        for other in others:
+            names.update(dict.fromkeys(other._values.tolist()))
+        return NameIndex(names)
+
+    def intersection(self, *others: "NameIndex") -> "NameIndex":
+        """Get the names found in all of the indexes, in the order of this one.
+
+        Args:
+            others: the indexes to combine with this one.
+
+        """
+        if all(other == self for other in others):
+            return self
+        mask = np.ones(len(self), dtype=bool)
+        for other in others:
+            mask &= other.get_indexer(self._values) >= 0
+        return self.take(mask)
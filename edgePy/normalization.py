@@ -0,0 +1,106 @@
+""" Rank based normalizations of count matrices, computed a whole matrix (or chunk) at a time """
+from typing import Optional
+
+import numpy as np  # type: ignore
+
+__all__ = ["quantile_normalize", "rank_transform"]
+
+
+def _average_ties(sorted_values: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Average the targets over each run of tied values, within each column.
+
+    Args:
+        sorted_values: the values, sorted along each column.
+        targets: the value assigned to each position of the sorted columns, of the same shape.
+
+    Returns:
+        the targets, with every run of tied values given the mean of the run's targets.
+
+    """
+    rows, columns = sorted_values.shape
+    starts = np.ones(sorted_values.shape, dtype=bool)
+    starts[1:] = sorted_values[1:] != sorted_values[:-1]
+    if starts.all():
+        return targets
+    # Number the runs of all columns together, so one bincount averages every run at once.
+    runs = np.cumsum(starts.ravel(order="F")) - 1
+    totals = np.bincount(runs, weights=targets.ravel(order="F"))
+    sizes = np.bincount(runs)
+    return (totals / sizes)[runs].reshape((rows, columns), order="F")
+
+
+def _scatter(values: np.ndarray, order: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Give each value the target of its rank, averaging the targets of tied values."""
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    result = np.empty(values.shape, dtype=np.float64)
+    np.put_along_axis(result, order, _average_ties(sorted_values, targets), axis=0)
+    return result
+
+
+def quantile_normalize(counts: np.ndarray, chunk_size: Optional[int] = None) -> np.ndarray:
+    """Quantile normalize the columns of a matrix, so that every column has the same
+    distribution: the mean of the sorted columns.
+
+    Each column is sorted once, the sorted columns are averaged to give the reference
+    distribution, and each value is replaced with the reference value of its rank.  Tied values
+    within a column all get the mean of the reference values over their ranks, so they stay tied.
+
+    Args:
+        counts: genes by samples.
+        chunk_size: if given, work on this many columns at a time, to bound the memory used by
+            very wide matrices.  The columns are then sorted twice, once to build the reference
+            and once to scatter it back.
+
+    Returns:
+        the normalized values, genes by samples.
+
+    Examples:
+
+        >>> quantile_normalize(np.array([[5, 4], [2, 1], [3, 4]]))
+        array([[4.5, 4. ],
+               [1.5, 1.5],
+               [3.5, 4. ]])
+
+    """
+    counts = np.asarray(counts)
+    if chunk_size is None:
+        order = np.argsort(counts, axis=0, kind="stable")
+        reference = np.take_along_axis(counts, order, axis=0).mean(axis=1)
+        return _scatter(counts, order, np.repeat(reference[:, np.newaxis], counts.shape[1], 1))
+
+    reference = np.zeros(counts.shape[0])
+    for start in range(0, counts.shape[1], chunk_size):
+        reference += np.sort(counts[:, start : start + chunk_size], axis=0).sum(axis=1)
+    reference /= counts.shape[1]
+
+    result = np.empty(counts.shape, dtype=np.float64)
+    for start in range(0, counts.shape[1], chunk_size):
+        chunk = counts[:, start : start + chunk_size]
+        order = np.argsort(chunk, axis=0, kind="stable")
+        targets = np.repeat(reference[:, np.newaxis], chunk.shape[1], 1)
+        result[:, start : start + chunk_size] = _scatter(chunk, order, targets)
+    return result
+
+
+def rank_transform(counts: np.ndarray) -> np.ndarray:
+    """Replace each value with its rank within its column, from 1, giving tied values the
+    average of their ranks (as scipy.stats.rankdata's 'average' method).
+
+    Args:
+        counts: genes by samples.
+
+    Returns:
+        the ranks, genes by samples.
+
+    Examples:
+
+        >>> rank_transform(np.array([[5, 4], [2, 1], [3, 4]]))
+        array([[3. , 2.5],
+               [1. , 1. ],
+               [2. , 2.5]])
+
+    """
+    counts = np.asarray(counts)
+    order = np.argsort(counts, axis=0, kind="stable")
+    ranks = np.arange(1, counts.shape[0] + 1, dtype=np.float64)
+    return _scatter(counts, order, np.repeat(ranks[:, np.newaxis], counts.shape[1], 1))
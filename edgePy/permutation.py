@@ -0,0 +1,242 @@
+""" Permutation tests of the difference between two groups of a DGEList, for every gene at once """
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList, PRIOR_COUNT
+from edgePy.util import getLogger
+
+__all__ = ["PermutationTest", "PERMUTATION_TABLE_DTYPE"]
+
+log = getLogger(name=__name__)
+
+STATISTICS = ("mean_difference", "t")
+
+# Permutation batches per round - early stopping is checked between rounds.  Fixed, rather than
+# tied to the number of processes, so that results only depend on the seed.
+BATCHES_PER_ROUND: int = 8
+
+PERMUTATION_TABLE_DTYPE = np.dtype(
+    [
+        ("gene", object),
+        ("statistic", np.float64),
+        ("p_value", np.float64),
+        ("exceedances", np.int64),
+        ("permutations", np.int64),
+    ]
+)
+
+
+def _statistics(
+    values: np.ndarray, squares: np.ndarray, in_group1: np.ndarray, statistic: str
+) -> np.ndarray:
+    """Compute the statistic of every gene, for several labellings at once.
+
+    Args:
+        values: the data, genes by samples.
+        squares: the data squared, genes by samples - only used for the t statistic.
+        in_group1: 1 for the samples labelled as group1 and 0 otherwise, labellings by samples.
+        statistic: 'mean_difference' or 't'.
+
+    Returns:
+        the statistic of group2 against group1, genes by labellings.
+
+    """
+    n1 = in_group1[0].sum()
+    n2 = in_group1.shape[1] - n1
+    totals = values.sum(axis=1)[:, np.newaxis]
+    sum1 = values @ in_group1.T
+    mean1 = sum1 / n1
+    mean2 = (totals - sum1) / n2
+    if statistic == "mean_difference":
+        return mean2 - mean1
+
+    square_totals = squares.sum(axis=1)[:, np.newaxis]
+    square_sum1 = squares @ in_group1.T
+    var1 = np.maximum(square_sum1 - n1 * mean1 ** 2, 0) / (n1 - 1)
+    var2 = np.maximum(square_totals - square_sum1 - n2 * mean2 ** 2, 0) / (n2 - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (mean2 - mean1) / np.sqrt(var1 / n1 + var2 / n2)
+    return np.nan_to_num(t)
+
+
+def _count_exceedances(
+    values: np.ndarray,
+    observed: np.ndarray,
+    labels: np.ndarray,
+    statistic: str,
+    seed: np.random.SeedSequence,
+    batch_size: int,
+) -> np.ndarray:
+    """Count, for each gene, the permutations of a batch with a statistic at least as extreme as
+    the observed one.  Module level, so that it can run in worker processes.
+
+    Args:
+        values: the data of the genes still being tested, genes by samples.
+        observed: the absolute observed statistic of each of these genes.
+        labels: 1 for the samples of group1 and 0 for group2, in the true labelling.
+        statistic: 'mean_difference' or 't'.
+        seed: the seed of this batch's random stream.
+        batch_size: the number of permutations.
+
+    """
+    generator = np.random.default_rng(seed)
+    # Shuffle the labels of each row independently, by sorting random keys.
+    order = generator.random((batch_size, len(labels))).argsort(axis=1)
+    in_group1 = labels[order].astype(values.dtype)
+    squares = values ** 2 if statistic == "t" else values
+    permuted = np.abs(_statistics(values, squares, in_group1, statistic))
+    # A small tolerance, so that permutations equal to the observed labelling count as extreme.
+    return (permuted >= observed[:, np.newaxis] * (1 - 1e-9)).sum(axis=1)
+
+
+class PermutationTest(object):
+    """A two-sided permutation test of group2 against group1, for every gene of a DGEList.
+
+    The data are the log2 counts per million of each gene.  Permutations of the group labels
+    are generated in batches, and a whole batch is evaluated as one matrix product of the data
+    (genes by samples) with the permuted labels (samples by permutations).  Batches are spread
+    over worker processes, each with its own random stream spawned from one SeedSequence, so
+    results are reproducible for a given seed whatever the number of processes.
+
+    Genes that are clearly not significant stop early: once a gene has had stop_after
+    permutations as extreme as the observed statistic, it's dropped from later rounds, and if
+    that happens before the last round its p-value is estimated as exceedances / permutations
+    (Besag and Clifford's sequential procedure).  Other genes get (exceedances + 1) /
+    (permutations + 1).
+
+    Args:
+        dge_list: the DGEList to test.
+        group1: the name of the first group.
+        group2: the name of the second group.
+        statistic: 'mean_difference' of the log CPMs, or Welch's 't' statistic.
+        batch_size: the number of permutations evaluated in one matrix operation.
+        processes: the number of worker processes.  1 runs the batches in this process, and None
+            uses one per CPU.
+        seed: the seed of the random streams.
+        prior_count: added to the CPMs before taking logs.
+
+    Examples:
+
+        >>> dge_list = DGEList(
+        ...     counts=np.array([[10, 12, 11, 40, 42, 44], [20, 22, 21, 20, 22, 21]]),
+        ...     samples=['C1', 'C2', 'C3', 'T1', 'T2', 'T3'],
+        ...     genes=['G1', 'G2'],
+        ...     groups_in_list=['control'] * 3 + ['treated'] * 3,
+        ... )
+        >>> test = PermutationTest(dge_list, "control", "treated", batch_size=100, seed=42)
+        >>> test.observed().round(2)
+        array([ 0.96, -0.98])
+        >>> table = test.run(n_permutations=1000, stop_after=None)
+        >>> table.permutations
+        array([1600, 1600])
+
+    """
+
+    def __init__(
+        self,
+        dge_list: DGEList,
+        group1: str,
+        group2: str,
+        statistic: str = "mean_difference",
+        batch_size: int = 1000,
+        processes: Optional[int] = 1,
+        seed: Optional[int] = None,
+        prior_count: float = PRIOR_COUNT,
+    ) -> None:
+        if statistic not in STATISTICS:
+            raise ValueError(f"statistic must be one of {STATISTICS}, not {statistic}")
+        groups = np.asarray(dge_list.groups_list)
+        in_test = (groups == group1) | (groups == group2)
+        for group in (group1, group2):
+            size = (groups == group).sum()
+            if size == 0:
+                raise KeyError(f"Group not found: {group}")
+            if statistic == "t" and size < 2:
+                raise ValueError(f"The t statistic needs two samples in group {group}")
+
+        counts = np.asarray(dge_list.counts, dtype=np.float64)
+        cpm = counts * (1e6 / counts.sum(axis=0))
+        values = np.log2(cpm[:, in_test] + prior_count)
+        # Both statistics are unchanged by centring, which keeps the sums of squares accurate.
+        self.values = values - values.mean(axis=1)[:, np.newaxis]
+        self.labels = (groups[in_test] == group1).astype(np.int8)
+        self.genes = dge_list.genes
+        self.statistic = statistic
+        self.batch_size = batch_size
+        self.processes = processes
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+    def observed(self) -> np.ndarray:
+        """The statistic of each gene, with the true group labels."""
+        squares = self.values ** 2
+        in_group1 = self.labels[np.newaxis, :].astype(np.float64)
+        return _statistics(self.values, squares, in_group1, self.statistic)[:, 0]
+
+    def _run_round(
+        self, executor: Optional[ProcessPoolExecutor], active: np.ndarray, observed: np.ndarray
+    ) -> np.ndarray:
+        """Run one round of permutation batches for the active genes, and add up their counts."""
+        values = self.values[active]
+        seeds = self.seed_sequence.spawn(BATCHES_PER_ROUND)
+        arguments = (values, observed[active], self.labels, self.statistic)
+        if executor is None:
+            results = [_count_exceedances(*arguments, seed, self.batch_size) for seed in seeds]
+        else:
+            jobs = [
+                executor.submit(_count_exceedances, *arguments, seed, self.batch_size)
+                for seed in seeds
+            ]
+            results = [job.result() for job in jobs]
+        return np.sum(results, axis=0)
+
+    def run(self, n_permutations: int = 10000, stop_after: Optional[int] = 10) -> np.recarray:
+        """Run the permutations, and estimate the p-value of every gene.
+
+        Args:
+            n_permutations: the largest number of permutations per gene.  Rounded up to whole
+                rounds of batches.
+            stop_after: stop testing a gene once this many permutations are as extreme as the
+                observed statistic.  None to always run n_permutations.
+
+        Returns:
+            a record array with the gene, observed statistic, p-value, and the number of
+            extreme permutations and of permutations run, of each gene.
+
+        """
+        observed = self.observed()
+        magnitude = np.abs(observed)
+        exceedances = np.zeros(len(observed), dtype=np.int64)
+        permutations = np.zeros(len(observed), dtype=np.int64)
+        active = np.ones(len(observed), dtype=bool)
+        round_size = BATCHES_PER_ROUND * self.batch_size
+
+        executor = ProcessPoolExecutor(self.processes) if self.processes != 1 else None
+        try:
+            while active.any() and permutations[active].max() < n_permutations:
+                exceedances[active] += self._run_round(executor, active, magnitude)
+                permutations[active] += round_size
+                if stop_after is not None:
+                    active &= exceedances < stop_after
+                log.debug(f"{permutations.max():,} permutations - {active.sum():,} genes left.")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        table = np.recarray(len(observed), dtype=PERMUTATION_TABLE_DTYPE)
+        table.gene = self.genes
+        table.statistic = observed
+        table.exceedances = exceedances
+        table.permutations = permutations
+        # Genes reaching stop_after in the last round ran all the permutations, so they keep the
+        # usual estimate; only genes dropped before then stopped early.
+        full_run = -(-n_permutations // round_size) * round_size
+        stopped = permutations < full_run
+        table.p_value = np.where(
+            stopped,
+            exceedances / np.maximum(permutations, 1),
+            (exceedances + 1) / (permutations + 1),
+        )
+        log.info(f"Ran {permutations.max():,} permutations, {stopped.sum():,} stopped early.")
+        return table
@@ -0,0 +1,254 @@
+""" Writers for tables of results, which write the rows a chunk at a time as they are produced """
+import io
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np  # type: ignore
+
+from edgePy.util import getLogger
+
+__all__ = [
+    "ResultsWriter",
+    "TextResultsWriter",
+    "NpzResultsWriter",
+    "LogResultsWriter",
+    "open_results_writer",
+    "format_rows",
+]
+
+log = getLogger(name=__name__)
+
+# Rows formatted and written at a time.
+CHUNK_SIZE: int = 10000
+
+# Size of the write buffer placed in front of the output file.
+BUFFER_SIZE: int = 1 << 20
+
+# printf style formats of the top table fields - other fields are written with %s.
+DEFAULT_FORMATS: Dict[str, str] = {
+    "logFC": "%.2f",
+    "logCPM": "%.2f",
+    "mean1": "%.2f",
+    "mean2": "%.2f",
+    "p_value": "%.6g",
+    "adj_p": "%.6g",
+}
+
+OUTPUT_FORMATS = ("tsv", "npz")
+
+
+def format_rows(
+    table: np.ndarray, columns: Sequence[str], formats: Optional[Dict[str, str]] = None
+) -> List[str]:
+    """Format the rows of a record array as tab separated lines.
+
+    Each column is formatted as a whole, with np.char.mod, and the formatted columns are then
+    joined row by row.
+
+    Args:
+        table: the rows, as a record (structured) array.
+        columns: the fields to write, in order.
+        formats: printf style formats by field name.  DEFAULT_FORMATS are used if None.
+
+    Returns:
+        the lines, each ending with a newline.
+
+    """
+    formats = DEFAULT_FORMATS if formats is None else formats
+    formatted = [
+        np.char.mod(formats.get(column, "%s"), table[column]).tolist() for column in columns
+    ]
+    return ["\t".join(fields) + "\n" for fields in zip(*formatted)]
+
+
+class ResultsWriter(object):
+    """Base class of the results writers.  Use as a context manager, calling write() with each
+    chunk of rows as it is produced, so the whole result set is never held as text.
+
+    Args:
+        columns: the fields of the rows to write, in order.
+        header: the names to give the columns in the output.  The field names if None.
+        chunk_size: the number of rows formatted at a time.
+
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        header: Optional[Sequence[str]] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.columns = list(columns)
+        self.header = list(header) if header is not None else list(columns)
+        if len(self.header) != len(self.columns):
+            raise ValueError(f"{len(self.header)} header names for {len(self.columns)} columns")
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, table: np.ndarray) -> None:
+        """Write some rows, chunk_size rows at a time.
+
+        Args:
+            table: the rows, as a record array with (at least) the writer's columns.
+
+        """
+        for start in range(0, len(table), self.chunk_size):
+            chunk = table[start : start + self.chunk_size]
+            self._write_chunk(chunk)
+            self.rows_written += len(chunk)
+
+    def _write_chunk(self, chunk: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Finish writing the output."""
+        pass
+
+
+class TextResultsWriter(ResultsWriter):
+    """Write rows as tab separated text, through a large write buffer.  Files ending in .gz are
+    gzip compressed.
+
+    Args:
+        filename: the output file.
+        columns: the fields of the rows to write, in order.
+        header: the names to give the columns in the output.  The field names if None.
+        formats: printf style formats by field name.  DEFAULT_FORMATS are used if None.
+        chunk_size: the number of rows formatted at a time.
+        buffer_size: the size of the write buffer, in bytes.
+
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        columns: Sequence[str],
+        header: Optional[Sequence[str]] = None,
+        formats: Optional[Dict[str, str]] = None,
+        chunk_size: int = CHUNK_SIZE,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> None:
+        from smart_open import smart_open  # type: ignore
+
+        super().__init__(columns, header=header, chunk_size=chunk_size)
+        self.filename = filename
+        self.formats = formats
+        self._raw = smart_open(filename, 'wb')
+        self._handle = io.TextIOWrapper(
+            io.BufferedWriter(self._raw, buffer_size=buffer_size), encoding="utf-8"
+        )
+        self._handle.write("\t".join(self.header) + "\n")
+
+    def _write_chunk(self, chunk: np.ndarray) -> None:
+        self._handle.writelines(format_rows(chunk, self.columns, self.formats))
+
+    def close(self) -> None:
+        if not self._handle.closed:
+            self._handle.close()
+            log.info(f"Wrote {self.rows_written:,} rows to {self.filename}")
+
+
+class NpzResultsWriter(ResultsWriter):
+    """Write rows as a compressed NPZ file, with one array per column, for loading into other
+    tools without parsing text.  Text columns are stored as unicode arrays.  The chunks are
+    collected by column, and the file is written on close.
+
+    Args:
+        filename: the output file.
+        columns: the fields of the rows to write, in order.
+        header: the names to store the columns under.  The field names if None.
+        chunk_size: the number of rows collected at a time.
+
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        columns: Sequence[str],
+        header: Optional[Sequence[str]] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        super().__init__(columns, header=header, chunk_size=chunk_size)
+        self.filename = filename
+        self._chunks: Dict[str, List[np.ndarray]] = {column: [] for column in self.columns}
+        self._closed = False
+
+    def _write_chunk(self, chunk: np.ndarray) -> None:
+        for column in self.columns:
+            values = np.asarray(chunk[column])
+            if values.dtype == object:
+                values = values.astype(str)
+            self._chunks[column].append(values)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        arrays = {
+            name: np.concatenate(self._chunks[column]) if self._chunks[column] else np.array([])
+            for name, column in zip(self.header, self.columns)
+        }
+        from smart_open import smart_open  # type: ignore
+
+        with smart_open(self.filename, 'wb') as handle:
+            np.savez_compressed(handle, **arrays)
+        self._closed = True
+        log.info(f"Wrote {self.rows_written:,} rows to {self.filename}")
+
+
+class LogResultsWriter(ResultsWriter):
+    """Send rows to the log, one message per chunk rather than per row.
+
+    Args:
+        columns: the fields of the rows to write, in order.
+        header: the names to give the columns in the output.  The field names if None.
+        formats: printf style formats by field name.  DEFAULT_FORMATS are used if None.
+        chunk_size: the number of rows per log message.
+
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        header: Optional[Sequence[str]] = None,
+        formats: Optional[Dict[str, str]] = None,
+        chunk_size: int = 100,
+    ) -> None:
+        super().__init__(columns, header=header, chunk_size=chunk_size)
+        self.formats = formats
+        log.info("\t".join(self.header))
+
+    def _write_chunk(self, chunk: np.ndarray) -> None:
+        log.info("\n" + "".join(format_rows(chunk, self.columns, self.formats)).rstrip("\n"))
+
+
+def open_results_writer(
+    filename: Optional[str],
+    columns: Sequence[str],
+    header: Optional[Sequence[str]] = None,
+    output_format: Optional[str] = None,
+    **kwargs,
+) -> ResultsWriter:
+    """Create a results writer for a file, or for the log if there is no file.
+
+    Args:
+        filename: the output file, or None to log the results.
+        columns: the fields of the rows to write, in order.
+        header: the names to give the columns in the output.  The field names if None.
+        output_format: 'tsv' or 'npz'.  If None, npz is used for files ending in .npz.
+        kwargs: other arguments of the writer.
+
+    """
+    if filename is None:
+        return LogResultsWriter(columns, header=header, **kwargs)
+    if output_format is None:
+        output_format = "npz" if filename.endswith(".npz") else "tsv"
+    if output_format == "tsv":
+        return TextResultsWriter(filename, columns, header=header, **kwargs)
+    if output_format == "npz":
+        return NpzResultsWriter(filename, columns, header=header, **kwargs)
+    raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, not {output_format}")
@@ -0,0 +1,418 @@
+"""
+A long running analysis server, which keeps named DGELists and the Ensembl annotation in memory,
+and answers normalization, subset and differential expression requests about them over HTTP,
+with JSON requests and responses.
+
+Routes:
+
+    * GET /datasets - the loaded datasets
+    * POST /datasets - load a dataset: {"name": ..., "dge_file": ...} (see batch.load_dge_list)
+    * GET /datasets/<name> - the genes, samples and groups of a dataset
+    * DELETE /datasets/<name> - drop a dataset
+    * POST /datasets/<name>/subset - {"name": ..., "genes": [...], "samples": [...], "groups":
+      [...], "filter_by_expr": false} - keep a subset as a new dataset
+    * POST /datasets/<name>/normalize - {"method": "cpm" or "rpkm", "log": false, "genes": [...],
+      "limit": 100} - normalized values of some genes
+    * POST /datasets/<name>/de - {"contrasts": "pairwise", "cutoff": 0.05, "minimum_cpm": 1,
+      "p_adjust": "BH", "direction": "both", "top": 100} - KS test results
+    * POST /annotation - {"transcripts": ..., "symbols": ...} - load the Ensembl annotation, used
+      for rpkm and gene symbols
+"""
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList
+from edgePy.batch import load_dge_list
+from edgePy.contrasts import ContrastEngine
+from edgePy.top_table import filter_top_table, top_genes
+from edgePy.util import getLogger
+
+__all__ = ["AnalysisServer", "DatasetStore"]
+
+log = getLogger(name=__name__)
+
+DEFAULT_PORT: int = 8765
+
+# Rows returned by normalize when no genes are named.
+DEFAULT_LIMIT: int = 100
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """An HTTP server handling each request in its own thread - http.server's version of this
+    needs Python 3.7."""
+
+    daemon_threads = True
+
+
+class DatasetStore(object):
+    """Named DGELists held in memory, with least recently used eviction of idle datasets when
+    their total size goes over max_memory.  A dataset is idle when no request is using it.
+
+    Args:
+        max_memory: the memory budget for the datasets, in bytes.  Unlimited if None.
+
+    """
+
+    def __init__(self, max_memory: Optional[int] = None) -> None:
+        self.max_memory = max_memory
+        self._lock = threading.Lock()
+        self._datasets: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _size(entry: Dict[str, Any]) -> int:
+        """The memory used by a dataset's counts and cached values, and its contrast engine."""
+        dge_list = entry["dge_list"]
+        size = dge_list.counts.nbytes
+        size += sum(value.nbytes for value in dge_list._cache.values() if hasattr(value, "nbytes"))
+        engine = entry.get("engine")
+        if engine is not None:
+            size += sum(array.nbytes for array in engine._sorted.values())
+            size += sum(array.nbytes for array in engine._sums.values())
+        return size
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._datasets)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """The name, shape, size and last use of each dataset."""
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "genes": len(entry["dge_list"].genes),
+                    "samples": len(entry["dge_list"].samples),
+                    "bytes": self._size(entry),
+                    "idle_seconds": round(time.monotonic() - entry["last_used"], 3),
+                }
+                for name, entry in self._datasets.items()
+            ]
+
+    def total_size(self) -> int:
+        with self._lock:
+            return sum(self._size(entry) for entry in self._datasets.values())
+
+    def add(self, name: str, dge_list: DGEList) -> None:
+        """Add (or replace) a dataset, evicting idle ones if the budget is exceeded.
+
+        Args:
+            name: the name of the dataset.
+            dge_list: the data.
+
+        """
+        with self._lock:
+            self._datasets[name] = {
+                "dge_list": dge_list,
+                "engine": None,
+                "in_use": 0,
+                "last_used": time.monotonic(),
+            }
+            self._evict(keep=name)
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            del self._datasets[name]
+
+    def use(self, name: str) -> "_DatasetUse":
+        """Mark a dataset as in use, for a with block.  The block gets the dataset's entry.
+
+        Raises:
+            KeyError: if there is no such dataset.
+
+        """
+        return _DatasetUse(self, name)
+
+    def engine(self, entry: Dict[str, Any]) -> ContrastEngine:
+        """The contrast engine of a dataset, kept with it so its sorts are reused."""
+        with self._lock:
+            if entry["engine"] is None:
+                entry["engine"] = ContrastEngine(entry["dge_list"])
+            return entry["engine"]
+
+    def _acquire(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            if name not in self._datasets:
+                raise KeyError(f"Dataset not found: {name}")
+            entry = self._datasets[name]
+            entry["in_use"] += 1
+            entry["last_used"] = time.monotonic()
+            return entry
+
+    def _release(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            entry["in_use"] -= 1
+            entry["last_used"] = time.monotonic()
+            self._evict()
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Drop idle datasets, least recently used first, until the budget is met.  Call with
+        the lock held."""
+        if self.max_memory is None:
+            return
+        total = sum(self._size(entry) for entry in self._datasets.values())
+        idle = sorted(
+            (
+                (entry["last_used"], name)
+                for name, entry in self._datasets.items()
+                if entry["in_use"] == 0 and name != keep
+            )
+        )
+        for _, name in idle:
+            if total <= self.max_memory:
+                break
+            total -= self._size(self._datasets.pop(name))
+            log.info(f"Evicted idle dataset {name} - {total:,} bytes in use.")
+        if total > self.max_memory:
+            log.warning(f"{total:,} bytes of datasets in use, over the {self.max_memory:,} limit.")
+
+
+class _DatasetUse(object):
+    def __init__(self, store: DatasetStore, name: str) -> None:
+        self.store = store
+        self.name = name
+
+    def __enter__(self) -> Dict[str, Any]:
+        self.entry = self.store._acquire(self.name)
+        return self.entry
+
+    def __exit__(self, *exc_info) -> None:
+        self.store._release(self.entry)
+
+
+def _rows(table: np.ndarray, fields: List[str]) -> List[Dict[str, Any]]:
+    """Convert the rows of a record array to JSON-ready dictionaries."""
+    return [dict(zip(fields, row)) for row in table[fields].tolist()]
+
+
+class AnalysisServer(object):
+    """The analysis server.  Requests are handled in threads, at most max_concurrent at a time;
+    others wait up to queue_timeout seconds for a slot, and are then refused with a 503.
+
+    Args:
+        host: the address to listen on.  Keep the default to only accept local connections.
+        port: the port to listen on.  0 picks a free port - see address.
+        max_concurrent: the number of requests processed at once.
+        max_memory: the memory budget for datasets, in bytes.  Unlimited if None.
+        queue_timeout: how long a request waits for a slot, in seconds.
+
+    Examples:
+
+        >>> server = AnalysisServer(port=0).start()  # doctest: +SKIP
+        >>> server.address  # doctest: +SKIP
+        ('127.0.0.1', 54321)
+        >>> server.shutdown()  # doctest: +SKIP
+
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        max_concurrent: int = 4,
+        max_memory: Optional[int] = None,
+        queue_timeout: float = 30.0,
+    ) -> None:
+        self.datasets = DatasetStore(max_memory)
+        self.annotation: Any = None
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._thread: Optional[threading.Thread] = None
+        self._routes: List[Tuple[str, Any, Callable]] = [
+            ("GET", re.compile(r"^/datasets$"), self.list_datasets),
+            ("POST", re.compile(r"^/datasets$"), self.load_dataset),
+            ("GET", re.compile(r"^/datasets/([^/]+)$"), self.get_dataset),
+            ("DELETE", re.compile(r"^/datasets/([^/]+)$"), self.delete_dataset),
+            ("POST", re.compile(r"^/datasets/([^/]+)/subset$"), self.subset),
+            ("POST", re.compile(r"^/datasets/([^/]+)/normalize$"), self.normalize),
+            ("POST", re.compile(r"^/datasets/([^/]+)/de$"), self.differential_expression),
+            ("POST", re.compile(r"^/annotation$"), self.load_annotation),
+        ]
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """The host and port the server is listening on."""
+        host, port = self.httpd.server_address[:2]
+        return str(host), int(port)
+
+    def serve_forever(self) -> None:
+        log.info(f"Serving on http://{self.address[0]}:{self.address[1]}")
+        self.httpd.serve_forever()
+
+    def start(self) -> "AnalysisServer":
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def dispatch(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        """Route a request, holding a request slot, and turn errors into status codes."""
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, {"error": f"No route for {method} {path}"}
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            return 503, {"error": "Server busy"}
+        try:
+            return 200, handler(*match.groups(), **body)
+        except KeyError as error:
+            return 404, {"error": str(error).strip('"')}
+        except (ValueError, TypeError) as error:
+            return 400, {"error": str(error)}
+        except Exception as error:
+            log.exception(f"{method} {path} failed")
+            return 500, {"error": repr(error)}
+        finally:
+            self._slots.release()
+
+    def list_datasets(self) -> Any:
+        return {"datasets": self.datasets.describe(), "bytes": self.datasets.total_size()}
+
+    def load_dataset(self, name: str, **dataset: Any) -> Any:
+        self.datasets.add(name, load_dge_list(dataset))
+        return self.get_dataset(name)
+
+    def get_dataset(self, name: str) -> Any:
+        with self.datasets.use(name) as entry:
+            dge_list = entry["dge_list"]
+            return {
+                "name": name,
+                "genes": len(dge_list.genes),
+                "samples": dge_list.samples.tolist(),
+                "groups": {
+                    group: list(samples) for group, samples in dge_list.groups_dict.items()
+                },
+            }
+
+    def delete_dataset(self, name: str) -> Any:
+        self.datasets.remove(name)
+        return {"deleted": name}
+
+    def subset(
+        self,
+        source: str,
+        name: str,
+        genes: Optional[List[str]] = None,
+        samples: Optional[List[str]] = None,
+        groups: Optional[List[str]] = None,
+        filter_by_expr: bool = False,
+    ) -> Any:
+        with self.datasets.use(source) as entry:
+            dge_list = entry["dge_list"].select(genes=genes, samples=samples, groups=groups)
+        if filter_by_expr:
+            dge_list = dge_list.filter_by_expr()
+        self.datasets.add(name, dge_list)
+        return self.get_dataset(name)
+
+    def normalize(
+        self,
+        name: str,
+        method: str = "cpm",
+        log: bool = False,
+        genes: Optional[List[str]] = None,
+        limit: int = DEFAULT_LIMIT,
+    ) -> Any:
+        with self.datasets.use(name) as entry:
+            dge_list = entry["dge_list"]
+            if method == "cpm":
+                normalized = dge_list.cpm(transform_to_log=log)
+            elif method == "rpkm":
+                if self.annotation is None:
+                    raise ValueError("rpkm needs the annotation - POST it to /annotation first")
+                normalized = dge_list.rpkm(self.annotation, transform_to_log=log)
+            else:
+                raise ValueError(f"Unknown normalization method: {method}")
+        normalized = normalized.select(genes=genes if genes is not None else slice(0, limit))
+        return {
+            "genes": normalized.genes.tolist(),
+            "samples": normalized.samples.tolist(),
+            "values": normalized.counts.tolist(),
+        }
+
+    def differential_expression(
+        self,
+        name: str,
+        contrasts: Any = "pairwise",
+        cutoff: float = 0.05,
+        minimum_cpm: float = 1,
+        p_adjust: str = "BH",
+        direction: str = "both",
+        top: Optional[int] = DEFAULT_LIMIT,
+    ) -> Any:
+        with self.datasets.use(name) as entry:
+            engine = self.datasets.engine(entry)
+            if isinstance(contrasts, str):
+                contrasts = engine.contrasts(contrasts)
+            contrasts = [tuple(contrast) for contrast in contrasts]
+            table = engine.run(contrasts, adjust_method=p_adjust)
+        if self.annotation is not None:
+            symbols = [self.annotation.gene_to_symbol.get(gene, gene) for gene in table.gene]
+            table.symbol = symbols
+        table = filter_top_table(
+            table, p_value_cutoff=cutoff, minimum_mean=minimum_cpm, direction=direction
+        )
+
+        fields = ["gene", "symbol", "logFC", "logCPM", "mean1", "mean2", "p_value", "adj_p"]
+        results = {}
+        for group1, group2 in contrasts:
+            contrast = f"{group2}_vs_{group1}"
+            results[contrast] = _rows(top_genes(table[table.contrast == contrast], top), fields)
+        return {"name": name, "results": results}
+
+    def load_annotation(self, transcripts: str, symbols: str) -> Any:
+        from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+
+        self.annotation = CanonicalDataStore(transcripts, symbols)
+        return {"genes": len(self.annotation.canonical_transcript)}
+
+
+def _make_handler(server: AnalysisServer) -> Any:
+    """A request handler class bound to a server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self, method: str) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                if not isinstance(body, dict):
+                    raise ValueError("The request body must be a JSON object.")
+            except ValueError as error:
+                status, response = 400, {"error": f"Invalid JSON: {error}"}
+            else:
+                status, response = server.dispatch(method, self.path.split("?")[0], body)
+            data = json.dumps(response).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            self._handle("GET")
+
+        def do_POST(self) -> None:
+            self._handle("POST")
+
+        def do_DELETE(self) -> None:
+            self._handle("DELETE")
+
+        def log_message(self, format: str, *args: Any) -> None:
+            log.debug(format % args)
+
+    return Handler
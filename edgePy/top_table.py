@@ -0,0 +1,181 @@
+""" Tables of differential expression results, with multiple testing correction """
+from typing import Iterable, Optional, Sequence
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList, PRIOR_COUNT
+
+__all__ = ["p_adjust", "make_top_table", "filter_top_table", "top_genes", "TOP_TABLE_DTYPE"]
+
+# The columns of a top table, in display order.
+TOP_TABLE_DTYPE = np.dtype(
+    [
+        ("gene", object),
+        ("symbol", object),
+        ("logFC", np.float64),
+        ("logCPM", np.float64),
+        ("mean1", np.float64),
+        ("mean2", np.float64),
+        ("p_value", np.float64),
+        ("adj_p", np.float64),
+    ]
+)
+
+DIRECTIONS = ("up", "down", "both")
+
+
+def p_adjust(p_values: Iterable[float], method: str = "BH") -> np.ndarray:
+    """Adjust p-values for multiple testing, like R's p.adjust.
+
+    NaN p-values are left as NaN, and are not counted as tests.
+
+    Args:
+        p_values: the p-values to adjust.
+        method: 'BH' (Benjamini-Hochberg false discovery rate), 'holm' (family-wise error rate),
+            or 'none'.
+
+    Returns:
+        the adjusted p-values, in the same order.
+
+    Examples:
+
+        >>> p_adjust([0.01, 0.04, 0.03, 0.02])
+        array([0.04, 0.04, 0.04, 0.04])
+
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full(p_values.shape, np.nan)
+    tested = ~np.isnan(p_values)
+    p = p_values[tested]
+    n = len(p)
+
+    if method == "none" or n == 0:
+        adjusted[tested] = p
+    elif method == "BH":
+        # From the largest p-value down, the running minimum of p * n / rank.
+        order = np.argsort(p)[::-1]
+        ranks = np.arange(n, 0, -1)
+        values = np.minimum.accumulate(p[order] * n / ranks)
+        p = np.empty(n)
+        p[order] = np.minimum(values, 1.0)
+        adjusted[tested] = p
+    elif method == "holm":
+        # From the smallest p-value up, the running maximum of p * (n - rank + 1).
+        order = np.argsort(p)
+        values = np.maximum.accumulate(p[order] * np.arange(n, 0, -1))
+        p = np.empty(n)
+        p[order] = np.minimum(values, 1.0)
+        adjusted[tested] = p
+    else:
+        raise ValueError(f"Unknown p-value adjustment method: {method}")
+    return adjusted
+
+
+def make_top_table(
+    dge_list: DGEList,
+    p_values: Sequence[float],
+    group1: str,
+    group2: str,
+    symbols: Optional[Sequence[str]] = None,
+    adjust_method: str = "BH",
+    prior_count: float = PRIOR_COUNT,
+) -> np.recarray:
+    """Combine the p-values of a test of group1 against group2 with the summary statistics of
+    each gene, as a record array with one row per gene of the DGEList, in the DGEList's order.
+
+    The fields are:
+
+        * gene, symbol: the gene name, and its symbol (the gene name, if no symbols are given)
+        * logFC: log2 fold change of the mean count of group2 over group1
+        * logCPM: log2 of the average counts per million of the gene, over all samples
+        * mean1, mean2: the mean count of each group
+        * p_value, adj_p: the p-value, and the p-value adjusted for multiple testing
+
+    Args:
+        dge_list: the DGEList that was tested.
+        p_values: the p-value of each gene, in the order of the DGEList's genes.
+        group1: the name of the first group.
+        group2: the name of the second group.
+        symbols: the symbol of each gene, if known.
+        adjust_method: the p_adjust method.
+        prior_count: added to means and CPMs before taking logs, to avoid log(0).
+
+    Returns:
+        the top table, as a numpy record array.
+
+    """
+    counts = np.asarray(dge_list.counts, dtype=np.float64)
+    groups = np.asarray(dge_list.groups_list)
+    p_values = np.asarray(p_values, dtype=np.float64)
+    if len(p_values) != counts.shape[0]:
+        raise ValueError(f"{len(p_values)} p-values given for {counts.shape[0]} genes")
+
+    table = np.recarray(counts.shape[0], dtype=TOP_TABLE_DTYPE)
+    table.gene = dge_list.genes
+    table.symbol = dge_list.genes if symbols is None else symbols
+    table.mean1 = counts[:, groups == group1].mean(axis=1)
+    table.mean2 = counts[:, groups == group2].mean(axis=1)
+    table.logFC = np.log2(table.mean2 + prior_count) - np.log2(table.mean1 + prior_count)
+    table.logCPM = np.log2((counts * (1e6 / counts.sum(axis=0))).mean(axis=1) + prior_count)
+    table.p_value = p_values
+    table.adj_p = p_adjust(p_values, adjust_method)
+    return table
+
+
+def filter_top_table(
+    table: np.recarray,
+    p_value_cutoff: Optional[float] = None,
+    minimum_mean: Optional[float] = None,
+    direction: str = "both",
+    use_adjusted: bool = False,
+) -> np.recarray:
+    """Keep the rows of a top table passing every given filter.
+
+    Args:
+        table: a table made by make_top_table.
+        p_value_cutoff: keep genes with a p-value below this.
+        minimum_mean: discard genes for which no group has a mean of at least this.
+        direction: 'up' for genes higher in group2, 'down' for genes higher in group1, or 'both'.
+        use_adjusted: apply p_value_cutoff to the adjusted p-values.
+
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {DIRECTIONS}, not {direction}")
+
+    mask = np.ones(len(table), dtype=bool)
+    if p_value_cutoff is not None:
+        mask &= (table.adj_p if use_adjusted else table.p_value) < p_value_cutoff
+    if minimum_mean is not None:
+        mask &= (table.mean1 >= minimum_mean) | (table.mean2 >= minimum_mean)
+    if direction == "up":
+        mask &= table.mean1 < table.mean2
+    elif direction == "down":
+        mask &= table.mean1 > table.mean2
+    return table[mask]
+
+
+def top_genes(
+    table: np.recarray, n: Optional[int] = None, sort_by: str = "p_value"
+) -> np.recarray:
+    """Get the n best rows of a top table, in order.
+
+    Only the n best rows are sorted - they are found first with a partial sort, which is much
+    faster than sorting the whole table when n is small.
+
+    Args:
+        table: a table made by make_top_table.
+        n: the number of rows to return.  All, if None.
+        sort_by: the field to sort by, ascending.  For logFC, the largest absolute changes are
+            taken first.
+
+    """
+    key = np.abs(table.logFC) * -1 if sort_by == "logFC" else table[sort_by]
+    # NaN sorts last in both argpartition and argsort.
+    if n is None or n >= len(table):
+        order = np.argsort(key, kind="stable")
+    elif n <= 0:
+        order = np.arange(0)
+    else:
+        best = np.argpartition(key, n - 1)[:n]
+        order = best[np.argsort(key[best], kind="stable")]
+    return table[order]
@@ -0,0 +1,215 @@
+""" Precision weights for linear models of log-CPM, following limma's voom
+
+Law, Chen, Shi and Smyth. 'voom: precision weights unlock linear model analysis tools for
+RNA-seq read counts.' Genome Biology, 2014. doi:10.1186/gb-2014-15-2-r29
+"""
+from typing import Optional, Tuple
+
+import numpy as np  # type: ignore
+
+from edgePy.DGEList import DGEList
+from edgePy.util import getLogger
+
+__all__ = ["voom", "VoomResult", "binned_lowess", "group_design"]
+
+log = getLogger(name=__name__)
+
+# Points the lowess trend is evaluated at - it's interpolated linearly in between.
+LOWESS_POINTS: int = 200
+
+# Genes whose weights are computed at a time, bounding the temporary arrays.
+CHUNK_SIZE: int = 10000
+
+
+def binned_lowess(
+    x: np.ndarray,
+    y: np.ndarray,
+    span: float = 0.5,
+    points: int = LOWESS_POINTS,
+    iterations: int = 3,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """A lowess smooth, fitted at evenly spaced points and interpolated in between (like the
+    delta argument of R's lowess), with all points fitted at once.
+
+    For each point, the span * len(x) nearest values of x form a window - contiguous, as x is
+    sorted - found for every point with one searchsorted.  The local linear fits, with tricube
+    weights, are then computed for all windows together.  Each robustness iteration reweights
+    the data with bisquare weights of the residuals.
+
+    Args:
+        x: the x values.
+        y: the y values.
+        span: the fraction of the data in each local fit.
+        points: the number of points the smooth is fitted at.
+        iterations: the number of robust refits after the first fit, as in R's lowess.
+
+    Returns:
+        the points, and the smoothed value at each of them.
+
+    """
+    order = np.argsort(x, kind="stable")
+    x = np.asarray(x, dtype=np.float64)[order]
+    y = np.asarray(y, dtype=np.float64)[order]
+    n = len(x)
+    k = min(max(int(np.ceil(span * n)), 2), n)
+    grid = np.linspace(x[0], x[-1], min(points, n))
+
+    # The window [start, start + k) is the nearest one to a point once moving it right would
+    # drop a value closer than the one it adds, ie. past the midpoint of the two.
+    midpoints = (x[: n - k] + x[k:]) / 2
+    starts = np.searchsorted(midpoints, grid)
+    windows = starts[:, np.newaxis] + np.arange(k)
+    window_x = x[windows]
+    distance = np.abs(window_x - grid[:, np.newaxis])
+    width = np.maximum(distance.max(axis=1, keepdims=True), 1e-12)
+    local = (1 - np.clip(distance / width, 0, 1) ** 3) ** 3
+
+    robustness = np.ones(n)
+    for iteration in range(iterations + 1):
+        weights = local * robustness[windows]
+        window_y = y[windows]
+        total = np.maximum(weights.sum(axis=1), 1e-300)
+        mean_x = (weights * window_x).sum(axis=1) / total
+        mean_y = (weights * window_y).sum(axis=1) / total
+        centred = window_x - mean_x[:, np.newaxis]
+        spread = (weights * centred ** 2).sum(axis=1)
+        slope = np.where(
+            spread > 1e-12 * width[:, 0] ** 2,
+            (weights * centred * window_y).sum(axis=1) / np.maximum(spread, 1e-300),
+            0,
+        )
+        smoothed = mean_y + slope * (grid - mean_x)
+        if iteration < iterations:
+            residuals = y - np.interp(x, grid, smoothed)
+            scale = 6 * np.median(np.abs(residuals))
+            if scale == 0:
+                break
+            robustness = (1 - np.clip(np.abs(residuals) / scale, 0, 1) ** 2) ** 2
+    return grid, smoothed
+
+
+class VoomResult(object):
+    """The output of voom.
+
+    Attributes:
+        genes: the gene names.
+        samples: the sample names.
+        log_cpm: log2 counts per million, genes by samples.
+        weights: the precision weight of each observation, genes by samples.
+        design: the design matrix used, samples by coefficients.
+        library_size: the effective library size of each sample.
+        trend: the points and values of the fitted mean-variance trend - the square root of the
+            residual standard deviation, against the average log2 count.
+
+    """
+
+    def __init__(
+        self,
+        genes: np.ndarray,
+        samples: np.ndarray,
+        log_cpm: np.ndarray,
+        weights: np.ndarray,
+        design: np.ndarray,
+        library_size: np.ndarray,
+        trend: Tuple[np.ndarray, np.ndarray],
+    ) -> None:
+        self.genes = genes
+        self.samples = samples
+        self.log_cpm = log_cpm
+        self.weights = weights
+        self.design = design
+        self.library_size = library_size
+        self.trend = trend
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}("
+            f"num_samples={len(self.samples):,}, "
+            f"num_genes={len(self.genes):,})"
+        )
+
+
+def group_design(dge_list: DGEList) -> np.ndarray:
+    """A design matrix with one column per group, marking its samples - the group means."""
+    groups = np.asarray(dge_list.groups_list)
+    return np.column_stack(
+        [groups == group for group in dict.fromkeys(groups.tolist())]
+    ).astype(np.float64)
+
+
+def voom(
+    dge_list: DGEList,
+    design: Optional[np.ndarray] = None,
+    span: float = 0.5,
+    chunk_size: int = CHUNK_SIZE,
+) -> VoomResult:
+    """Compute log-CPM and the precision weight of every observation, from the mean-variance
+    trend of the genes.
+
+    The log-CPM are log2((count + 0.5) / (library size + 1) * 1e6), using the effective library
+    sizes (library size times norm factor).  A linear model is fitted to every gene at once,
+    with one least squares solve, and the square root of each gene's residual standard
+    deviation is smoothed against its average log2 count with binned_lowess.  The weight of
+    each observation is the trend at its fitted log2 count, to the power -4.
+
+    The log-CPM are built in one float array, converted in place, and the fitted values are
+    turned into weights in place, a chunk of genes at a time, so two genes by samples arrays are
+    allocated in all.
+
+    Args:
+        dge_list: the DGEList of raw counts.
+        design: the design matrix, samples by coefficients.  One column per group if None.
+        span: the fraction of genes used in each local fit of the trend.
+        chunk_size: the number of genes whose weights are computed at a time.
+
+    Returns:
+        VoomResult: the log-CPM, weights and trend.
+
+    Raises:
+        ValueError: for log data, or a design without residual degrees of freedom.
+
+    """
+    if dge_list.current_log_status:
+        raise ValueError("voom requires raw (non-log) counts.")
+    design = group_design(dge_list) if design is None else np.asarray(design, dtype=np.float64)
+    samples = len(dge_list.samples)
+    rank = np.linalg.matrix_rank(design)
+    if design.shape[0] != samples or rank >= samples:
+        raise ValueError(f"The design must have {samples} rows, and fewer independent columns.")
+
+    library_size = np.asarray(dge_list.effective_library_size, dtype=np.float64)
+    log_cpm = np.array(dge_list.counts, dtype=np.float64)
+    log_cpm += 0.5
+    log_cpm *= 1e6 / (library_size + 1)
+    np.log2(log_cpm, out=log_cpm)
+
+    # Least squares for every gene: the residual sum of squares is y.y - beta.(X'y), so the
+    # residuals are never formed.
+    coefficients = log_cpm @ np.linalg.pinv(design).T
+    residual_ss = np.einsum("ij,ij->i", log_cpm, log_cpm)
+    residual_ss -= np.einsum("ij,ij->i", coefficients, log_cpm @ design)
+    sigma = np.sqrt(np.maximum(residual_ss, 0) / (samples - rank))
+
+    # The trend is fitted without genes that have no counts.
+    expressed = np.asarray(dge_list.counts).any(axis=1)
+    log_library = np.log2(library_size + 1)
+    average_log_count = log_cpm.mean(axis=1) + log_library.mean() - np.log2(1e6)
+    trend = binned_lowess(average_log_count[expressed], np.sqrt(sigma[expressed]), span=span)
+
+    weights = np.empty_like(log_cpm)
+    for start in range(0, len(log_cpm), chunk_size):
+        block = weights[start : start + chunk_size]
+        np.matmul(coefficients[start : start + chunk_size], design.T, out=block)
+        block += log_library - np.log2(1e6)
+        block[...] = np.interp(block, *trend)
+        np.power(block, -4, out=block)
+
+    return VoomResult(
+        genes=dge_list.genes,
+        samples=dge_list.samples,
+        log_cpm=log_cpm,
+        weights=weights,
+        design=design,
+        library_size=library_size,
+        trend=trend,
+    )
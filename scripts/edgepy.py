@@ -3,21 +3,48 @@ from typing import List, Dict, Hashable, Any
 import configparser
 
 import numpy as np
-from scipy.stats import ks_2samp
-from smart_open import smart_open  # type: ignore
 
 
 from edgePy.DGEList import DGEList
-from edgePy.data_import.mongodb.mongo_import import ImportFromMongodb
+from edgePy.contrasts import CONTRAST_KINDS, ContrastEngine
+from edgePy.top_table import make_top_table, filter_top_table, top_genes
+from edgePy.results_writer import OUTPUT_FORMATS, format_rows, open_results_writer
 from edgePy.util import getLogger
 
 log = getLogger(name="script")
 
+# The top table fields written to the results.
+RESULT_COLUMNS = ["gene", "symbol", "p_value", "adj_p", "logFC", "mean1", "mean2"]
+CONTRAST_COLUMNS = ["contrast"] + RESULT_COLUMNS
+
 
 def parse_arguments(parser=None):
     if not parser:
         parser = argparse.ArgumentParser()
 
+    parser.add_argument(
+        "--manifest",
+        help="a JSON or YAML manifest of datasets and contrasts, to run as one batch",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="number of manifest jobs to run at once"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="run an analysis server, keeping datasets in memory between requests",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address the server listens on")
+    parser.add_argument("--port", type=int, default=8765, help="port the server listens on")
+    parser.add_argument(
+        "--max_memory",
+        type=float,
+        default=None,
+        help="memory budget of the server's datasets, in MB - idle datasets are evicted over it",
+    )
+    parser.add_argument(
+        "--max_requests", type=int, default=4, help="number of requests the server runs at once"
+    )
     parser.add_argument("--count_file", help="name of the count file")
     parser.add_argument("--groups_file", help="name of the groups file")
     parser.add_argument("--dge_file", help="import from .dge file;")
@@ -30,6 +57,11 @@ def parse_arguments(parser=None):
     parser.add_argument("--mongo_key_name", default="Project")
     parser.add_argument("--mongo_key_value", default="RNA-Seq1")
     parser.add_argument("--database_name")
+    parser.add_argument(
+        "--symbol_index",
+        default=":memory:",
+        help="file for the local gene symbol index, reused between runs.",
+    )
     parser.add_argument(
         "--group1_sample_names", nargs='+', help="List of samples names for first group"
     )
@@ -40,10 +72,39 @@ def parse_arguments(parser=None):
         "--groups_json", help="A JSON file with the group names, and list of samples. see example."
     )
 
-    parser.add_argument("--output", help="optional output file for results")
-    parser.add_argument("--cutoff", help="p-value cutoff to accept.", default=0.05)
     parser.add_argument(
-        "--minimum_cpm", help="discard results for which no group has this many counts", default=1
+        "--contrasts",
+        choices=CONTRAST_KINDS,
+        default=None,
+        help="test every pair of groups, or each group against the rest, instead of two groups",
+    )
+    parser.add_argument(
+        "--output", help="optional output file for results - gzipped if it ends with .gz"
+    )
+    parser.add_argument(
+        "--output_format",
+        choices=OUTPUT_FORMATS,
+        default=None,
+        help="tsv, or npz (one array per column).  Taken from the output file name if not given.",
+    )
+    parser.add_argument("--cutoff", type=float, help="p-value cutoff to accept.", default=0.05)
+    parser.add_argument(
+        "--minimum_cpm",
+        type=float,
+        help="discard results for which no group has this many counts",
+        default=1,
+    )
+    parser.add_argument(
+        "--p_adjust",
+        choices=["BH", "holm", "none"],
+        default="BH",
+        help="multiple testing correction for the adjusted p-values",
+    )
+    parser.add_argument(
+        "--direction",
+        choices=["up", "down", "both"],
+        default="up",
+        help="report genes higher in the second group (up), the first group (down), or both",
     )
 
     args = parser.parse_args()
@@ -55,6 +116,7 @@ class EdgePy(object):
     def __init__(self, args):
 
         self.dge_list = None
+        self.symbol_index = None
 
         if args.dge_file:
             self.dge_list = DGEList(filename=args.dge_file)
@@ -63,6 +125,12 @@ class EdgePy(object):
         elif args.mongo_config:
             # This section is only useful for MongoDB based analyses.  Talk to @apfejes about this section if you have
             # any questions.
+            from edgePy.data_import.mongodb.mongo_import import ImportFromMongodb
+            from edgePy.data_import.mongodb.mongo_wrapper import (
+                DEFAULT_MAX_POOL_SIZE,
+                MongoWrapper,
+            )
+            from edgePy.data_import.mongodb.symbol_index import SymbolIndex
 
             config = configparser.ConfigParser()
             config.read(args.mongo_config)
@@ -77,12 +145,24 @@ class EdgePy(object):
             else:
                 raise ValueError("Insufficient parameters for use of Mongodb")
 
+            host = config.get("Mongo", "host")
+            port = config.get("Mongo", "port")
+            max_pool_size = config.getint("Mongo", "max_pool_size", fallback=DEFAULT_MAX_POOL_SIZE)
+            # The index is built first, so the gene list is translated with it too.  The
+            # wrappers share one client per host and port.
+            self.symbol_index = SymbolIndex(
+                MongoWrapper(host=host, port=port, max_pool_size=max_pool_size),
+                database='ensembl_90_37',
+                filename=args.symbol_index,
+            )
             mongo_importer = ImportFromMongodb(
-                host=config.get("Mongo", "host"),
-                port=config.get("Mongo", "port"),
+                host=host,
+                port=port,
                 mongo_key=key,
                 mongo_value=value,
                 gene_list_file=args.gene_list,
+                max_pool_size=max_pool_size,
+                symbol_index=self.symbol_index,
             )
 
             sample_list, data_set, gene_list, sample_category = mongo_importer.get_data_from_mongo(
@@ -109,18 +189,18 @@ class EdgePy(object):
                 category_to_samples=sample_category_dict,
             )
 
-            self.ensg_to_symbol = mongo_importer.mongo_reader.find_as_dict(
-                'ensembl_90_37', "symbol_by_ensg", query={}
-            )
-
         else:
             self.dge_list = DGEList.create_DGEList_data_file(
                 data_file=args.counts_file, group_file=args.groups_file
             )
 
         self.output = args.output if args.output else None
+        self.output_format = args.output_format
         self.p_value_cutoff = args.cutoff
         self.minimum_cpm = args.minimum_cpm
+        self.adjust_method = args.p_adjust
+        self.direction = args.direction
+        self.contrasts = args.contrasts
 
     def run_ks(self):
         """
@@ -136,17 +216,15 @@ class EdgePy(object):
 
         gene_details, gene_likelyhood1, group_types = self.ks_2_samples()
 
-        results = self.generate_results(
-            gene_details, gene_likelyhood1, group_types[0], group_types[1]
-        )
+        table = self.select_results(gene_likelyhood1, group_types[0], group_types[1])
 
-        if self.output:
-            with smart_open(self.output, 'w') as out:
-                out.writelines(results)
-            log.info(f"Wrote to {self.output}")
-        else:
-            for line in results:
-                log.info(line)
+        with open_results_writer(
+            self.output,
+            RESULT_COLUMNS,
+            header=self.result_header(group_types[0], group_types[1]),
+            output_format=self.output_format,
+        ) as writer:
+            writer.write(table)
 
     def ks_2_samples(self):
         """Run a 2-tailed Kolmogorov-Smirnov test on the DGEList object.
@@ -160,27 +238,112 @@ class EdgePy(object):
             group_types: list of the groups in order.
 
         """
-        gene_likelihood1: Dict[Hashable, float] = {}
-        group_types = set(self.dge_list.groups_list)
-        group_types = list(group_types)
-        group_filters: Dict[Hashable, Any] = {}
-        gene_details: Dict[Hashable, Dict[Hashable, Any]] = {}
-        for group in group_types:
-            group_filters[group] = [g == group for g in self.dge_list.groups_list]
-        for gene_idx, gene in enumerate(self.dge_list.genes):
-            gene_row = self.dge_list.counts[gene_idx]
-            if len(group_types) == 2:
-                group_data1 = gene_row.compress(group_filters[group_types[0]])
-                mean1 = np.mean(group_data1)
-
-                group_data2 = gene_row.compress(group_filters[group_types[1]])
-                mean2 = np.mean(group_data2)
-
-                gene_likelihood1[gene] = ks_2samp(group_data1, group_data2)[1]
-
-                gene_details[gene] = {'mean1': mean1, 'mean2': mean2}
+        engine = ContrastEngine(self.dge_list)
+        group_types = engine.group_names
+        if len(group_types) != 2:
+            raise ValueError(
+                f"The KS test needs exactly two groups, but there are {len(group_types)} - use "
+                f"--contrasts to compare more."
+            )
+
+        _, p_values = engine.test(group_types[0], group_types[1])
+        mean1 = engine.group_sum(group_types[0]) / engine.group_size(group_types[0])
+        mean2 = engine.group_sum(group_types[1]) / engine.group_size(group_types[1])
+
+        gene_likelihood1: Dict[Hashable, float] = dict(zip(self.dge_list.genes, p_values))
+        gene_details: Dict[Hashable, Dict[Hashable, Any]] = {
+            gene: {'mean1': m1, 'mean2': m2}
+            for gene, m1, m2 in zip(self.dge_list.genes, mean1, mean2)
+        }
         return gene_details, gene_likelihood1, group_types
 
+    def run_contrasts(self):
+        """
+        Run the Kolmogorov-Smirnov test for every contrast of the kind given by --contrasts, and
+        write the filtered results of each contrast, sorted by p-value, to one stacked table.
+
+        """
+        log.info(f"Testing {self.contrasts} contrasts of {self.dge_list.groups_dict.keys()}")
+        table = ContrastEngine(self.dge_list).run(
+            kind=self.contrasts, adjust_method=self.adjust_method
+        )
+        if self.symbol_index:
+            ensg_to_symbol = self.symbol_index.get_symbols(self.dge_list.genes)
+            table.symbol = [
+                ensg_to_symbol[gene][0] if gene in ensg_to_symbol else gene for gene in table.gene
+            ]
+        table = filter_top_table(
+            table,
+            p_value_cutoff=self.p_value_cutoff,
+            minimum_mean=self.minimum_cpm,
+            direction=self.direction,
+        )
+
+        with open_results_writer(
+            self.output,
+            CONTRAST_COLUMNS,
+            header=["contrast"] + self.result_header("mean1", "mean2"),
+            output_format=self.output_format,
+        ) as writer:
+            for contrast in dict.fromkeys(table.contrast):
+                writer.write(top_genes(table[table.contrast == contrast]))
+
+    def top_table(
+        self, gene_likelihood1: Dict[Hashable, float], group_type1: str, group_type2: str
+    ) -> np.recarray:
+        """
+        Build the table of results for the tested genes, with adjusted p-values, fold changes and
+        group means.  See edgePy.top_table.make_top_table for the fields.
+
+        Args:
+             gene_likelihood1: dictionary of gene names and the p-value associated
+             group_type1: the name of the first grouping
+             group_type2: the name of the second grouping
+
+        """
+        genes = list(gene_likelihood1)
+        dge_list = self.dge_list
+        if len(genes) != len(dge_list.genes):
+            dge_list = dge_list.select(genes=genes)
+        ensg_to_symbol = self.symbol_index.get_symbols(genes) if self.symbol_index else {}
+        symbols = [ensg_to_symbol[gene][0] if gene in ensg_to_symbol else gene for gene in genes]
+
+        return make_top_table(
+            dge_list,
+            [gene_likelihood1[gene] for gene in genes],
+            group_type1,
+            group_type2,
+            symbols=symbols,
+            adjust_method=self.adjust_method,
+        )
+
+    @staticmethod
+    def result_header(group_type1: str, group_type2: str) -> List[str]:
+        """The column names of the results, for RESULT_COLUMNS."""
+        return ["gene_name", "symbol", "p-value", "adj_p", "logFC", group_type1, group_type2]
+
+    def select_results(
+        self, gene_likelihood1: Dict[Hashable, float], group_type1: str, group_type2: str
+    ) -> np.recarray:
+        """
+        Apply the p-value, minimum cpm and direction filters to the top table, and sort it by
+        p-value.
+
+        Args:
+             gene_likelihood1: dictionary of gene names and the p-value associated
+             group_type1: the name of the first grouping
+             group_type2: the name of the second grouping
+
+        """
+        table = self.top_table(gene_likelihood1, group_type1, group_type2)
+        table = filter_top_table(
+            table,
+            p_value_cutoff=self.p_value_cutoff,
+            minimum_mean=self.minimum_cpm,
+            direction=self.direction,
+        )
+        return top_genes(table)
+
     def generate_results(
         self,
         gene_details: Dict[Hashable, Dict[Hashable, Any]],
@@ -199,41 +362,44 @@ class EdgePy(object):
              group_type2: the name of the second grouping
 
         """
-
-        results: List[str] = []
-        sorted_likely = [
-            (gene, gene_likelihood1[gene])
-            for gene in sorted(gene_likelihood1, key=gene_likelihood1.get)
-        ]
-        results.append(f"gene_name\tp-value\t{group_type1}\t{group_type2}\n")
-        for gene, p in sorted_likely:
-            m1 = gene_details[gene]['mean1']
-            m2 = gene_details[gene]['mean2']
-            symbol = (
-                self.ensg_to_symbol[gene]['symbols'][0] if gene in self.ensg_to_symbol else gene
-            )
-
-            if (
-                p < self.p_value_cutoff
-                and not (m1 < self.minimum_cpm and m2 < self.minimum_cpm)
-                and m1 < m2
-            ):
-                results.append(
-                    f"{gene}\t"
-                    f"{symbol}\t"
-                    f"{gene_likelihood1[gene]}\t"
-                    f"{gene_details[gene]['mean1']:.2f}\t"
-                    f"{gene_details[gene]['mean2']:.2f}\n"
-                )
-
+        table = self.select_results(gene_likelihood1, group_type1, group_type2)
+        results: List[str] = ["\t".join(self.result_header(group_type1, group_type2)) + "\n"]
+        results.extend(format_rows(table, RESULT_COLUMNS))
         return results
 
 
 def main():
 
     args = parse_arguments()
+    if args.manifest:
+        from edgePy.batch import run_manifest
+
+        summaries = run_manifest(args.manifest, workers=args.workers)
+        failed = [summary["name"] for summary in summaries if "error" in summary]
+        if failed:
+            raise SystemExit(f"{len(failed)} of {len(summaries)} jobs failed: {failed}")
+        return
+    if args.serve:
+        from edgePy.server import AnalysisServer
+
+        max_memory = int(args.max_memory * 2 ** 20) if args.max_memory is not None else None
+        server = AnalysisServer(
+            host=args.host,
+            port=args.port,
+            max_concurrent=args.max_requests,
+            max_memory=max_memory,
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
     default_class = EdgePy(args)
-    default_class.run_ks()
+    if args.contrasts:
+        default_class.run_contrasts()
+    else:
+        default_class.run_ks()
 
 
 if __name__ == "__main__":
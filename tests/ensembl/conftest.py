@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from edgePy.data_import.ensembl.mysql_wrapper import MySQLWrapper
+
+ENSEMBL_SCHEMA = """
+create table gene (gene_id integer, stable_id text, canonical_transcript_id integer,
+    display_xref_id integer);
+create table transcript (transcript_id integer, stable_id text, gene_id integer);
+create table exon (exon_id integer, seq_region_start integer, seq_region_end integer);
+create table exon_transcript (exon_id integer, transcript_id integer);
+create table xref (xref_id integer, display_label text, external_db_id integer);
+create table external_synonym (xref_id integer, synonym text);
+create table external_db (external_db_id integer, db_name text);
+
+insert into gene values (1, 'ENSG00000000001', 11, 101), (2, 'ENSG00000000002', 22, 102);
+insert into transcript values (11, 'ENST00000000011', 1), (12, 'ENST00000000012', 1),
+    (22, 'ENST00000000022', 2);
+insert into exon values (1, 100, 200), (2, 300, 350), (3, 1000, 1500);
+insert into exon_transcript values (1, 11), (2, 11), (1, 12), (3, 22);
+insert into xref values (101, 'GENE1', 1100), (102, 'GENE2', 1100);
+insert into external_synonym values (101, 'ALIAS1');
+insert into external_db values (1100, 'HGNC');
+"""
+
+
+class SQLiteWrapper(MySQLWrapper):
+    """A stand-in for the MySQL server, backed by a sqlite database."""
+
+    def __init__(self, database=":memory:"):
+        self.database = database
+        self.connection = sqlite3.connect(database)
+        self.connection.create_function("IF", 3, lambda test, a, b: a if test else b)
+
+    def _streaming_cursor(self):
+        return self.connection.cursor()
+
+
+@pytest.fixture
+def sqlite_wrapper():
+    wrapper = SQLiteWrapper()
+    wrapper.connection.execute("create table gene (stable_id text, symbol text)")
+    wrapper.connection.executemany(
+        "insert into gene values (?, ?)", [(f"ENSG{i:011d}", f"SYM{i}") for i in range(25)]
+    )
+    return wrapper
+
+
+@pytest.fixture
+def ensembl_databases(tmpdir):
+    """Two small Ensembl core databases, returned as a dict of name to sqlite file."""
+    databases = {}
+    for name in ("homo_sapiens_core_1_1", "homo_sapiens_core_2_1"):
+        databases[name] = str(tmpdir.join(f"{name}.sqlite"))
+        with sqlite3.connect(databases[name]) as connection:
+            connection.executescript(ENSEMBL_SCHEMA)
+    return databases
+
+
+@pytest.fixture
+def ensembl_connection_factory(ensembl_databases):
+    """Opens a new sqlite connection to one of the ensembl_databases, by name."""
+    return lambda database: SQLiteWrapper(ensembl_databases[database])
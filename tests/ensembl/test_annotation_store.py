@@ -0,0 +1,118 @@
+import pytest
+
+from edgePy.data_import.data_import import get_dataset_path
+from edgePy.data_import.ensembl.annotation_store import InternTable, MultiReleaseDataStore
+from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+
+TEST_GENE_SYMBOLS = "symbols_homo_sapiens_core_75_37.tsv"
+
+RELEASE_1_TRANSCRIPTS = """ENSG00000000001\tENST00000000011\t150\tTrue
+ENSG00000000001\tENST00000000012\t100\tFalse
+ENSG00000000002\tENST00000000022\t500\tTrue
+"""
+RELEASE_1_SYMBOLS = """GENE1\tENSG00000000001
+GENE2\tENSG00000000002
+ALIAS1\tENSG00000000001
+ALIAS1\tENSG00000000002
+ALIAS1\tENSG00000000001
+"""
+RELEASE_2_TRANSCRIPTS = """ENSG00000000001\tENST00000000011\t175\tFalse
+ENSG00000000001\tENST00000000013\t300\tTrue
+ENSG00000000003\tENST00000000033\t50\tTrue
+"""
+RELEASE_2_SYMBOLS = """GENE1\tENSG00000000001
+GENE3\tENSG00000000003
+"""
+
+
+@pytest.fixture
+def store(tmpdir):
+    store = MultiReleaseDataStore()
+    for name, transcripts, symbols in (
+        ("r1", RELEASE_1_TRANSCRIPTS, RELEASE_1_SYMBOLS),
+        ("r2", RELEASE_2_TRANSCRIPTS, RELEASE_2_SYMBOLS),
+    ):
+        tmpdir.join(f"transcripts_{name}.tsv").write(transcripts)
+        tmpdir.join(f"symbols_{name}.tsv").write(symbols)
+        store.add_release(
+            name,
+            str(tmpdir.join(f"transcripts_{name}.tsv")),
+            str(tmpdir.join(f"symbols_{name}.tsv")),
+        )
+    return store
+
+
+def test_intern_table():
+    table = InternTable()
+    assert table.add("ENSG1") == 0
+    assert table.add("ENSG2") == 1
+    assert table.add("ENSG1") == 0
+    assert table.get("ENSG3") == -1
+    assert len(table) == 2
+    assert "ENSG2" in table
+
+
+def test_shared_ids(store):
+    assert len(store) == 2
+    assert sorted(store) == ["r1", "r2"]
+    assert len(store.genes) == 3
+    assert len(store.transcripts) == 5
+    assert len(store.symbols) == 4
+
+
+def test_per_release_lookups(store):
+    r1, r2 = store["r1"], store.release("r2")
+
+    assert r1.has_gene("ENSG00000000002")
+    assert not r2.has_gene("ENSG00000000002")
+    # ENSG00000000003 was interned after r1 was loaded
+    assert not r1.has_gene("ENSG00000000003")
+    assert r2.has_gene("ENSG00000000003")
+
+    assert r1.get_canonical_transcript("ENSG00000000001") == "ENST00000000011"
+    assert r2.get_canonical_transcript("ENSG00000000001") == "ENST00000000013"
+    assert r1.get_length_of_canonical_transcript("ENSG00000000001") == 150
+    assert r2.get_length_of_canonical_transcript("ENSG00000000001") == 300
+    assert r1.get_length_of_canonical_transcript("ENSG00000000009") is False
+    assert r1.get_length_of_canonical_transcript(None) == 0
+
+    assert r1.get_length_of_transcript("ENST00000000011") == 150
+    assert r2.get_length_of_transcript("ENST00000000011") == 175
+    assert r1.get_length_of_transcript("ENST00000000033") is False
+    assert r1.is_canonical_by_transcript("ENST00000000011") is True
+    assert r2.is_canonical_by_transcript("ENST00000000011") is False
+
+    assert r1.get_genes_from_symbol("ALIAS1") == ["ENSG00000000001", "ENSG00000000002"]
+    assert r2.get_genes_from_symbol("ALIAS1") == []
+    assert r1.get_genes_from_symbol("GENE3") == []
+    assert r2.is_known_symbol("GENE3")
+    assert not r1.is_known_symbol("GENE3")
+
+    assert r1.get_symbol_from_gene("ENSG00000000001") == "GENE1"
+    assert r1.is_known_gene("ENSG00000000002")
+    assert not r2.is_known_gene("ENSG00000000002")
+    with pytest.raises(KeyError):
+        r2.get_symbol_from_gene("ENSG00000000002")
+
+
+def test_matches_canonical_data_store(tmpdir):
+    symbols = get_dataset_path(TEST_GENE_SYMBOLS)
+    transcripts = tmpdir.join("transcripts.tsv")
+    with open(symbols) as data:
+        genes = sorted({line.split("\t")[1].strip() for line in data})
+    transcripts.write(
+        "".join(
+            f"{gene}\tENST{idx:011d}\t{idx % 5000 + 1}\tTrue\n" for idx, gene in enumerate(genes)
+        )
+    )
+
+    expected = CanonicalDataStore(str(transcripts), symbols)
+    store = MultiReleaseDataStore()
+    release = store.add_release("75", str(transcripts), symbols)
+    for symbol in ("PAN1", "FABP3P2", "FAKEGENE1", "DHFRP1"):
+        assert release.get_genes_from_symbol(symbol) == expected.get_genes_from_symbol(symbol)
+    for gene in genes[::1000]:
+        assert release.get_symbol_from_gene(gene) == expected.get_symbol_from_gene(gene)
+        assert release.get_length_of_canonical_transcript(
+            gene
+        ) == expected.get_length_of_canonical_transcript(gene)
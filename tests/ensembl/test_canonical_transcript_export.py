@@ -0,0 +1,55 @@
+import gzip
+
+from edgePy.data_import.ensembl.canonical_transcripts import CanonicalTranscript
+from edgePy.data_import.ensembl.canonical_transcripts import export_databases
+from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
+
+
+def test_export(ensembl_connection_factory, tmpdir):
+    exporter = CanonicalTranscript(
+        None,
+        None,
+        None,
+        None,
+        "homo_sapiens_core_1_1",
+        connection_factory=ensembl_connection_factory,
+    )
+    transcripts = str(tmpdir.join("transcripts.tsv"))
+    symbols = str(tmpdir.join("symbols.tsv.gz"))
+    counts = exporter.export(transcripts, symbols)
+    assert counts == {"transcripts": 3, "symbols": 2, "synonyms": 1}
+
+    with open(transcripts) as data:
+        assert sorted(data.readlines()) == [
+            "ENSG00000000001\tENST00000000011\t150\tTrue\n",
+            "ENSG00000000001\tENST00000000012\t100\tFalse\n",
+            "ENSG00000000002\tENST00000000022\t500\tTrue\n",
+        ]
+    with gzip.open(symbols, 'rt') as data:
+        assert data.readlines() == [
+            "GENE1\tENSG00000000001\n",
+            "GENE2\tENSG00000000002\n",
+            "ALIAS1\tENSG00000000001\n",
+        ]
+
+    store = CanonicalDataStore(transcripts, symbols)
+    assert store.get_length_of_canonical_transcript("ENSG00000000001") == 150
+    assert store.get_genes_from_symbol("ALIAS1") == ["ENSG00000000001"]
+
+
+def test_export_databases(ensembl_databases, ensembl_connection_factory, tmpdir):
+    counts = export_databases(
+        sorted(ensembl_databases),
+        str(tmpdir.join("transcripts_{database}.tsv")),
+        str(tmpdir.join("symbols_{database}.tsv")),
+        workers=2,
+        host=None,
+        port=None,
+        user=None,
+        password=None,
+        connection_factory=ensembl_connection_factory,
+    )
+    assert sorted(counts) == sorted(ensembl_databases)
+    for database in ensembl_databases:
+        assert tmpdir.join(f"transcripts_{database}.tsv").check()
+        assert counts[database]["transcripts"] == 3
@@ -0,0 +1,26 @@
+import gzip
+
+from smart_open import smart_open  # type: ignore
+
+from edgePy.data_import.ensembl.canonical_transcripts import write_rows, gzip_name
+
+
+def test_stream_sql_query(sqlite_wrapper):
+    batches = list(sqlite_wrapper.stream_sql_query("select * from gene order by stable_id", 10))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert batches[0][0] == ("ENSG00000000000", "SYM0")
+    assert isinstance(batches[2][4], tuple)
+
+
+def test_write_rows_gzip(sqlite_wrapper, tmpdir):
+    filename = gzip_name(str(tmpdir.join("symbols.tsv")))
+    assert filename.endswith(".tsv.gz")
+    with smart_open(filename, 'w') as output:
+        count = write_rows(
+            output, sqlite_wrapper.stream_sql_query("select * from gene", 7), columns=[1, 0]
+        )
+    assert count == 25
+    with gzip.open(filename, 'rt') as data:
+        lines = data.readlines()
+    assert len(lines) == 25
+    assert lines[0] == "SYM0\tENSG00000000000\n"
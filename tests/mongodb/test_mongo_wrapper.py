@@ -2,6 +2,8 @@ import pytest
 from edgePy.data_import.mongodb.mongo_wrapper import MongoWrapper
 from edgePy.data_import.mongodb.mongo_wrapper import MongoInserter
 from edgePy.data_import.mongodb.mongo_wrapper import MongoUpdater
+from edgePy.data_import.mongodb.mongo_wrapper import get_client, close_clients
+from edgePy.data_import.mongodb.mongo_wrapper import _reset_clients_after_fork
 
 
 def test_mongo_wrapper_find_as_cursor(mongodb):
@@ -103,3 +105,25 @@ def test_mongo_updater_close(mongodb):
     mu = MongoUpdater("localhost", 27017, "pytest", "test")
     mu.session = mongodb
     mu.close()
+
+
+def test_mongo_wrapper_shares_client():
+    mw1 = MongoWrapper("localhost", "27017")
+    mw2 = MongoWrapper("localhost", 27017)
+    mi = MongoInserter("localhost", 27017, "pytest", "test")
+    assert mw1.session is mw2.session
+    assert mw1.session is mi.session
+    assert MongoWrapper("localhost", 27018).session is not mw1.session
+
+
+def test_get_client_reset_after_fork():
+    client = get_client("localhost", 27017)
+    _reset_clients_after_fork()
+    assert get_client("localhost", 27017) is not client
+
+
+def test_get_client_pool_size():
+    close_clients()
+    client = get_client("localhost", 27019, max_pool_size=7)
+    assert client.options.pool_options.max_pool_size == 7
+    close_clients()
@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+from edgePy.data_import.mongodb.mongo_wrapper import MongoWrapper
+from edgePy.data_import.mongodb.symbol_index import SymbolIndex, chunked
+
+
+class CountingWrapper(MongoWrapper):
+    """Keeps track of the queries sent to mongo."""
+
+    def __init__(self, session):
+        MongoWrapper.__init__(self, "localhost", "27017")
+        self.session = session
+        self.queries = []
+
+    def find_as_cursor(self, database, collection, query=None, projection=None):
+        self.queries.append((collection, query))
+        return MongoWrapper.find_as_cursor(self, database, collection, query, projection)
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def test_get_symbols_fallback(mongodb):
+    mw = CountingWrapper(mongodb)
+    index = SymbolIndex(mw, database="pytest", chunk_size=1)
+    symbols = index.get_symbols(["ENSG00000012048", "ENSG00000141510", "ENSG00000000000"])
+    assert symbols == {"ENSG00000012048": ["BRCA1"], "ENSG00000141510": ["TP53"]}
+    # one query per chunk of unknown ids
+    assert len(mw.queries) == 3
+
+    # known ids, including ones that were not found, are answered locally
+    symbols = index.get_symbols(["ENSG00000012048", "ENSG00000000000"])
+    assert symbols == {"ENSG00000012048": ["BRCA1"]}
+    assert len(mw.queries) == 3
+
+
+def test_get_ensgs(mongodb):
+    mw = CountingWrapper(mongodb)
+    index = SymbolIndex(mw, database="pytest")
+    assert index.get_ensgs(["TP53", "FAKE1"]) == {"TP53": ["ENSG00000141510"]}
+
+
+def test_build_and_persist(mongodb, tmpdir):
+    filename = str(tmpdir.join("symbols.sqlite"))
+    mw = CountingWrapper(mongodb)
+    index = SymbolIndex(mw, database="pytest", filename=filename)
+    assert index.all_symbols() == {
+        "ENSG00000012048": ["BRCA1"],
+        "ENSG00000139618": ["BRCA2"],
+        "ENSG00000141510": ["TP53"],
+    }
+    index.close()
+
+    mw = CountingWrapper(mongodb)
+    index = SymbolIndex(mw, database="pytest", filename=filename)
+    assert index.is_complete("symbol_by_ensg")
+    assert index.get_symbols(["ENSG00000139618", "ENSG00000000000"]) == {
+        "ENSG00000139618": ["BRCA2"]
+    }
+    assert len(index.all_ensgs()) == 3
+    assert mw.queries == []
+
+
+def test_refresh(mongodb):
+    mw = CountingWrapper(mongodb)
+    index = SymbolIndex(mw, database="pytest")
+    index.build()
+    mongodb["symbol_by_ensg"].insert_one({"_id": "ENSG00000000001", "symbols": ["NEW1"]})
+    mongodb["symbol_by_ensg"].delete_one({"_id": "ENSG00000141510"})
+    mongodb["symbol_by_ensg"].update_one(
+        {"_id": "ENSG00000012048"}, {"$set": {"symbols": ["BRCA1", "RNF53"]}}
+    )
+    try:
+        index.refresh()
+        symbols = index.all_symbols()
+        assert symbols["ENSG00000000001"] == ["NEW1"]
+        assert symbols["ENSG00000012048"] == ["BRCA1", "RNF53"]
+        assert "ENSG00000141510" not in symbols
+    finally:
+        mongodb["symbol_by_ensg"].delete_one({"_id": "ENSG00000000001"})
+        mongodb["symbol_by_ensg"].insert_one({"_id": "ENSG00000141510", "symbols": ["TP53"]})
+        mongodb["symbol_by_ensg"].update_one(
+            {"_id": "ENSG00000012048"}, {"$set": {"symbols": ["BRCA1"]}}
+        )
+
+
+def test_context_manager_closes(mongodb):
+    with SymbolIndex(CountingWrapper(mongodb), database="pytest") as index:
+        assert index.get_ensgs(["TP53"]) == {"TP53": ["ENSG00000141510"]}
+    with pytest.raises(sqlite3.ProgrammingError):
+        index.get_ensgs(["TP53"])
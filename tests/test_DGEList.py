@@ -3,7 +3,7 @@ import pkgutil
 import numpy as np
 from smart_open import smart_open  # type: ignore
 
-from edgePy.DGEList import DGEList
+from edgePy.DGEList import DGEList, DGEListBuilder
 from edgePy.data_import.data_import import get_dataset_path
 from edgePy.data_import.ensembl.ensembl_flat_file_reader import CanonicalDataStore
 
@@ -188,6 +188,36 @@ def test_broken_dge_caGENE_SYMBOL_SQLll():
         DGEList(counts=None)
 
 
+def test_cached_values():
+    dge_list = DGEList(
+        counts=np.array([[1, 2, 3], [4, 5, 0]]),
+        samples=["A1", "A2", "B1"],
+        genes=["G1", "G2"],
+        groups_in_list=["A", "A", "B"],
+    )
+    assert dge_list.library_size is dge_list.library_size
+    assert np.array_equal(dge_list.library_size, [5, 7, 3])
+    assert np.array_equal(dge_list.group_sums["A"], [3, 9])
+    log_cpm = dge_list.log_cpm()
+    assert dge_list.log_cpm() is log_cpm
+    log_dge_list = dge_list.cpm(transform_to_log=True)
+    assert np.array_equal(log_dge_list.counts, log_cpm)
+    log_dge_list.counts[0, 0] = 0.0
+    assert not np.shares_memory(log_dge_list.counts, log_cpm)
+
+    dge_list.norm_factors = np.array([1.0, 2.0, 0.5])
+    assert np.array_equal(dge_list.effective_library_size, [5, 14, 1.5])
+
+    dge_list.counts = np.array([[2, 2, 3], [4, 5, 1]])
+    assert np.array_equal(dge_list.library_size, [6, 7, 4])
+    assert np.array_equal(dge_list.effective_library_size, [6, 14, 2])
+    assert np.array_equal(dge_list.group_sums["B"], [3, 1])
+    assert dge_list.log_cpm() is not log_cpm
+
+    dge_list.groups_list = ["A", "B", "B"]
+    assert np.array_equal(dge_list.group_sums["B"], [5, 6])
+
+
 def test_cpm():
     dge_list = DGEList(filename=str(get_dataset_path(TEST_DATASET_NPZ)))
     first_pos = dge_list.counts[0][0]
@@ -302,3 +332,199 @@ def test_create_DGEList():
     assert np.array_equal(dge_list.groups_list, np.array(["One", "One", "Two"]))
     assert dge_list.groups_dict, {"One:"}
     assert np.array_equal(dge_list.genes, np.array(genes))
+
+
+def test_create_DGEList_cleans_genes():
+    """Gene names are cleaned, and metatag rows dropped, as by the genes setter."""
+    samples = ["AAA", "BBB"]
+    genes = ['"ENSG001" ', "__no_feature", "ENSG002", "ambiguous"]
+    data_set = {
+        "AAA": {'"ENSG001" ': 1, "__no_feature": 5, "ENSG002": 2, "ambiguous": 7},
+        "BBB": {'"ENSG001" ': 3, "__no_feature": 6, "ENSG002": 4, "ambiguous": 8},
+    }
+
+    dge_list = DGEList.create_DGEList(
+        sample_list=samples, data_set=data_set, gene_list=genes, sample_to_category=["A", "B"]
+    )
+
+    assert np.array_equal(dge_list.genes, np.array(["ENSG001", "ENSG002"]))
+    assert np.array_equal(dge_list.counts, np.array([[1, 3], [2, 4]]))
+
+
+def small_dge_list():
+    return DGEList(
+        counts=np.arange(24).reshape(6, 4),
+        samples=["A1", "A2", "B1", "B2"],
+        genes=["G1", "G2", "G3", "G4", "G5", "G6"],
+        groups_in_list=["A", "A", "B", "B"],
+        norm_factors=np.array([1.0, 1.1, 1.2, 1.3]),
+    )
+
+
+def test_select_view():
+    dge_list = small_dge_list()
+    subset = dge_list.select(genes=["G2", "G3", "G4"], samples=["A2", "B1"])
+    assert np.array_equal(subset.counts, [[5, 6], [9, 10], [13, 14]])
+    assert np.shares_memory(subset.counts, dge_list.counts)
+    assert np.array_equal(subset.genes, ["G2", "G3", "G4"])
+    assert np.array_equal(subset.samples, ["A2", "B1"])
+    assert np.array_equal(subset.norm_factors, [1.1, 1.2])
+    assert subset.groups_dict == {"A": ["A2"], "B": ["B1"]}
+
+    # evenly spaced rows are also views
+    strided = dge_list.select(genes=["G1", "G3", "G5"])
+    assert np.shares_memory(strided.counts, dge_list.counts)
+    assert np.array_equal(strided.counts[:, 0], [0, 8, 16])
+
+
+def test_select_gather():
+    dge_list = small_dge_list()
+    subset = dge_list.select(genes=["G6", "G1"], samples=["B2", "A1"])
+    assert not np.shares_memory(subset.counts, dge_list.counts)
+    assert np.array_equal(subset.counts, [[23, 20], [3, 0]])
+    assert np.array_equal(subset.groups_list, ["B", "A"])
+    assert subset.gene_index.get_loc("G1") == 1
+
+
+def test_select_groups_and_masks():
+    dge_list = small_dge_list()
+    subset = dge_list.select(genes=dge_list.counts[:, 0] > 10, groups=["B"])
+    assert np.array_equal(subset.samples, ["B1", "B2"])
+    assert np.array_equal(subset.genes, ["G4", "G5", "G6"])
+    assert np.array_equal(subset.counts, [[14, 15], [18, 19], [22, 23]])
+    assert subset.groups_dict == {"B": ["B1", "B2"]}
+
+
+def test_select_missing():
+    with pytest.raises(KeyError):
+        small_dge_list().select(genes=["G1", "G9"])
+
+
+def test_concat_outer_and_inner():
+    batch1 = DGEList(
+        counts=np.array([[1, 2], [3, 4], [5, 6]]),
+        samples=["S1", "S2"],
+        genes=["G1", "G2", "G3"],
+        groups_in_list=["A", "B"],
+        norm_factors=np.array([1.0, 0.9]),
+    )
+    batch2 = DGEList(
+        counts=np.array([[7], [8]]),
+        samples=["S3"],
+        genes=["G3", "G4"],
+        groups_in_list=["A"],
+    )
+    outer = DGEList.concat([batch1, batch2])
+    assert np.array_equal(outer.genes, ["G1", "G2", "G3", "G4"])
+    assert np.array_equal(outer.samples, ["S1", "S2", "S3"])
+    assert np.array_equal(outer.counts, [[1, 2, 0], [3, 4, 0], [5, 6, 7], [0, 0, 8]])
+    assert np.array_equal(outer.norm_factors, [1.0, 0.9, 1.0])
+    assert outer.groups_dict == {"A": ["S1", "S3"], "B": ["S2"]}
+
+    inner = DGEList.concat([batch1, batch2], join="inner")
+    assert np.array_equal(inner.genes, ["G3"])
+    assert np.array_equal(inner.counts, [[5, 6, 7]])
+
+    with pytest.raises(ValueError):
+        DGEList.concat([batch1, batch1])
+    with pytest.raises(ValueError):
+        DGEList.concat([batch1, batch2.cpm(transform_to_log=True)])
+
+
+def test_builder():
+    builder = DGEListBuilder(["G1", "G2", "G3"], capacity=1)
+    builder.add_sample("S1", [1, 2, 3], group="A")
+    first = builder.build()
+    builder.add_sample("S2", {"G3": 6, "G1": 4, "G9": 100}, group="B", norm_factor=0.5)
+    builder.add_samples(np.array([[7, 8], [9, 10], [11, 12]]), ["S3", "S4"], ["A", "B"])
+    assert len(builder) == 4
+
+    dge_list = builder.build()
+    assert np.array_equal(dge_list.counts, [[1, 4, 7, 8], [2, 0, 9, 10], [3, 6, 11, 12]])
+    assert np.array_equal(dge_list.norm_factors, [1.0, 0.5, 1.0, 1.0])
+    assert dge_list.groups_dict == {"A": ["S1", "S3"], "B": ["S2", "S4"]}
+    # DGELists built earlier are not affected by later samples
+    assert np.array_equal(first.counts, [[1], [2], [3]])
+
+    builder.add_dge_list(small_dge_list().select(genes=["G3", "G1"], samples=["B2"]))
+    assert np.array_equal(builder.build().counts[:, -1], [3, 0, 11])
+
+    with pytest.raises(ValueError):
+        builder.add_sample("S5", [1, -1, 1], group="A")
+    builder.add_sample("S1", [1, 1, 1], group="A")
+    with pytest.raises(ValueError):
+        builder.build()
+
+
+def write_htseq_file(path, rows):
+    with smart_open(str(path), 'w') as handle:
+        for gene, count in rows + [("__no_feature", 50), ("ambiguous", 3)]:
+            handle.write(f"{gene}\t{count}\n")
+
+
+def test_create_DGEList_htseq_files(tmpdir):
+    write_htseq_file(tmpdir.join("A_1.counts.txt"), [("G1", 1), ("G2", 2), ("G3", 3)])
+    write_htseq_file(tmpdir.join("B_1.counts.txt.gz"), [("G1", 4), ("G2", 5), ("G3", 6)])
+    groups = {"A": ["A_1"], "B": ["B_1"]}
+
+    dge_list = DGEList.create_DGEList_htseq_files(str(tmpdir), groups_in_dict=groups)
+    assert np.array_equal(dge_list.samples, ["A_1", "B_1"])
+    assert np.array_equal(dge_list.genes, ["G1", "G2", "G3"])
+    assert np.array_equal(dge_list.counts, [[1, 4], [2, 5], [3, 6]])
+
+    write_htseq_file(tmpdir.join("C_1.counts.txt"), [("G4", 7), ("G2", 8)])
+    groups["C"] = ["C_1"]
+    merged = DGEList.create_DGEList_htseq_files(
+        str(tmpdir.join("*.counts.txt*")), groups_in_dict=groups, processes=1
+    )
+    assert np.array_equal(merged.genes, ["G1", "G2", "G3", "G4"])
+    assert np.array_equal(merged.counts[:, 2], [0, 8, 0, 7])
+
+    with pytest.raises(ValueError):
+        DGEList.create_DGEList_htseq_files(str(tmpdir.join("*.missing")), groups_in_dict=groups)
+
+
+def test_create_DGEList_htseq_files_cleans_genes(tmpdir):
+    write_htseq_file(tmpdir.join("A_1.txt"), [('"G1"', 1), ('"G2"', 2)])
+    dge_list = DGEList.create_DGEList_htseq_files(
+        str(tmpdir), groups_in_dict={"A": ["A_1"]}, processes=1
+    )
+    assert np.array_equal(dge_list.genes, ["G1", "G2"])
+
+
+def test_create_DGEList_htseq_files_duplicate_samples(tmpdir):
+    write_htseq_file(tmpdir.join("A.rep1.txt"), [("G1", 1)])
+    write_htseq_file(tmpdir.join("A.rep2.txt"), [("G1", 2)])
+    with pytest.raises(ValueError, match="same sample names"):
+        DGEList.create_DGEList_htseq_files(str(tmpdir), groups_in_dict={"A": ["A"]}, processes=1)
+
+
+def test_filter_by_expr():
+    counts = np.array(
+        [[100, 120, 90, 110], [0, 0, 0, 0], [20, 0, 0, 0], [5, 5, 5, 5], [0, 0, 40, 50]]
+    )
+    dge_list = DGEList(
+        counts=counts,
+        samples=["A1", "A2", "B1", "B2"],
+        genes=["G1", "G2", "G3", "G4", "G5"],
+        groups_in_list=["A", "A", "B", "B"],
+    )
+    # G3 passes the CPM cutoff in one sample, G4 in none, and G5 in both B samples.
+    assert np.array_equal(dge_list.filter_by_expr().genes, ["G1", "G5"])
+    assert np.array_equal(dge_list.filter_by_expr(min_group_size=1).genes, ["G1", "G3", "G5"])
+    assert np.array_equal(dge_list.filter_by_expr(min_total_count=200).genes, ["G1"])
+
+    with pytest.raises(ValueError):
+        dge_list.cpm(transform_to_log=True).filter_by_expr()
+
+
+def test_remove_zeroes():
+    dge_list = DGEList(
+        counts=np.array([[1, 2], [0, 0], [0, 3]]),
+        samples=["A1", "B1"],
+        genes=["G1", "G2", "G3"],
+        groups_in_list=["A", "B"],
+        to_remove_zeroes=True,
+    )
+    assert np.array_equal(dge_list.genes, ["G1", "G3"])
+    assert np.array_equal(dge_list.counts, [[1, 2], [0, 3]])
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from edgePy.DGEList import DGEList
+from edgePy.batch_correction import combat_seq
+
+
+def simulate(seed=0, genes=400, samples=24):
+    rng = np.random.default_rng(seed)
+    batch = np.repeat([0, 1], samples // 2)
+    group = np.tile([0, 1], samples // 2)
+    effect = np.exp(rng.normal(0, 0.7, genes))
+    changed = np.ones(genes)
+    changed[:40] = 4
+    mu = rng.gamma(2, 50, genes)[:, np.newaxis] * np.where(batch == 1, effect[:, np.newaxis], 1)
+    mu = mu * np.where(group == 1, changed[:, np.newaxis], 1)
+    counts = rng.negative_binomial(10, 10 / (10 + mu))
+    dge_list = DGEList(
+        counts=counts,
+        samples=[f"S{number}" for number in range(samples)],
+        genes=[f"G{number}" for number in range(genes)],
+        groups_in_list=[f"group{number}" for number in group],
+    )
+    return dge_list, [f"batch{number}" for number in batch], batch, group, effect
+
+
+def test_combat_seq():
+    dge_list, batches, batch, group, effect = simulate()
+    adjusted = combat_seq(dge_list, batches, block_size=150)
+    counts = adjusted.counts / adjusted.library_size
+    log_ratio = np.log(counts[:, batch == 1].mean(axis=1) / counts[:, batch == 0].mean(axis=1))
+    # Before correction the log ratio follows the batch effect with a slope of 1.
+    assert abs(np.polyfit(np.log(effect), log_ratio, 1)[0]) < 0.1
+
+    # The group differences are kept - a little under 4 fold, as they raise library sizes.
+    raw = dge_list.counts / dge_list.library_size
+    for values in (raw, counts):
+        changed = values[:40, group == 1].mean(axis=1) / values[:40, group == 0].mean(axis=1)
+        assert abs(np.log2(changed).mean() - 1.65) < 0.15
+    assert np.array_equal(adjusted.counts, np.round(adjusted.counts))
+    in_processes = combat_seq(dge_list, batches, block_size=150, processes=2)
+    assert np.array_equal(in_processes.counts, adjusted.counts)
+
+    shrunk = combat_seq(dge_list, batches, shrink=True)
+    counts = shrunk.counts / shrunk.library_size
+    log_ratio = np.log(counts[:, batch == 1].mean(axis=1) / counts[:, batch == 0].mean(axis=1))
+    assert 0 < np.polyfit(np.log(effect), log_ratio, 1)[0] < 0.3
+
+
+def test_combat_seq_confounded():
+    dge_list, _, _, group, _ = simulate(genes=20)
+    with pytest.raises(ValueError):
+        combat_seq(dge_list, [f"batch{number}" for number in group])
+    with pytest.raises(ValueError):
+        combat_seq(dge_list, ["batch0"] * 3)
+
+
+def test_combat_seq_no_fitted_genes():
+    dge_list = DGEList(
+        counts=np.array([[5, 0, 3, 0], [0, 2, 0, 4]]),
+        samples=["S1", "S2", "S3", "S4"],
+        genes=["G1", "G2"],
+        groups_in_list=["A", "A", "A", "A"],
+    )
+    adjusted = combat_seq(dge_list, ["batch0", "batch1", "batch0", "batch1"])
+    assert np.array_equal(adjusted.counts, dge_list.counts)
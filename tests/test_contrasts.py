@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+from scipy.stats import ks_2samp
+
+from edgePy.DGEList import DGEList
+from edgePy.contrasts import REST, ContrastEngine, ks_statistic
+
+
+def three_group_dge_list():
+    rng = np.random.RandomState(7)
+    counts = np.hstack([rng.poisson(5, (40, 3)), rng.poisson(8, (40, 4)), rng.poisson(5, (40, 5))])
+    return DGEList(
+        counts=counts,
+        samples=[f"S{i}" for i in range(12)],
+        genes=[f"G{i}" for i in range(40)],
+        groups_in_list=["A"] * 3 + ["B"] * 4 + ["C"] * 5,
+    )
+
+
+def test_ks_statistic_matches_scipy():
+    dge_list = three_group_dge_list()
+    first = np.sort(dge_list.counts[:, :3], axis=1)
+    second = np.sort(dge_list.counts[:, 3:7], axis=1)
+    expected = [ks_2samp(a, b)[0] for a, b in zip(first, second)]
+    assert np.allclose(ks_statistic(first, second) / 12, expected)
+
+
+@pytest.mark.parametrize("method", ["exact", "asymp"])
+def test_engine_matches_scipy(method):
+    dge_list = three_group_dge_list()
+    engine = ContrastEngine(dge_list, method=method)
+    statistic, p_values = engine.test("B", "C")
+    expected = np.array([ks_2samp(row[3:7], row[7:], mode=method) for row in dge_list.counts])
+    assert np.allclose(statistic, expected[:, 0])
+    assert np.allclose(p_values, expected[:, 1])
+
+    _, rest_p_values = engine.test(REST, "A")
+    expected = [ks_2samp(row[3:], row[:3], mode=method)[1] for row in dge_list.counts]
+    assert np.allclose(rest_p_values, expected)
+
+
+def test_run_contrasts():
+    dge_list = three_group_dge_list()
+    engine = ContrastEngine(dge_list)
+    assert engine.contrasts() == [("A", "B"), ("A", "C"), ("B", "C")]
+
+    table = engine.run(kind="one_vs_rest")
+    assert len(table) == 3 * 40
+    assert list(dict.fromkeys(table.contrast)) == ["A_vs_rest", "B_vs_rest", "C_vs_rest"]
+    b_rows = table[table.contrast == "B_vs_rest"]
+    assert np.allclose(b_rows.mean2, dge_list.counts[:, 3:7].mean(axis=1))
+    others = np.hstack([dge_list.counts[:, :3], dge_list.counts[:, 7:]])
+    assert np.allclose(b_rows.mean1, others.mean(axis=1))
+    assert (b_rows.adj_p >= b_rows.p_value).all()
+
+    table = engine.run([("C", "A")])
+    assert set(table.contrast) == {"A_vs_C"}
+
+    with pytest.raises(KeyError):
+        engine.run([("A", "D")])
+    with pytest.raises(ValueError):
+        engine.contrasts("all_vs_all")
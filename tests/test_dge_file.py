@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from edgePy.DGEList import DGEList
+from edgePy.dge_file import DGEFile, is_dge_file, read_dge_file, write_dge_file
+
+
+@pytest.fixture
+def dge_list():
+    rng = np.random.default_rng(0)
+    return DGEList(
+        counts=rng.poisson(20, (103, 29)),
+        samples=[f"S{number}" for number in range(29)],
+        genes=[f"G{number}" for number in range(103)],
+        groups_in_list=[f"group{number % 3}" for number in range(29)],
+        norm_factors=rng.uniform(0.5, 2, 29),
+    )
+
+
+def assert_same(first, second):
+    assert np.array_equal(first.counts, second.counts)
+    assert np.array_equal(first.genes, second.genes)
+    assert np.array_equal(first.samples, second.samples)
+    assert np.array_equal(first.norm_factors, second.norm_factors)
+    assert np.array_equal(first.groups_list, second.groups_list)
+    assert first.groups_dict == second.groups_dict
+    assert first.current_data_format == second.current_data_format
+    assert first.current_log_status == second.current_log_status
+
+
+def test_round_trip(dge_list, tmpdir):
+    filename = str(tmpdir.join("data.dge"))
+    write_dge_file(dge_list, filename, block_rows=10, block_columns=8)
+    assert is_dge_file(filename)
+    assert_same(read_dge_file(filename), dge_list)
+    assert_same(DGEList(filename=filename), dge_list)
+
+    log_cpm = dge_list.cpm(transform_to_log=True).copy(current_type="cpm")
+    log_cpm.write_dge_file(filename)
+    assert_same(DGEList(filename=filename), log_cpm)
+
+
+def test_group_types(dge_list, tmpdir):
+    filename = str(tmpdir.join("data.dge"))
+    numbered = DGEList(
+        counts=dge_list.counts,
+        samples=dge_list.samples,
+        genes=dge_list.genes,
+        groups_in_list=[number % 3 for number in range(29)],
+    )
+    numbered.write_dge_file(filename)
+    read = read_dge_file(filename)
+    assert read.groups_list.dtype.kind == "i"
+    assert_same(read, numbered)
+    assert sorted(read.groups_dict) == [0, 1, 2]
+
+    # Mixed groups would be read back as strings.
+    with pytest.raises(ValueError):
+        write_dge_file(numbered.copy(groups_in_list=["A"] + [1] * 28), filename)
+
+
+def test_partial_reads(dge_list, tmpdir):
+    filename = str(tmpdir.join("data.dge"))
+    write_dge_file(dge_list, filename, block_rows=10, block_columns=8)
+    genes = ["G57", "G3", "G102"]
+    samples = ["S28", "S0", "S9"]
+    assert_same(
+        read_dge_file(filename, genes=genes, samples=samples), dge_list.select(genes, samples)
+    )
+    assert_same(
+        read_dge_file(filename, samples=slice(1, 20, 3)), dge_list.select(samples=slice(1, 20, 3))
+    )
+
+    with DGEFile(filename) as dge_file:
+        assert dge_file.shape == (103, 29)
+        tiles = []
+        original = dge_file._tile
+        dge_file._tile = lambda *tile: tiles.append(tile) or original(*tile)
+        dge_file.read(genes=["G57"], samples=["S3", "S4"])
+        assert tiles == [(5, 0)]
+        with pytest.raises(KeyError):
+            dge_file.read(genes=["G1000"])
+
+
+def test_bad_files(dge_list, tmpdir):
+    filename = str(tmpdir.join("data.dge"))
+    dge_list.write_npz_file(str(tmpdir.join("data")))
+    assert not is_dge_file(str(tmpdir.join("data.npz")))
+    with pytest.raises(ValueError):
+        DGEFile(str(tmpdir.join("data.npz")))
+
+    write_dge_file(dge_list, filename)
+    with open(filename, "r+b") as handle:
+        handle.seek(40)
+        handle.write(b"\xff\xff\xff\xff")
+    with pytest.raises(ValueError):
+        read_dge_file(filename)
+
+
+def test_npz_transform_state(dge_list, tmpdir):
+    log_cpm = dge_list.cpm(transform_to_log=True).copy(current_type="cpm")
+    log_cpm.write_npz_file(str(tmpdir.join("data")))
+    assert_same(DGEList(filename=str(tmpdir.join("data.npz"))), log_cpm)
@@ -1,3 +1,11 @@
+import gzip
+import json
+
+import numpy as np
+
+from edgePy.DGEList import DGEList
+from edgePy.batch import RESULT_HEADER, ResourceCache, run_manifest
+
 # from edgePy.edgePy import parse_arguments
 
 
@@ -7,3 +15,41 @@ def test_parse_argumants():
     # args = parse_arguments(['--count_file', text_file, "--groups_file", groups_file])
     # eq_(text_file, args.count_file)
     # eq_(groups_file, args.groups_file)
+
+
+def write_manifest(tmpdir, jobs, **extra):
+    counts = np.array([[10, 12, 11, 40, 42, 45], [5, 6, 5, 5, 6, 5], [30, 33, 31, 3, 2, 4]])
+    DGEList(
+        counts=counts,
+        samples=["A1", "A2", "A3", "B1", "B2", "B3"],
+        genes=["G1", "G2", "G3"],
+        groups_in_list=["A", "A", "A", "B", "B", "B"],
+    ).write_npz_file(str(tmpdir.join("data")))
+    manifest = {"datasets": {"data": {"dge_file": "data.npz"}}, "jobs": jobs, **extra}
+    tmpdir.join("manifest.json").write(json.dumps(manifest))
+    return str(tmpdir.join("manifest.json"))
+
+
+def test_run_manifest(tmpdir):
+    jobs = [
+        {"name": "up", "dataset": "data", "output": "up.tsv"},
+        {"name": "both", "dataset": "data", "direction": "both", "output": "both.npz"},
+        {"name": "pair", "dataset": "data", "contrasts": [["B", "A"]], "output": "pair.tsv.gz"},
+        {"name": "broken", "dataset": {"dge_file": "missing.npz"}},
+    ]
+    manifest = write_manifest(tmpdir, jobs, defaults={"cutoff": 0.2}, workers=2)
+
+    cache = ResourceCache()
+    summaries = run_manifest(manifest, cache=cache)
+    assert [summary["name"] for summary in summaries] == ["up", "both", "pair", "broken"]
+    assert [summary.get("rows") for summary in summaries] == [1, 2, 1, None]
+    assert "error" in summaries[3]
+    # The dataset and its contrast engine were loaded once, and shared by the three jobs.
+    assert cache.loads == 2
+
+    lines = tmpdir.join("up.tsv").read().splitlines()
+    assert lines[0].split("\t") == RESULT_HEADER
+    assert lines[1].split("\t")[:3] == ["B_vs_A", "G1", "G1"]
+    assert list(np.load(str(tmpdir.join("both.npz")))["gene_name"]) == ["G1", "G3"]
+    with gzip.open(str(tmpdir.join("pair.tsv.gz")), "rt") as handle:
+        assert handle.readlines()[1].startswith("A_vs_B\tG3")
@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+from scipy.stats import t as t_distribution
+
+from edgePy.DGEList import DGEList
+from edgePy.data_import.ensembl.annotation_store import MultiReleaseDataStore
+from edgePy.gene_sets import GeneSetIndex, camera, fry, read_gmt
+
+GENES = [f"ENSG{number:05d}" for number in range(1000)]
+
+
+class Annotation(object):
+    def __init__(self):
+        self.gene_to_symbol = {gene: f"SYM{number}" for number, gene in enumerate(GENES)}
+        self.symbol_to_genes = {symbol: [gene] for gene, symbol in self.gene_to_symbol.items()}
+
+    def get_genes_from_symbol(self, symbol):
+        return self.symbol_to_genes.get(symbol, [])
+
+    def get_symbol_from_gene(self, gene):
+        return self.gene_to_symbol[gene]
+
+    def is_known_gene(self, gene):
+        return gene in self.gene_to_symbol
+
+
+@pytest.fixture
+def gene_sets():
+    return {
+        "shifted": GENES[:50],
+        "null": GENES[500:560],
+        "symbols": [f"SYM{number}" for number in range(100, 120)] + ["UNKNOWN"],
+        "tiny": ["ENSG00001", "UNKNOWN"],
+    }
+
+
+@pytest.fixture
+def dge_list():
+    rng = np.random.default_rng(0)
+    groups = np.repeat([0, 1], 6)
+    mu = rng.gamma(2, 100, 1000)[:, np.newaxis] * np.ones(12)
+    mu[:50, groups == 1] *= 3
+    return DGEList(
+        counts=rng.poisson(mu),
+        samples=[f"S{number}" for number in range(12)],
+        genes=GENES,
+        groups_in_list=[f"group{number}" for number in groups],
+    )
+
+
+def test_read_gmt(tmpdir):
+    path = tmpdir.join("sets.gmt")
+    path.write("SET1\tdescription\tA\tB\nSET2\t\tC\t\n")
+    assert read_gmt(str(path)) == {"SET1": ["A", "B"], "SET2": ["C"]}
+
+
+def test_index(gene_sets, tmpdir):
+    index = GeneSetIndex(GENES, gene_sets, min_size=2)
+    assert list(index.names) == ["shifted", "null"]
+    assert list(index.sizes) == [50, 60]
+    assert index.matrix.shape == (1000, 2)
+    assert np.allclose(index.set_means(np.arange(1000.0)), [24.5, 529.5])
+
+    index = GeneSetIndex(GENES, gene_sets, annotation=Annotation(), min_size=2)
+    assert list(index.names) == ["shifted", "null", "symbols"]
+    assert index.sizes[2] == 20
+    assert sorted(index.matrix[:, 2].nonzero()[0]) == list(range(100, 120))
+
+    # Symbols and gene ids are translated with a release of a MultiReleaseDataStore too.
+    transcripts = tmpdir.join("transcripts.tsv")
+    transcripts.write("".join(f"{GENES[n]}\tENST{n:05d}\t100\tTrue\n" for n in range(100, 120)))
+    symbols = tmpdir.join("symbols.tsv")
+    symbols.write("".join(f"SYM{n}\t{GENES[n]}\n" for n in range(100, 120)))
+    release = MultiReleaseDataStore().add_release("r1", str(transcripts), str(symbols))
+    index = GeneSetIndex(GENES, gene_sets, annotation=release, min_size=2)
+    assert sorted(index.matrix[:, 2].nonzero()[0]) == list(range(100, 120))
+    index = GeneSetIndex([f"SYM{n}" for n in range(100, 120)], {"ids": GENES[100:105]})
+    assert list(index.sizes) == []
+    index = GeneSetIndex(
+        [f"SYM{n}" for n in range(100, 120)], {"ids": GENES[100:105]}, annotation=release
+    )
+    assert list(index.sizes) == [5]
+
+    # Duplicated members count once.
+    index = GeneSetIndex(GENES, {"twice": GENES[:3] + GENES[:2]})
+    assert list(index.sizes) == [3]
+
+
+def test_camera(gene_sets):
+    rng = np.random.default_rng(1)
+    z = rng.normal(size=1000)
+    z[:50] += 1
+    index = GeneSetIndex(GENES, gene_sets, min_size=2)
+    table = camera(z, index)
+    assert table.name[0] == "shifted"
+    assert table.direction[0] == "up"
+    assert table.p_value[0] < 1e-6
+
+    # The same statistic, one set at a time, as limma's camera with a preset correlation.
+    for row in table:
+        members = np.isin(GENES, gene_sets[row.name])
+        size, genes = members.sum(), len(z)
+        delta = z[members].mean() - z[~members].mean()
+        pooled = (
+            (size - 1) * z[members].var(ddof=1) + (genes - size - 1) * z[~members].var(ddof=1)
+        ) / (genes - 2)
+        inflation = 1 + (size - 1) * 0.01
+        statistic = delta / np.sqrt(pooled * (inflation / size + 1 / (genes - size)))
+        assert np.isclose(row.statistic, statistic)
+        assert np.isclose(row.p_value, 2 * t_distribution.sf(abs(statistic), genes - 2))
+
+    with pytest.raises(ValueError):
+        camera(z[:10], index)
+
+
+def test_camera_t_statistics(gene_sets):
+    rng = np.random.default_rng(2)
+    t = rng.standard_t(5, size=1000)
+    index = GeneSetIndex(GENES, gene_sets, min_size=2)
+    table = camera(t, index, df=5)
+    assert np.all(table.p_value > 0.001)
+
+
+def test_fry(dge_list, gene_sets):
+    # Scale the libraries by the unchanged genes, so the others don't appear to go down.
+    counts = np.asarray(dge_list.counts)
+    dge_list.norm_factors = counts[50:].sum(axis=0) / counts.sum(axis=0)
+    index = GeneSetIndex(dge_list.genes, gene_sets, min_size=2)
+    table = fry(dge_list, "group0", "group1", index)
+    assert table.name[0] == "shifted"
+    assert table.direction[0] == "up"
+    assert table.p_value[0] < 1e-4
+    assert table.p_value[table.name == "null"][0] > 0.01
+
+    reverse = fry(dge_list, "group1", "group0", index)
+    assert reverse.direction[0] == "down"
+    assert np.isclose(reverse.statistic[0], table.statistic[0])
+
+    with pytest.raises(KeyError):
+        fry(dge_list, "group0", "group2", index)
+    with pytest.raises(ValueError):
+        fry(dge_list, "group0", "group1", GeneSetIndex(GENES[:10], gene_sets))
+
+
+def test_fry_null_calibration():
+    """Without any change between the groups, about 5% of sets are significant at 0.05."""
+    genes = [f"G{number}" for number in range(3000)]
+    gene_sets = {f"set{number}": genes[number * 20 : number * 20 + 20] for number in range(150)}
+    significant = []
+    for seed in range(30):
+        rng = np.random.default_rng(seed)
+        mu = rng.gamma(1.5, 100, 3000)[:, np.newaxis] * np.ones(10)
+        dge_list = DGEList(
+            counts=rng.poisson(rng.gamma(10, mu / 10)),
+            samples=[f"S{number}" for number in range(10)],
+            genes=genes,
+            groups_in_list=["group0"] * 5 + ["group1"] * 5,
+        )
+        index = GeneSetIndex(dge_list.genes, gene_sets)
+        significant.append(fry(dge_list, "group0", "group1", index).p_value < 0.05)
+    # Standardizing by each gene's own residual SD gives about 8%.
+    assert 0.035 < np.mean(significant) < 0.065
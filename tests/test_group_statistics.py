@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scipy.stats import ttest_ind
+
+from edgePy.DGEList import DGEList
+from edgePy.group_statistics import GroupStatistics
+
+
+def make_dge_list(counts, groups):
+    return DGEList(
+        counts=counts,
+        samples=[f"S{number}" for number in range(counts.shape[1])],
+        genes=[f"G{number}" for number in range(counts.shape[0])],
+        groups_in_list=groups,
+    )
+
+
+def test_group_statistics():
+    counts = np.random.default_rng(0).poisson(20, size=(30, 6))
+    statistics = GroupStatistics.from_dge_list(make_dge_list(counts, list("AAABBB")))
+    assert statistics.groups == ["A", "B"]
+    assert np.allclose(statistics.sum("A"), counts[:, :3].sum(axis=1))
+    assert np.allclose(statistics.variance("B"), counts[:, 3:].var(axis=1, ddof=1))
+    assert statistics.library_sizes["S4"] == counts[:, 4].sum()
+
+    t, p_value = statistics.welch_t("A", "B")
+    expected = ttest_ind(counts[:, 3:], counts[:, :3], axis=1, equal_var=False)
+    assert np.allclose(t, expected.statistic)
+    assert np.allclose(p_value, expected.pvalue)
+
+    with pytest.raises(KeyError):
+        statistics.mean("C")
+    with pytest.raises(ValueError):
+        statistics.add(counts[:, :1], ["S1"], ["A"])
+
+
+def test_append_and_remove_samples():
+    counts = np.random.default_rng(1).poisson(50, size=(40, 9)).astype(np.float64)
+    groups = list("AABBABCAB")
+    dge_list = make_dge_list(counts[:, :6], groups[:6])
+    dge_list.group_statistics
+
+    appended = dge_list.append_samples(counts[:, 6:], ["S6", "S7", "S8"], groups[6:])
+    assert appended.samples.tolist() == [f"S{number}" for number in range(9)]
+    assert "group_statistics" in appended._cache
+    full = GroupStatistics.from_dge_list(make_dge_list(counts, groups))
+    for group in "ABC":
+        assert appended.group_statistics.n(group) == full.n(group)
+        assert np.allclose(appended.group_statistics.mean(group), full.mean(group))
+        variance = appended.group_statistics.variance(group, ddof=0)
+        assert np.allclose(variance, full.variance(group, ddof=0))
+
+    removed = appended.remove_samples(["S2", "S6"])
+    assert removed.samples.tolist() == ["S0", "S1", "S3", "S4", "S5", "S7", "S8"]
+    assert removed.group_statistics.groups == ["A", "B"]
+    recomputed = GroupStatistics.from_dge_list(removed.copy())
+    for group in "AB":
+        assert np.allclose(removed.group_statistics.variance(group), recomputed.variance(group))
+
+    with pytest.raises(ValueError):
+        dge_list.append_samples(counts[:, :1], ["S0"], ["A"])
+
+    dge_list.current_data_format = "cpm"
+    appended = dge_list.append_samples(counts[:, 6:], ["S6", "S7", "S8"], groups[6:])
+    assert "group_statistics" not in appended._cache
+    with pytest.raises(ValueError):
+        appended.group_statistics
+
+
+def test_log2_cpm_prior():
+    counts = np.random.default_rng(2).poisson(20, size=(30, 4))
+    statistics = GroupStatistics.from_dge_list(
+        make_dge_list(counts, list("AABB")), value_type="log2_cpm_prior", prior_count=1
+    )
+    values = np.log2(counts / counts.sum(axis=0) * 1e6 + 1)
+    assert np.allclose(statistics.mean("A"), values[:, :2].mean(axis=1))
+
+    with pytest.raises(ValueError):
+        GroupStatistics(30, value_type="log_cpm")
@@ -0,0 +1,46 @@
+"""
+Checks that the heavy dependencies are only imported when they're used, so that short jobs don't
+spend their time importing.  Each check runs in a new interpreter, with -X importtime, and fails
+if any of the modules it shouldn't need were imported.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["smart_open", "scipy", "pymongo", "pymysql", "boto3"]
+
+
+def imported_modules(statement):
+    """Run a statement in a new interpreter, and return the modules it imported."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "scripts")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+
+
+@pytest.mark.parametrize(
+    "statement, unwanted",
+    [
+        ("import edgePy", HEAVY_MODULES + ["numpy", "edgePy.DGEList"]),
+        ("from edgePy import DGEList", HEAVY_MODULES),
+        ("import edgepy", HEAVY_MODULES),
+    ],
+)
+def test_lazy_imports(statement, unwanted):
+    modules = imported_modules(statement)
+    assert not [module for module in unwanted if module in modules]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from edgePy.DGEList import DGEList
+from edgePy.mds import mds, pca
+
+
+@pytest.fixture
+def dge_list():
+    rng = np.random.default_rng(0)
+    groups = np.repeat([0, 1, 2], 10)
+    changes = np.exp(rng.normal(0, 1, (1000, 3)) * (rng.random((1000, 1)) < 0.1))
+    mu = rng.gamma(1, 100, 1000)[:, np.newaxis] * changes[:, groups]
+    return DGEList(
+        counts=rng.poisson(mu),
+        samples=[f"S{number}" for number in range(30)],
+        genes=[f"G{number}" for number in range(1000)],
+        groups_in_list=[f"group{number}" for number in groups],
+    )
+
+
+def log_cpm(dge_list):
+    return np.log2(dge_list.counts / dge_list.library_size * 1e6 + 2)
+
+
+def test_pca(dge_list):
+    result = pca(dge_list, top=100)
+    values = log_cpm(dge_list)
+    variances = values.var(axis=1)
+    assert set(result.genes) == set(dge_list.genes[np.argsort(-variances)[:100]])
+
+    top = values[np.argsort(-variances)[:100]]
+    top -= top.mean(axis=1, keepdims=True)
+    _, singular_values, vt = np.linalg.svd(top, full_matrices=False)
+    assert np.allclose(np.abs(result.coordinates), np.abs(vt[:2].T * singular_values[:2]))
+    assert np.allclose(result.variance_explained, singular_values[:2] ** 2 / (top ** 2).sum())
+
+    for method in ("gram", "randomized"):
+        other = pca(dge_list, top=100, method=method)
+        assert np.allclose(other.coordinates, result.coordinates)
+    # The samples of each group end up together.
+    spread = [result.coordinates[group * 10 : group * 10 + 10].std(axis=0) for group in range(3)]
+    assert np.max(spread) < result.coordinates.std(axis=0).min()
+
+
+def classical_scaling(squared_distances):
+    samples = len(squared_distances)
+    centring = np.eye(samples) - 1 / samples
+    eigenvalues, vectors = np.linalg.eigh(-centring @ squared_distances @ centring / 2)
+    return vectors[:, ::-1][:, :2] * np.sqrt(eigenvalues[::-1][:2])
+
+
+def test_mds(dge_list):
+    values = log_cpm(dge_list)
+    samples = range(values.shape[1])
+
+    pairwise = mds(dge_list, top=50, gene_selection="pairwise")
+    squared = np.array(
+        [
+            [np.sort((values[:, i] - values[:, j]) ** 2)[-50:].mean() for j in samples]
+            for i in samples
+        ]
+    )
+    assert np.allclose(np.abs(pairwise.coordinates), np.abs(classical_scaling(squared)))
+
+    common = mds(dge_list, top=50)
+    top = values[dge_list.gene_index.get_indexer(common.genes)]
+    squared = ((top[:, :, np.newaxis] - top[:, np.newaxis, :]) ** 2).mean(axis=0)
+    assert np.allclose(np.abs(common.coordinates), np.abs(classical_scaling(squared)))
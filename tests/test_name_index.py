@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from edgePy.DGEList import DGEList
+from edgePy.name_index import NameIndex
+
+
+def test_name_index_lookups():
+    index = NameIndex(["ENSG001", "ENSG002", "ENSG003", "ENSG002"])
+    assert len(index) == 4
+    assert index.get_loc("ENSG003") == 2
+    # repeated names resolve to their first position
+    assert index.get_loc("ENSG002") == 1
+    assert not index.is_unique
+    assert "ENSG001" in index
+    assert "ENSG009" not in index
+    assert np.array_equal(index.get_indexer(["ENSG003", "ENSG009", "ENSG001"]), [2, -1, 0])
+    with pytest.raises(KeyError):
+        index.get_loc("ENSG009")
+
+
+def test_name_index_values_are_read_only():
+    index = NameIndex(["A", "B"])
+    assert index.values.dtype == object
+    with pytest.raises(ValueError):
+        index.values[0] = "C"
+
+
+def test_name_index_take():
+    index = NameIndex(["A", "B", "C", "D"])
+    assert list(index.take(slice(1, 3))) == ["B", "C"]
+    assert list(index.take(np.array([True, False, False, True]))) == ["A", "D"]
+    taken = index.take(np.array([3, 0]))
+    assert taken.get_loc("A") == 1
+    assert taken == NameIndex(["D", "A"])
+
+
+def test_dge_list_uses_name_index():
+    dge_list = DGEList(
+        counts=np.arange(12).reshape(4, 3),
+        samples=["S1", "S2", "S3"],
+        genes=["ENSG001", "__no_feature", "ENSG003", "ambiguous"],
+        groups_in_list=["A", "A", "B"],
+    )
+    assert isinstance(dge_list.gene_index, NameIndex)
+    assert np.array_equal(dge_list.genes, np.array(["ENSG001", "ENSG003"]))
+    assert dge_list.gene_index.get_loc("ENSG003") == 1
+    assert np.array_equal(dge_list.counts, [[0, 1, 2], [6, 7, 8]])
+    assert dge_list.sample_index.get_loc("S2") == 1
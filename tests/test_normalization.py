@@ -0,0 +1,39 @@
+import numpy as np
+from scipy.stats import rankdata
+
+from edgePy.DGEList import DGEList
+from edgePy.normalization import quantile_normalize, rank_transform
+
+
+def test_quantile_normalize():
+    counts = np.random.default_rng(0).poisson(3, size=(200, 13))
+    normalized = quantile_normalize(counts)
+    # Ties within a sample stay tied.
+    for column in range(counts.shape[1]):
+        for value in np.unique(counts[:, column]):
+            assert len(np.unique(normalized[counts[:, column] == value, column])) == 1
+    assert np.allclose(normalized.mean(axis=0), counts.mean())
+    assert np.allclose(quantile_normalize(counts, chunk_size=4), normalized)
+
+    values = np.random.default_rng(1).random((100, 7))
+    reference = np.sort(values, axis=0).mean(axis=1)
+    assert np.allclose(np.sort(quantile_normalize(values), axis=0), reference[:, np.newaxis])
+
+
+def test_rank_transform():
+    counts = np.random.default_rng(2).poisson(3, size=(50, 5))
+    assert np.array_equal(rank_transform(counts), rankdata(counts, axis=0))
+
+    dge_list = DGEList(
+        counts=counts,
+        samples=["A1", "A2", "A3", "B1", "B2"],
+        genes=[f"G{number}" for number in range(50)],
+        groups_in_list=["A", "A", "A", "B", "B"],
+    )
+    assert dge_list.rank_transform().current_data_format == "rank"
+    assert np.array_equal(dge_list.quantile_normalize().counts, quantile_normalize(counts))
+
+    log_cpm = dge_list.cpm(transform_to_log=True).quantile_normalize()
+    assert log_cpm.current_log_status
+    assert log_cpm.current_data_format == "quantile"
+    assert (log_cpm.counts < 0).any()
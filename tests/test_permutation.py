@@ -0,0 +1,66 @@
+from itertools import combinations
+
+import pytest
+import numpy as np
+
+from edgePy.DGEList import DGEList
+from edgePy.permutation import PermutationTest
+
+
+def two_group_dge_list():
+    rng = np.random.RandomState(3)
+    counts = np.hstack([rng.poisson(50, (20, 4)), rng.poisson(90, (20, 4))])
+    counts[:10, 4:] = rng.poisson(50, (10, 4))
+    return DGEList(
+        counts=counts,
+        samples=[f"S{i}" for i in range(8)],
+        genes=[f"G{i}" for i in range(20)],
+        groups_in_list=list("AAAABBBB"),
+    )
+
+
+def exact_p_values(test):
+    """Enumerate all 70 labellings of 8 samples into two groups of 4."""
+    observed = np.abs(test.observed())
+    exceed = np.zeros(len(observed))
+    for group1 in combinations(range(8), 4):
+        labels = np.zeros(8, dtype=np.int8)
+        labels[list(group1)] = 1
+        permuted = PermutationTest.__new__(PermutationTest)
+        permuted.__dict__.update(test.__dict__, labels=labels)
+        exceed += np.abs(permuted.observed()) >= observed * (1 - 1e-9)
+    return exceed / 70
+
+
+@pytest.mark.parametrize("statistic", ["mean_difference", "t"])
+def test_permutation_p_values(statistic):
+    test = PermutationTest(two_group_dge_list(), "A", "B", statistic=statistic, seed=1)
+    table = test.run(n_permutations=40000, stop_after=None)
+    assert (table.permutations == 40000).all()
+    assert np.allclose(table.p_value, exact_p_values(test), atol=0.01)
+
+
+def test_early_stopping_and_seeds():
+    dge_list = two_group_dge_list()
+    table = PermutationTest(dge_list, "A", "B", batch_size=200, seed=5).run(20000, stop_after=10)
+    # Every labelling is 1 of 70, so no gene can avoid 10 exceedances in 1600 permutations.
+    assert (table.permutations == 1600).all()
+    assert (table.exceedances >= 10).all()
+    assert np.allclose(table.p_value, table.exceedances / 1600)
+
+    # Genes reaching stop_after in the last round ran every permutation, so aren't estimated
+    # sequentially.
+    table = PermutationTest(dge_list, "A", "B", batch_size=200, seed=5).run(1600, stop_after=10)
+    assert (table.exceedances >= 10).all()
+    assert np.allclose(table.p_value, (table.exceedances + 1) / 1601)
+
+    in_process = PermutationTest(dge_list, "A", "B", batch_size=50, seed=5).run(2000, None)
+    in_workers = PermutationTest(dge_list, "A", "B", batch_size=50, seed=5, processes=2).run(
+        2000, None
+    )
+    assert np.array_equal(in_process.p_value, in_workers.p_value)
+
+    with pytest.raises(KeyError):
+        PermutationTest(dge_list, "A", "C")
+    with pytest.raises(ValueError):
+        PermutationTest(dge_list, "A", "B", statistic="median")
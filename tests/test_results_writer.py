@@ -0,0 +1,65 @@
+import gzip
+
+import pytest
+import numpy as np
+
+from edgePy.results_writer import (
+    LogResultsWriter,
+    NpzResultsWriter,
+    TextResultsWriter,
+    format_rows,
+    open_results_writer,
+)
+from edgePy.top_table import TOP_TABLE_DTYPE
+
+
+def results_table(rows=25):
+    table = np.recarray(rows, dtype=TOP_TABLE_DTYPE)
+    table.gene = [f"G{i}" for i in range(rows)]
+    table.symbol = [f"S{i}" for i in range(rows)]
+    for field in ("logFC", "logCPM", "mean1", "mean2", "p_value", "adj_p"):
+        table[field] = np.arange(rows) / 8
+    return table
+
+
+def test_format_rows():
+    lines = format_rows(results_table(2), ["gene", "mean1", "p_value"])
+    assert lines == ["G0\t0.00\t0\n", "G1\t0.12\t0.125\n"]
+
+
+def test_text_writer(tmpdir):
+    table = results_table()
+    for filename in (str(tmpdir.join("results.tsv")), str(tmpdir.join("results.tsv.gz"))):
+        with open_results_writer(filename, ["gene", "p_value"], header=["id", "p"]) as writer:
+            assert isinstance(writer, TextResultsWriter)
+            writer.chunk_size = 10
+            writer.write(table)
+            writer.write(table[:2])
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(filename, "rt") as handle:
+            lines = handle.readlines()
+        assert lines[0] == "id\tp\n"
+        assert lines[1] == "G0\t0\n"
+        assert len(lines) == 28
+        assert writer.rows_written == 27
+
+
+def test_npz_writer(tmpdir):
+    filename = str(tmpdir.join("results.npz"))
+    with open_results_writer(filename, ["gene", "p_value"], chunk_size=10) as writer:
+        assert isinstance(writer, NpzResultsWriter)
+        writer.write(results_table())
+    data = np.load(filename)
+    assert sorted(data.files) == ["gene", "p_value"]
+    assert data["gene"][3] == "G3"
+    assert np.allclose(data["p_value"], np.arange(25) / 8)
+
+
+def test_log_writer_and_errors(tmpdir):
+    with open_results_writer(None, ["gene"]) as writer:
+        assert isinstance(writer, LogResultsWriter)
+        writer.write(results_table(3))
+    with pytest.raises(ValueError):
+        open_results_writer(str(tmpdir.join("results")), ["gene"], output_format="xlsx")
+    with pytest.raises(ValueError):
+        LogResultsWriter(["gene", "symbol"], header=["gene"])
@@ -0,0 +1,87 @@
+import json
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from edgePy.DGEList import DGEList
+from edgePy.server import AnalysisServer
+
+
+@pytest.fixture
+def server():
+    server = AnalysisServer(port=0, max_concurrent=2).start()
+    yield server
+    server.shutdown()
+
+
+def request(server, method, path, body=None):
+    host, port = server.address
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(f"http://{host}:{port}{path}", data=data, method=method)
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def write_dge_list(tmpdir, name="data"):
+    counts = np.array([[10, 12, 11, 40, 42, 45], [5, 6, 5, 5, 6, 5], [30, 33, 31, 3, 2, 4]])
+    DGEList(
+        counts=counts,
+        samples=["A1", "A2", "A3", "B1", "B2", "B3"],
+        genes=["G1", "G2", "G3"],
+        groups_in_list=["A", "A", "A", "B", "B", "B"],
+    ).write_npz_file(str(tmpdir.join(name)))
+    return str(tmpdir.join(name + ".npz"))
+
+
+def test_server(tmpdir, server):
+    dge_file = write_dge_list(tmpdir)
+    status, dataset = request(server, "POST", "/datasets", {"name": "data", "dge_file": dge_file})
+    assert status == 200
+    assert dataset["genes"] == 3
+    assert dataset["groups"] == {"A": ["A1", "A2", "A3"], "B": ["B1", "B2", "B3"]}
+
+    status, normalized = request(
+        server, "POST", "/datasets/data/normalize", {"genes": ["G2"], "method": "cpm"}
+    )
+    assert status == 200
+    assert normalized["genes"] == ["G2"]
+    assert np.allclose(normalized["values"][0][0], 5e6 / 45)
+
+    status, results = request(
+        server, "POST", "/datasets/data/de", {"contrasts": [["A", "B"]], "cutoff": 0.2}
+    )
+    assert status == 200
+    rows = results["results"]["B_vs_A"]
+    assert sorted(row["gene"] for row in rows) == ["G1", "G3"]
+    assert all(row["p_value"] < 0.2 for row in rows)
+
+    status, subset = request(
+        server, "POST", "/datasets/data/subset", {"name": "a_only", "groups": ["A"]}
+    )
+    assert status == 200
+    assert subset["samples"] == ["A1", "A2", "A3"]
+
+    status, listing = request(server, "GET", "/datasets")
+    assert sorted(dataset["name"] for dataset in listing["datasets"]) == ["a_only", "data"]
+
+    assert request(server, "DELETE", "/datasets/a_only")[0] == 200
+    assert request(server, "GET", "/datasets/a_only")[0] == 404
+    assert request(server, "POST", "/datasets/data/normalize", {"method": "tmm"})[0] == 400
+    assert request(server, "GET", "/nowhere")[0] == 404
+
+
+def test_server_eviction(tmpdir):
+    dge_file = write_dge_list(tmpdir)
+    # Room for one dataset of 18 int64 counts.
+    server = AnalysisServer(port=0, max_memory=200).start()
+    try:
+        request(server, "POST", "/datasets", {"name": "first", "dge_file": dge_file})
+        request(server, "POST", "/datasets", {"name": "second", "dge_file": dge_file})
+        assert server.datasets.names() == ["second"]
+    finally:
+        server.shutdown()
@@ -0,0 +1,41 @@
+import pytest
+import numpy as np
+
+from edgePy.DGEList import DGEList
+from edgePy.top_table import p_adjust, make_top_table, filter_top_table, top_genes
+
+
+def test_p_adjust():
+    # Expected values from R's p.adjust
+    p = [0.01, 0.04, 0.03, 0.005, np.nan]
+    assert np.allclose(p_adjust(p, "BH")[:4], [0.02, 0.04, 0.04, 0.02])
+    assert np.allclose(p_adjust(p, "holm")[:4], [0.03, 0.06, 0.06, 0.02])
+    assert np.isnan(p_adjust(p)[4])
+    assert np.allclose(p_adjust([0.9, 0.8], "holm"), [1.0, 1.0])
+    with pytest.raises(ValueError):
+        p_adjust(p, "bonferonni")
+
+
+def test_top_table():
+    dge_list = DGEList(
+        counts=np.array([[10, 10, 40, 40], [5, 5, 5, 5], [20, 20, 0, 0], [0, 0, 0, 2]]),
+        samples=["A1", "A2", "B1", "B2"],
+        genes=["G1", "G2", "G3", "G4"],
+        groups_in_list=["A", "A", "B", "B"],
+    )
+    table = make_top_table(dge_list, [0.01, 0.9, 0.02, 0.2], "A", "B", symbols=list("abcd"))
+    assert list(table.symbol) == ["a", "b", "c", "d"]
+    assert np.allclose(table.mean2, [40, 5, 0, 1])
+    assert table.logFC[0] == pytest.approx(np.log2(40.25 / 10.25))
+    assert np.allclose(table.adj_p, [0.04, 0.9, 0.04, 0.266666667])
+
+    assert list(filter_top_table(table, p_value_cutoff=0.05).gene) == ["G1", "G3"]
+    assert list(filter_top_table(table, direction="up").gene) == ["G1", "G4"]
+    assert list(filter_top_table(table, direction="down").gene) == ["G3"]
+    assert list(filter_top_table(table, minimum_mean=2).gene) == ["G1", "G2", "G3"]
+    with pytest.raises(ValueError):
+        filter_top_table(table, direction="sideways")
+
+    assert list(top_genes(table).gene) == ["G1", "G3", "G4", "G2"]
+    assert list(top_genes(table, 2).gene) == ["G1", "G3"]
+    assert list(top_genes(table, 1, sort_by="logFC").gene) == ["G3"]
@@ -0,0 +1,58 @@
+import numpy as np
+
+from edgePy.DGEList import DGEList
+from edgePy.voom import binned_lowess, voom
+
+
+def test_binned_lowess():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 10, 500)
+    y = np.sin(x) + rng.normal(0, 0.3, 500)
+    grid, smoothed = binned_lowess(x, y, span=0.3, iterations=0)
+
+    # Against a direct local linear fit at each point.
+    k = int(np.ceil(0.3 * len(x)))
+    for point, value in zip(grid[::20], smoothed[::20]):
+        distance = np.abs(x - point)
+        nearest = np.argsort(distance)[:k]
+        weights = (1 - (distance[nearest] / distance[nearest].max()) ** 3) ** 3
+        local = np.column_stack([np.ones(k), x[nearest] - point]) * np.sqrt(weights)[:, None]
+        fit = np.linalg.lstsq(local, y[nearest] * np.sqrt(weights), rcond=None)[0]
+        assert np.isclose(fit[0], value)
+
+    # Robust refits resist outliers.
+    y[::25] += 5
+    _, plain = binned_lowess(x, y, span=0.3, iterations=0)
+    _, robust = binned_lowess(x, y, span=0.3)
+    assert np.abs(robust - smoothed).mean() < np.abs(plain - smoothed).mean() / 4
+
+
+def test_voom():
+    rng = np.random.default_rng(1)
+    mu = rng.gamma(0.6, 200, size=300)[:, np.newaxis] * rng.uniform(0.5, 2, size=8)
+    counts = rng.negative_binomial(10, 10 / (10 + mu))
+    dge_list = DGEList(
+        counts=counts,
+        samples=[f"S{number}" for number in range(8)],
+        genes=[f"G{number}" for number in range(300)],
+        groups_in_list=["A"] * 4 + ["B"] * 4,
+        norm_factors=np.linspace(0.9, 1.1, 8),
+    )
+    result = dge_list.voom()
+
+    library_size = counts.sum(axis=0) * np.linspace(0.9, 1.1, 8)
+    log_cpm = np.log2((counts + 0.5) / (library_size + 1) * 1e6)
+    assert np.allclose(result.log_cpm, log_cpm)
+
+    design = result.design
+    coefficients, residual_ss = np.linalg.lstsq(design, log_cpm.T, rcond=None)[:2]
+    sigma = np.sqrt(residual_ss / (8 - 2))
+    average = log_cpm.mean(axis=1) + np.log2(library_size + 1).mean() - np.log2(1e6)
+    expressed = counts.any(axis=1)
+    trend = binned_lowess(average[expressed], np.sqrt(sigma[expressed]), span=0.5)
+    fitted = (design @ coefficients).T + np.log2(library_size + 1) - np.log2(1e6)
+    assert np.allclose(result.weights, np.interp(fitted, *trend) ** -4)
+
+    # Noisier low counts get lower weights.
+    low = mu.mean(axis=1) < np.percentile(mu.mean(axis=1), 20)
+    assert result.weights[low].mean() < result.weights[~low].mean()